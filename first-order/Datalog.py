@@ -0,0 +1,267 @@
+from LogicSimplifier import *
+
+class Relation:
+    '''
+    The tuples of constants (names) known for one predicate, each with the
+    round of evaluation in which it was derived. Hash indexes on sets of
+    argument positions are built the first time a join asks for them and
+    kept up to date afterwards.
+    '''
+    def __init__(self, arity):
+        self.arity = arity
+        self.rounds = {}
+        ## round -> tuples derived in it
+        self.by_round = {}
+        ## argument positions -> values at those positions -> tuples
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def __contains__(self, row):
+        return row in self.rounds
+
+    def add(self, row, round):
+        ''' Adds a tuple; returns False if it was already known. '''
+        if row in self.rounds:
+            return False
+        self.rounds[row] = round
+        self.by_round.setdefault(round, []).append(row)
+        for positions, index in self.indexes.items():
+            index.setdefault(tuple(row[p] for p in positions), []).append(row)
+        return True
+
+    def lookup(self, positions, key):
+        ''' The tuples with the values key at the argument positions. '''
+        if positions == ():
+            return list(self.rounds)
+        if positions not in self.indexes:
+            index = {}
+            for row in self.rounds:
+                index.setdefault(tuple(row[p] for p in positions), []).append(row)
+            self.indexes[positions] = index
+        return self.indexes[positions].get(key, [])
+
+class Datalog:
+    '''
+    Bottom-up evaluation of function-free Horn rules, e.g.
+    all x. (Man(x) -> Mortal(x)), over facts like Man(Socrates): all
+    facts that follow are computed ("materialized") when something is
+    told, so that queries are lookups in the relations.
+
+    Evaluation is semi-naive. Every derived fact is stamped with the round
+    in which it was found, and a rule only fires in round r for bindings
+    that use at least one fact of round r. The body literals are joined
+    one at a time, the one with the fewest matching tuples first, through
+    hash indexes of the relations. Telling a new fact or rule continues
+    the evaluation from the current state instead of starting over.
+    Example usage:
+
+    >>> db = Datalog()
+    >>> db.tell('all x. (Man(x) -> Mortal(x))')
+    >>> db.tell('Man(Socrates)')
+    >>> db.ask('Mortal(Socrates)')
+    True
+    >>> db.answers('exists x. Mortal(x)')
+    [('Socrates',)]
+    '''
+    def __init__(self):
+        self.parser = LogicParser()
+        self.simplifier = LogicSimplifier()
+        ## (predicate, arity) -> Relation
+        self.relations = {}
+        ## (predicate, arity) -> [(rule, body position)]
+        self.rules = {}
+        self.round = 0
+
+    def parse(self, expr):
+        if isinstance(expr, str):
+            return self.parser.parse(expr)
+        return expr
+
+    def relation(self, name, arity):
+        key = (name, arity)
+        if key not in self.relations:
+            self.relations[key] = Relation(arity)
+        return self.relations[key]
+
+    def literal(self, atom):
+        '''
+        Compiles an atom into (relation key, arguments), each argument
+        ('var', name) or ('const', name). Function symbols are refused.
+        '''
+        args = []
+        for arg in atom.args:
+            if isinstance(arg, Variable):
+                args.append(('var', arg.op))
+            elif arg.args == () and not arg.op.startswith('$'):
+                args.append(('const', arg.op))
+            else:
+                raise Exception("Error: function symbols are not allowed in Datalog")
+        return ((atom.op, len(atom.args)), tuple(args))
+
+    def tell(self, expr):
+        '''
+        Adds facts or rules (a formula whose clauses are function-free Horn
+        clauses with exactly one positive literal and no variables in the
+        head that are not in the body) and brings the relations up to date.
+        '''
+        rules = []
+        for clause in self.simplifier.to_clauses(self.parse(expr)):
+            heads = [literal for literal in clause if literal.op != 'not']
+            if len(heads) != 1:
+                raise Exception("Error: not a Horn clause with one positive literal: %s" % (clause,))
+            head = self.literal(heads[0])
+            body = [self.literal(literal.args[0]) for literal in clause if literal.op == 'not']
+            bound = set(name for key, args in body for kind, name in args if kind == 'var')
+            if any(kind == 'var' and name not in bound for kind, name in head[1]):
+                raise Exception("Error: head variable not in the body: %s" % (clause,))
+            rules.append((head, body))
+        for head, body in rules:
+            if body == []:
+                self.relation(*head[0]).add(tuple(name for kind, name in head[1]), self.round + 1)
+                continue
+            rule = (head, body)
+            for position, (key, args) in enumerate(body):
+                self.relation(*key)
+                self.rules.setdefault(key, []).append((rule, position))
+            self.relation(*head[0])
+            ## a new rule first fires on everything known so far
+            for bindings in self.join(body, {}, None):
+                self.derive(head, bindings)
+        self.evaluate()
+
+    def derive(self, head, bindings):
+        key, args = head
+        row = tuple(bindings[name] if kind == 'var' else name for kind, name in args)
+        return self.relations[key].add(row, self.round + 1)
+
+    def evaluate(self):
+        '''
+        Runs semi-naive rounds until no new facts appear. The facts of
+        round r are the delta; in a rule with one of them at body position
+        i, literals before i only match older facts and literals after i
+        facts up to round r, so each binding is found once.
+        '''
+        while True:
+            self.round += 1
+            delta = False
+            for key, relation in self.relations.items():
+                new = relation.by_round.get(self.round, [])
+                if new == []:
+                    continue
+                delta = True
+                for rule, position in self.rules.get(key, []):
+                    head, body = rule
+                    for row in new:
+                        bindings = self.match(body[position][1], row, {})
+                        if bindings is None:
+                            continue
+                        for complete in self.join(body, bindings, position):
+                            self.derive(head, complete)
+            if not delta:
+                ## nothing was derived in this round
+                self.round -= 1
+                return
+
+    def match(self, args, row, bindings):
+        ''' Extends bindings so that args match the tuple row, or returns None. '''
+        copied = False
+        for (kind, name), value in zip(args, row):
+            if kind == 'const':
+                if name != value:
+                    return None
+                continue
+            known = bindings.get(name)
+            if known is None:
+                if not copied:
+                    bindings = dict(bindings)
+                    copied = True
+                bindings[name] = value
+            elif known != value:
+                return None
+        return bindings
+
+    def join(self, body, bindings, delta):
+        '''
+        Yields the bindings that satisfy all body literals except the one at
+        position delta (already matched), joining the literal with the
+        fewest candidate tuples next. With delta None there are no limits
+        on the rounds of the facts used.
+        '''
+        remaining = [i for i in range(len(body)) if i != delta]
+        stack = [(bindings, remaining)]
+        while stack:
+            bindings, remaining = stack.pop()
+            if remaining == []:
+                yield bindings
+                continue
+            best = None
+            for k, i in enumerate(remaining):
+                key, args = body[i]
+                positions = tuple(p for p, (kind, name) in enumerate(args)
+                                  if kind == 'const' or name in bindings)
+                values = tuple(name if kind == 'const' else bindings[name]
+                               for kind, name in (args[p] for p in positions))
+                rows = self.relations[key].lookup(positions, values)
+                if best is None or len(rows) < len(best[1]):
+                    best = (k, rows, i)
+                    if rows == []:
+                        break
+            k, rows, i = best
+            rest = remaining[:k] + remaining[k+1:]
+            key, args = body[i]
+            rounds = self.relations[key].rounds
+            if delta is None:
+                limit = None
+            else:
+                limit = self.round if i < delta else self.round + 1
+            for row in rows:
+                if limit is not None and rounds[row] >= limit:
+                    continue
+                extended = self.match(args, row, bindings)
+                if extended is not None:
+                    stack.append((extended, rest))
+
+    def query(self, expr):
+        ## (variables, body) of a conjunctive query: existentially
+        ## quantified variables over a conjunction of atoms
+        s = self.parse(expr)
+        names = []
+        while isinstance(s, QuantifiedExpression):
+            if s.op != 'exists':
+                raise Exception("Error: only existential queries are supported")
+            names.append(s.var)
+            s = s.args[0]
+        atoms = []
+        stack = [s]
+        while stack:
+            t = stack.pop()
+            if t.op == 'and':
+                stack.extend(reversed(t.args))
+            elif isinstance(t, Predicate):
+                atoms.append(self.literal(t))
+            else:
+                raise Exception("Error: a query must be a conjunction of atoms")
+        for key, args in atoms:
+            self.relation(*key)
+        return names, atoms
+
+    def ask(self, expr):
+        '''
+        True if the facts and rules entail expr: an atom, or a conjunction
+        of atoms whose variables are existentially quantified.
+        '''
+        names, atoms = self.query(expr)
+        for bindings in self.join(atoms, {}, None):
+            return True
+        return False
+
+    def answers(self, expr):
+        '''
+        Returns the tuples of constants for the existentially quantified
+        variables of a query that make it true, sorted.
+        '''
+        names, atoms = self.query(expr)
+        return sorted(set(tuple(bindings[name] for name in names)
+                          for bindings in self.join(atoms, {}, None)))
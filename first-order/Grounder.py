@@ -0,0 +1,360 @@
+from LogicSimplifier import *
+from Unify import *
+import importlib.util
+import os
+import sys
+
+## the pred KnowledgeBase module, once loaded
+PRED = None
+
+def load_module(name, path):
+    '''
+    Loads the module name from its file in the folder path, registered in
+    sys.modules under name. The file name may differ in case (the pred
+    folder has knowledgebase.py for KnowledgeBase), so it is looked up
+    rather than left to the import system, which on a case-sensitive
+    filesystem would fall back to the module of the same name here.
+    '''
+    for filename in os.listdir(path):
+        if filename.lower() == name.lower() + '.py':
+            spec = importlib.util.spec_from_file_location(name, os.path.join(path, filename))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+            return module
+    raise Exception("Error: no module " + name + " in " + path)
+
+def pred_knowledge_base(path=None):
+    '''
+    Returns a new propositional KnowledgeBase from the pred folder (or path)
+    to ground into. The pred modules share their names with the ones here,
+    so they are loaded from their files on their own (once) and the modules
+    of this folder are put back afterwards; the returned object keeps
+    working regardless.
+    '''
+    global PRED
+    if PRED is None:
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pred')
+        ## in dependency order, so each one imports the pred version of
+        ## the ones before it
+        shared = ['LogicTokenizer', 'LogicParser', 'LogicSimplifier', 'KnowledgeBase']
+        saved = dict((name, sys.modules.pop(name)) for name in shared if name in sys.modules)
+        sys.path.insert(0, path)
+        try:
+            for name in shared:
+                module = load_module(name, path)
+            PRED = module
+        finally:
+            sys.path.remove(path)
+            for name in shared:
+                sys.modules.pop(name, None)
+            sys.modules.update(saved)
+    return PRED.KnowledgeBase()
+
+class Grounder:
+    '''
+    Grounds first-order formulas over a finite domain of constants and
+    streams the ground clauses into a propositional KnowledgeBase (see
+    pred_knowledge_base()), which then answers the queries.
+
+    Naive grounding instantiates every clause with every combination of
+    constants, |domain|^k instances for k variables. Instead, the grounder
+    keeps the set of ground atoms that can possibly be true: the heads of
+    the clauses instantiated so far. A clause such as
+    Parent(x, y) and Ancestor(y, z) -> Ancestor(x, z) is only instantiated
+    for body atoms in that set, found by joining the body literals against
+    an index of the possible atoms, and every new possible atom triggers
+    just the instances it takes part in. An instance with a body atom that
+    cannot be true is satisfied by making that atom false, so leaving it
+    out changes no answer. Only variables that occur in no body literal
+    still range over the whole domain.
+
+    Existential quantifiers are expanded into a disjunction over the
+    domain; universal ones are left to the instantiation. Ground atoms are
+    interned once, as propositional atoms named g1, g2, ... of the
+    KnowledgeBase's AtomIndex; atom() maps them back.
+    Example usage:
+
+    >>> g = Grounder(pred_knowledge_base(), ['ann', 'bob', 'cid'])
+    >>> g.tell('all x. all y. (Parent(x, y) -> Older(x, y))')
+    >>> g.tell('Parent(ann, bob)')
+    >>> g.ask('Older(ann, bob)'), g.ask('Older(bob, cid)')
+    (True, False)
+    '''
+    def __init__(self, kb, domain, batch_size=1000, prefix='g'):
+        self.kb = kb
+        self.domain = []
+        self.constants = set()
+        for constant in domain:
+            if constant not in self.constants:
+                self.constants.add(constant)
+                self.domain.append(Expression(constant))
+        if self.domain == []:
+            raise Exception("Error: the domain is empty")
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.parser = LogicParser()
+        self.simplifier = LogicSimplifier()
+        ## ground atom -> index in kb.atoms, and back
+        self.indices = {}
+        self.ground = {}
+        ## the atoms that can possibly be true, in the order they were
+        ## found, with their position in that order ("age")
+        self.possible = []
+        self.age = {}
+        self.processed = 0
+        ## (predicate, arity) -> possible atoms, and
+        ## (predicate, arity, argument position, argument) -> possible atoms
+        self.by_predicate = {}
+        self.by_argument = {}
+        ## (predicate, arity) -> [(clause, body literal position)]
+        self.rules = {}
+        self.clauses = []
+        self.emitted = set()
+        self.batch = []
+        self.naive = 0
+
+    def parse(self, expr):
+        if isinstance(expr, str):
+            return self.parser.parse(expr)
+        return expr
+
+    def atom(self, n):
+        ''' The ground atom interned as index n of kb.atoms. '''
+        return self.ground[abs(n)]
+
+    def tell(self, expr):
+        '''
+        Adds a formula: grounds it as far as the possible atoms allow, and
+        everything that becomes possible in turn.
+        '''
+        self.check_constants(self.parse(expr))
+        nnf = self.expand(self.simplifier.to_nnf(self.parse(expr)), {})
+        for clause in self.simplifier.nnf_clauses(self.simplifier.skolemize(nnf, (), {})):
+            clause = self.simplifier.rename(clause, {})
+            self.clauses.append(clause)
+            self.naive += len(self.domain) ** len(self.simplifier.variables(Expression('or', *clause)))
+            ## all instances with the atoms known so far, then register the
+            ## clause for the atoms found later
+            for bindings in self.instances(clause, None):
+                self.emit(clause, bindings)
+            for position, literal in enumerate(clause):
+                if literal.op == 'not':
+                    atom = literal.args[0]
+                    self.rules.setdefault((atom.op, len(atom.args)), []).append((clause, position))
+        self.propagate()
+        self.flush()
+
+    def ask(self, expr):
+        '''
+        Grounds a query over the domain and asks the KnowledgeBase. Atoms of
+        the query become possible first, so that the clauses that could
+        decide them are instantiated.
+        '''
+        self.check_constants(self.parse(expr))
+        ground = self.expand_all(self.parse(expr), {})
+        for atom in self.atoms_in(ground):
+            self.make_possible(atom)
+        self.propagate()
+        self.flush()
+        return self.kb.ask(self.to_string(ground))
+
+    def stats(self):
+        '''
+        Returns the number of possible ground atoms, of ground clauses sent
+        to the KnowledgeBase, and of instances naive grounding would make.
+        '''
+        return {'atoms': len(self.possible), 'clauses': len(self.emitted), 'naive': self.naive}
+
+    def check_constants(self, s):
+        stack = [s]
+        while stack:
+            t = stack.pop()
+            if isinstance(t, QuantifiedExpression) or t.op in Logic.OPS or isinstance(t, Predicate):
+                stack.extend(t.args)
+            elif not isinstance(t, Variable) and t.args == () and t.op not in self.constants:
+                raise Exception("Error: constant %s is not in the domain" % t.op)
+            else:
+                stack.extend(t.args)
+
+    def expand(self, s, names):
+        '''
+        Replaces every existential quantifier of a formula in negation
+        normal form by the disjunction of its instances over the domain.
+        '''
+        if isinstance(s, QuantifiedExpression):
+            if s.op == 'forall':
+                inner = dict(names)
+                inner.pop(s.var, None)
+                return QuantifiedExpression('forall', s.var, self.expand(s.args[0], inner))
+            return self.nest('or', [self.expand(s.args[0], dict(names, **{s.var: c}))
+                                       for c in self.domain])
+        if s.op in ['and', 'or', 'not']:
+            return Expression(s.op, *[self.expand(arg, names) for arg in s.args])
+        return self.simplifier.substitute(s, names)
+
+    def expand_all(self, s, names):
+        ''' Replaces both kinds of quantifier by their instances; for queries. '''
+        if isinstance(s, QuantifiedExpression):
+            op = 'and' if s.op == 'forall' else 'or'
+            return self.nest(op, [self.expand_all(s.args[0], dict(names, **{s.var: c}))
+                                     for c in self.domain])
+        if s.op in Logic.OPS:
+            return Expression(s.op, *[self.expand_all(arg, names) for arg in s.args])
+        return self.simplifier.substitute(s, names)
+
+    def nest(self, op, args):
+        ## nested binary and/or, as the parser makes them
+        result = args[0]
+        for arg in args[1:]:
+            result = Expression(op, result, arg)
+        return result
+
+    def atoms_in(self, s):
+        stack = [s]
+        while stack:
+            t = stack.pop()
+            if isinstance(t, Predicate):
+                yield t
+            else:
+                stack.extend(t.args)
+
+    def to_string(self, s):
+        ''' A ground formula in the syntax of the propositional parser. '''
+        if isinstance(s, Predicate):
+            return self.kb.atoms.names[self.intern(s)]
+        if s.op == 'not':
+            return '~(%s)' % self.to_string(s.args[0])
+        return '(%s)' % (' %s ' % s.op).join(self.to_string(arg) for arg in s.args)
+
+    def intern(self, atom):
+        ''' Returns the index of a ground atom in kb.atoms, assigning one if needed. '''
+        n = self.indices.get(atom)
+        if n is None:
+            n = self.kb.atoms.next_index
+            self.kb.atoms.name(n, self.prefix)
+            self.indices[atom] = n
+            self.ground[n] = atom
+        return n
+
+    def make_possible(self, atom):
+        if atom in self.age:
+            return
+        self.age[atom] = len(self.possible)
+        self.possible.append(atom)
+        key = (atom.op, len(atom.args))
+        self.by_predicate.setdefault(key, []).append(atom)
+        for position, arg in enumerate(atom.args):
+            self.by_argument.setdefault(key + (position, arg), []).append(atom)
+
+    def propagate(self):
+        '''
+        Instantiates the registered clauses for every possible atom not
+        processed yet, oldest first. An instance is made when its newest
+        body atom is processed: body literals before the new atom's
+        position must match older atoms, those after it atoms no newer,
+        so every instance is made exactly once.
+        '''
+        while self.processed < len(self.possible):
+            atom = self.possible[self.processed]
+            self.processed += 1
+            for clause, position in self.rules.get((atom.op, len(atom.args)), []):
+                for bindings in self.instances(clause, (position, atom)):
+                    self.emit(clause, bindings)
+
+    def candidates(self, pattern):
+        ''' The possible atoms that may match pattern, from the smallest index list. '''
+        key = (pattern.op, len(pattern.args))
+        best = self.by_predicate.get(key, [])
+        for position, arg in enumerate(pattern.args):
+            if not self.simplifier.variables(arg):
+                found = self.by_argument.get(key + (position, arg), [])
+                if len(found) < len(best):
+                    best = found
+        return best
+
+    def instances(self, clause, delta):
+        '''
+        Yields bindings for all variables of clause under which every body
+        (negative) literal is a possible atom. With delta = (position,
+        atom), the literal at that position is bound to atom, and the others
+        are limited by age as described in propagate().
+        '''
+        body = [(i, literal.args[0]) for i, literal in enumerate(clause) if literal.op == 'not']
+        if delta is None:
+            start = {}
+            limit = len(self.possible)
+        else:
+            start = match(clause[delta[0]].args[0], delta[1])
+            if start is None:
+                return
+            limit = self.age[delta[1]]
+            body = [(i, atom) for i, atom in body if i != delta[0]]
+        stack = [(start, body)]
+        while stack:
+            bindings, remaining = stack.pop()
+            if remaining == []:
+                for complete in self.free_variables(clause, bindings):
+                    yield complete
+                continue
+            ## join the literal with the fewest candidates next
+            best = None
+            for k, (i, atom) in enumerate(remaining):
+                pattern = substitute(atom, bindings)
+                found = self.candidates(pattern)
+                if best is None or len(found) < len(best[2]):
+                    best = (k, pattern, found, i)
+            k, pattern, found, i = best
+            rest = remaining[:k] + remaining[k+1:]
+            if delta is None:
+                bound = limit
+            else:
+                ## strictly older before the new atom's position
+                bound = limit if i < delta[0] else limit + 1
+            for atom in found:
+                if self.age[atom] >= bound:
+                    continue
+                extended = match(pattern, atom, bindings)
+                if extended is not None:
+                    stack.append((extended, rest))
+
+    def free_variables(self, clause, bindings):
+        ''' Extends bindings with every combination of constants for the unbound variables. '''
+        free = [var for var in self.simplifier.variables(Expression('or', *clause))
+                if var not in bindings]
+        stack = [(bindings, 0)]
+        while stack:
+            bindings, k = stack.pop()
+            if k == len(free):
+                yield bindings
+                continue
+            for constant in self.domain:
+                stack.append((dict(bindings, **{free[k]: constant}), k + 1))
+
+    def emit(self, clause, bindings):
+        ints = set()
+        for literal in clause:
+            if literal.op == 'not':
+                ints.add(-self.intern(substitute(literal.args[0], bindings)))
+            else:
+                atom = substitute(literal, bindings)
+                ints.add(self.intern(atom))
+        if any(-n in ints for n in ints):
+            return
+        key = frozenset(ints)
+        if key in self.emitted:
+            return
+        self.emitted.add(key)
+        for n in ints:
+            if n > 0:
+                self.make_possible(self.ground[n])
+        self.batch.append(set(self.kb.atoms.literal(n) for n in ints))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        ''' Sends the buffered ground clauses to the KnowledgeBase. '''
+        if self.batch:
+            self.kb.bulk_insert(self.batch)
+            self.batch = []
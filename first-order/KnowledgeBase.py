@@ -0,0 +1,234 @@
+from LogicSimplifier import *
+from Unify import *
+from TermIndex import *
+import heapq
+import time
+
+def is_positive(literal):
+    return literal.op != 'not'
+
+def atom_of(literal):
+    return literal if literal.op != 'not' else literal.args[0]
+
+def literal_key(literal, complement=False):
+    '''
+    The term a literal is indexed under: the predicate with its sign in the
+    name, so P(x) is stored as +P(x) and ~P(x) as -P(x).
+    '''
+    atom = atom_of(literal)
+    sign = is_positive(literal) != complement
+    return Expression(('+' if sign else '-') + atom.op, *atom.args)
+
+def weight(clause):
+    ''' Number of symbols in a clause; light clauses are picked first. '''
+    total = 0
+    for literal in clause:
+        stack = [literal]
+        while stack:
+            t = stack.pop()
+            total += 1
+            stack.extend(t.args)
+    return total
+
+class KnowledgeBase:
+    '''
+    A first-order knowledge base answering queries by resolution.
+    Formulas are converted to clause form with Skolem functions (see
+    LogicSimplifier.to_clauses). ask() negates the query and searches for
+    the empty clause with the given-clause algorithm: clauses waiting to be
+    processed are kept in a queue ordered by weight, and the lightest is
+    resolved against all processed ("active") clauses, then becomes active
+    itself. Only clauses descending from the negated query are ever chosen
+    (set of support), so the KB clauses are not resolved with each other.
+
+    Partners for resolution are found through a discrimination tree over
+    the literals of the active clauses, and new clauses that are instances
+    of active ones are discarded (forward subsumption), looked up through a
+    second tree. There is no special treatment of equality.
+    Example usage:
+
+    >>> kb = KnowledgeBase()
+    >>> kb.tell('all x. (Man(x) -> Mortal(x))')
+    >>> kb.tell('Man(Socrates)')
+    >>> kb.ask('Mortal(Socrates)')
+    True
+    >>> kb.ask('Mortal(Zeus)')
+    False
+    '''
+    def __init__(self):
+        self.parser = LogicParser()
+        self.simplifier = LogicSimplifier()
+        self.clear()
+
+    def clear(self):
+        self.KB = []
+        ## literal key -> (clause, position), for resolution partners
+        self.index = DiscriminationTree()
+        ## first literal -> clause, for subsumption: a clause can only
+        ## subsume another if its first literal matches one of the other's
+        self.subsumers = DiscriminationTree()
+
+    def parse(self, expr):
+        if isinstance(expr, str):
+            return self.parser.parse(expr)
+        return expr
+
+    def tell(self, expr):
+        '''
+        Adds a formula (a string or an Expression) to the KB. Factors of its
+        clauses are added too, since the KB clauses are never given clauses
+        themselves.
+        '''
+        for clause in self.simplifier.to_clauses(self.parse(expr)):
+            for c in [clause] + self.factors(clause):
+                if not self.subsumed(c, [self.subsumers]):
+                    self.add(self.simplifier.rename(c, {}), self.KB, self.index, self.subsumers)
+
+    def add(self, clause, clauses, index, subsumers):
+        clauses.append(clause)
+        for position, literal in enumerate(clause):
+            index.insert(literal_key(literal), (clause, position))
+        if clause:
+            subsumers.insert(literal_key(clause[0]), clause)
+
+    def ask(self, expr, max_clauses=10000, max_given=2000, max_weight=30, timeout=None):
+        '''
+        Returns True if the KB entails expr, False if it does not, and None
+        if the search stopped before finding out. Resolution may run forever
+        on a query that does not follow, so the search is bounded: it stops
+        after max_clauses derived clauses (kept or subsumed), max_given
+        given clauses or timeout seconds, whichever comes first, and derived
+        clauses heavier than max_weight (see weight) are dropped. False is
+        only returned when the queue runs empty and nothing was dropped.
+        '''
+        query = Expression('not', self.parse(expr))
+        index = DiscriminationTree()
+        subsumers = DiscriminationTree()
+        indexes = [self.index, index]
+        passive = []
+        counter = 0
+        for clause in self.simplifier.to_clauses(query):
+            if len(clause) == 0:
+                return True
+            heapq.heappush(passive, (weight(clause), counter, clause))
+            counter += 1
+        start = time.time()
+        derived = 0
+        given_count = 0
+        complete = True
+        while passive:
+            given_count += 1
+            if given_count > max_given or (timeout is not None and time.time() - start > timeout):
+                return None
+            given = heapq.heappop(passive)[2]
+            if self.subsumed(given, [self.subsumers, subsumers]):
+                continue
+            given = self.simplifier.rename(given, {})
+            self.add(given, [], index, subsumers)
+            ## a renamed copy lets the clause resolve with itself
+            partner = self.simplifier.rename(given, {})
+            new = self.factors(partner) + self.resolvents(partner, indexes)
+            for clause in new:
+                if len(clause) == 0:
+                    return True
+                derived += 1
+                if derived > max_clauses:
+                    return None
+                w = weight(clause)
+                if w > max_weight:
+                    complete = False
+                    continue
+                if self.subsumed(clause, [self.subsumers, subsumers]):
+                    continue
+                heapq.heappush(passive, (w, counter, clause))
+                counter += 1
+        return False if complete else None
+
+    def resolvents(self, clause, indexes):
+        ''' All binary resolvents of clause with the clauses in the indexes. '''
+        result = []
+        for i, literal in enumerate(clause):
+            key = literal_key(literal, complement=True)
+            for index in indexes:
+                for other, j in index.unifiable(key):
+                    bindings = unify(atom_of(literal), atom_of(other[j]))
+                    if bindings is None:
+                        continue
+                    resolvent = self.simplify([substitute(l, bindings) for l in clause[:i] + clause[i+1:]] +
+                                              [substitute(l, bindings) for l in other[:j] + other[j+1:]])
+                    if resolvent is not None:
+                        result.append(resolvent)
+        return result
+
+    def factors(self, clause):
+        ''' Clauses obtained by unifying two literals of the same sign. '''
+        result = []
+        for i in range(len(clause)):
+            for j in range(i + 1, len(clause)):
+                if is_positive(clause[i]) != is_positive(clause[j]):
+                    continue
+                bindings = unify(atom_of(clause[i]), atom_of(clause[j]))
+                if bindings is None:
+                    continue
+                factor = self.simplify([substitute(l, bindings) for l in clause])
+                if factor is not None:
+                    result.append(factor)
+        return result
+
+    def simplify(self, literals):
+        ''' Merges repeated literals; returns None for a tautology. '''
+        clause = []
+        for literal in literals:
+            if literal in clause:
+                continue
+            if Logic.negate(literal) in clause or (literal.op == 'not' and literal.args[0] in clause):
+                return None
+            clause.append(literal)
+        return tuple(clause)
+
+    def subsumed(self, clause, indexes):
+        '''
+        True if some clause in the subsumption indexes subsumes clause, i.e.
+        becomes a subset of it under some substitution.
+        '''
+        candidates = {}
+        for literal in clause:
+            for index in indexes:
+                for other in index.generalizations(literal_key(literal)):
+                    candidates[id(other)] = other
+        for other in candidates.values():
+            if len(other) <= len(clause) and self.subsumes(other, clause):
+                return True
+        return False
+
+    def subsumes(self, general, clause):
+        ## backtracking search for a match of every literal of general into
+        ## some literal of clause under one substitution. The search can take
+        ## exponential time on long clauses, so first the cheap necessary
+        ## conditions: general is not longer, and every predicate with its
+        ## sign in general occurs in clause. Then the literal of general with
+        ## the fewest matches under the bindings so far is matched next, so
+        ## a literal without any match ends the branch at once.
+        if len(general) > len(clause):
+            return False
+        targets = [literal_key(literal) for literal in clause]
+        patterns = [literal_key(literal) for literal in general]
+        ops = set(t.op for t in targets)
+        if any(p.op not in ops for p in patterns):
+            return False
+        stack = [(tuple(range(len(patterns))), {})]
+        while stack:
+            left, bindings = stack.pop()
+            if not left:
+                return True
+            best = None
+            for i in left:
+                options = [extended for extended in (match(patterns[i], t, bindings) for t in targets)
+                           if extended is not None]
+                if best is None or len(options) < len(best[1]):
+                    best = (i, options)
+                    if not options:
+                        break
+            rest = tuple(i for i in left if i != best[0])
+            stack.extend((rest, extended) for extended in best[1])
+        return False
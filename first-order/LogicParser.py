@@ -27,8 +27,10 @@ class Logic:
 
 class Expression:
     '''
-    A class representing an expression of propositional logic.
-    Contains either an operator and arguments or a single variable.
+    A class representing an expression of first-order logic.
+    Contains either an operator and arguments, a constant, or a function
+    symbol applied to argument terms, e.g. Expression('f', Expression('a'))
+    is the term f(a). Predicates and variables have their own subclasses.
     Examples: Expression('P') -> the variable P
               Expression('not', Expression('P')) -> ~P
               Expression('and', Expression('P'), Expression('Q')) -> P && Q
@@ -46,6 +48,9 @@ class Expression:
         if len(self.args) == 0:
             # constant or operator with no arguments (e.g. 'F' or 'and')
             return str(self.op)
+        elif self.op not in Logic.OPS:
+            # predicate or function applied to its arguments, e.g. P(x, f(y))
+            return '%s(%s)' % (self.op, ', '.join(map(repr, self.args)))
         elif self.op in Logic.UNARY:
             # unary operator plus its argument
             if (self.op == 'not'):
@@ -57,7 +62,9 @@ class Expression:
             return '(%s)' % (' '+self.op+' ').join(map(repr, self.args))
 
     def __eq__(self, other):
+        ## a variable x is not the constant x, nor the predicate x
         return (other is self) or (isinstance(other, Expression)
+                                   and type(self) == type(other)
                                    and self.op == other.op
                                    and self.args == other.args)
 
@@ -72,13 +79,13 @@ class Expression:
 
     def detail_string(self):
         s = ''
-        if self.op in Logic.OPS:
+        if self.op in Logic.OPS or self.args:
             s = self.op + '('
         else:
             s = self.op
         arg_strs = [arg.detail_string() for arg in self.args]
         s += ', '.join(arg_strs)
-        if self.op in Logic.OPS:
+        if self.op in Logic.OPS or self.args:
             s += ')'
         return s
         
@@ -99,9 +106,9 @@ class QuantifiedExpression (Expression):
         self.op = op
         self.var = var
         if boundexpr:
-            self.args = [boundexpr]
+            self.args = (boundexpr,)
         else:
-            self.args = []
+            self.args = ()
 
     def __eq__(self, other):
         if other is self: return True
@@ -111,6 +118,9 @@ class QuantifiedExpression (Expression):
                     other.var == self.var and
                     other.args == self.args)
 
+    def __hash__(self):
+        return hash(self.op) ^ hash(self.var) ^ hash(self.args)
+
     def __call__(self, expr):
         if len(self.args) != 0:
             raise Exception("Error: Quantifier alreay contains expression")
@@ -122,6 +132,18 @@ class QuantifiedExpression (Expression):
         return '%s %s.(%s)' % (self.op, self.var, ''.join(map(repr, self.args)))
 
 class Predicate (Expression):
+    '''
+    An atomic formula: a predicate applied to argument terms, e.g.
+    Predicate('Loves', Expression('john'), Variable('x')) is Loves(john, x).
+    A propositional atom is a predicate without arguments.
+    '''
+    pass
+
+class Variable (Expression):
+    '''
+    A variable term, e.g. Variable('x'). Names that a quantifier binds are
+    parsed as variables; other names in argument lists are constants.
+    '''
     pass
 
 class LogicParser:
@@ -139,155 +161,76 @@ class LogicParser:
 
     def parse_tokens(self, tokens):
         '''
-        Parses a set of logic tokens, returning an Expression representing their
-        meaning.
+        Parses a list of logic tokens, returning an Expression representing
+        their meaning.
         Example:
-        >>> t = LogicTokenizer().tokenize('a -> (b && c)')
-        >>> parse_tokens(t)
-        implies[a, and[b, c]]
+        >>> t = LogicTokenizer().tokenize('all x. (Human(x) -> Mortal(x))')
+        >>> LogicParser().parse_tokens(t)
+        forall x.((Human(x) implies Mortal(x)))
         '''
         self.tokens = tokens
         RPN = []
         op_stack = []
-
-        bound = []
-        num_pushed_parens = 0
+        ## number of arguments seen so far by every predicate or function
+        ## call whose parentheses are open
+        arities = []
         token = self.token()
         while token != None:
-            #print('RPN = ', RPN, '; op stack = ', op_stack, sep='')
-            if token.type == 'exists' or token.type == 'forall':
-                ## keep track of which variable the quantifier binds by storing it in
-                ## the token's name field
-                assert self.token(0).type == 'bindingvar'
-                token.name = self.token(0).name
+            if token.type in Logic.QUANTIFIERS:
+                ## keep track of which variable the quantifier binds by storing
+                ## it in the token's name field
+                var = self.token()
+                if var == None or var.type != 'bindingvar':
+                    raise Exception("Error: quantifier without a variable")
+                token.name = var.name
                 op_stack.append(token)
-            elif token.type == 'pred':
+            elif token.type == 'pred' or token.type == 'func':
                 op_stack.append(token)
+                ## the call's own opening paren
+                paren = self.token()
+                paren.name = 'call'
+                op_stack.append(paren)
+                arities.append(1)
             elif token.type == 'comma':
-                token = self.token(0)
-                while op_stack[-1].type != 'lparen':
+                while op_stack != [] and op_stack[-1].type != 'lparen':
                     RPN.append(op_stack.pop())
-            elif token.type == 'bindingvar':
-                bound.append(token.name)
-                ## give the binding var's opening paren a 'name' so we can easily
-                ## identify this variable's scope. If there is no opening paren, the
-                ## scope will be until the end of the string.
-                if self.token(0).type == 'lparen':
-                    self.token(0).name = token.name
+                if op_stack == [] or op_stack[-1].name != 'call':
+                    raise Exception("Error: comma outside of an argument list")
+                arities[-1] += 1
             elif token.type == 'var':
-                if token.name in bound:
-                    RPN.append(Token('boundvar', token.name))
-                else:
-                    RPN.append(Token('freevar', token.name))
+                RPN.append(token)
             elif token.type == 'lparen':
                 op_stack.append(token)
             elif token.type == 'rparen':
                 ## until we find the open paren, pop items off the stack
                 ## into the output string
-                while op_stack[-1].type != 'lparen':
-                    RPN.append(op_stack.pop())
-                assert op_stack[-1].type == 'lparen'
-                ## check if we're ending a bound variable's scope
-                if op_stack[-1].name:
-                    bound.remove(op_stack[-1].name)
-                op_stack.pop() # remove the lparen, discarding it
-                ## check if those parens were for a predicate or quantifier
-                if (op_stack[-1].type == 'pred' or op_stack[-1].type == 'exists'
-                    or op_stack[-1].type == 'forall'):
-                    ## make sure the function call is matched with its arguments
-                    RPN.append(op_stack.pop())
-            elif token.type in Logic.OPS:
-                while (op_stack != [] and op_stack[-1].type in Logic.OPS and
-                       Logic.Precedence[op_stack[-1].type] >= Logic.Precedence[token.type]):
-                    ## pop off all higher precedence operators
-                    ## note: the >= in the above condition rather than > is to
-                    ## ensure proper associative behavior:
-                    ## a -> b -> c should be interpreted as (a -> b) -> c rather
-                    ## than a -> (b -> c).
-                    RPN.append(op_stack.pop())
-                op_stack.append(token)
-            ## read the next token
-            token = self.token()
-        ## no more tokens to read here, push the rest onto our output stack
-        while op_stack != []:
-            op = op_stack.pop()
-            if op.type == 'lparen' or op.type == 'rparen':
-                raise Exception("String has mismatched parens")
-            RPN.append(op)
-        print(RPN)
-
-        
-    def parse(self, string):
-        '''
-        Parses a string of first-order logic, returning an Expression that
-        represents the original string.
-        Example:
-        "a -> b" returns Expression('implies', Expression('a'), Expression('b'))
-        "a and b or c or d" returns an Expression that represents, using prefix notation
-            for readability: or[or[and[a, b], c], d]
-        '''
-        self.tokens = LogicTokenizer().tokenize(string)
-        
-
-        RPN = []
-        op_stack = []
-
-        bound = []
-        num_pushed_parens = 0
-        token = self.token()
-        while token != None:
-            #print('RPN = ', RPN, '; op stack = ', op_stack, sep='')
-            if token.type == 'exists' or token.type == 'forall':
-                ## keep track of which variable the quantifier binds by storing it in
-                ## the token's name field
-                assert self.token(0).type == 'bindingvar'
-                token.name = self.token(0).name
-                op_stack.append(token)
-            elif token.type == 'pred':
-                op_stack.append(token)
-            elif token.type == 'comma':
-                token = self.token(0)
-                while op_stack[-1].type != 'lparen':
+                while op_stack != [] and op_stack[-1].type != 'lparen':
                     RPN.append(op_stack.pop())
-            elif token.type == 'bindingvar':
-                bound.append(token.name)
-                ## give the binding var's opening paren a 'name' so we can easily
-                ## identify this variable's scope. If there is no opening paren, the
-                ## scope will be until the end of the string.
-                if self.token(0).type == 'lparen':
-                    self.token(0).name = token.name
-            elif token.type == 'var':
-                if token.name in bound:
-                    RPN.append(Token('boundvar', token.name))
-                else:
-                    RPN.append(Token('freevar', token.name))
-            elif token.type == 'lparen':
+                if op_stack == []:
+                    raise Exception("String has mismatched parens")
+                paren = op_stack.pop()
+                if paren.name == 'call':
+                    ## the predicate or function goes after its arguments
+                    call = op_stack.pop()
+                    call.arity = arities.pop()
+                    RPN.append(call)
+            elif token.type in Logic.UNARY:
+                ## prefix operators have no left operand to finish off
                 op_stack.append(token)
-            elif token.type == 'rparen':
-                ## until we find the open paren, pop items off the stack
-                ## into the output string
-                while op_stack[-1].type != 'lparen':
-                    RPN.append(op_stack.pop())
-                assert op_stack[-1].type == 'lparen'
-                ## check if we're ending a bound variable's scope
-                if op_stack[-1].name:
-                    bound.remove(op_stack[-1].name)
-                op_stack.pop() # remove the lparen, discarding it
-                ## check if those parens were for a predicate or quantifier
-                if (op_stack[-1].type == 'pred' or op_stack[-1].type == 'exists'
-                    or op_stack[-1].type == 'forall'):
-                    ## make sure the function call is matched with its arguments
-                    RPN.append(op_stack.pop())
-            elif token.type in Logic.OPS:
+            elif token.type in Logic.BINARY:
                 while (op_stack != [] and op_stack[-1].type in Logic.OPS and
                        Logic.Precedence[op_stack[-1].type] >= Logic.Precedence[token.type]):
                     ## pop off all higher precedence operators
                     ## note: the >= in the above condition rather than > is to
                     ## ensure proper associative behavior:
                     ## a -> b -> c should be interpreted as (a -> b) -> c rather
-                    ## than a -> (b -> c).
+                    ## than a -> (b -> c). Quantifiers have the lowest
+                    ## precedence, so their scope extends as far right as
+                    ## possible.
                     RPN.append(op_stack.pop())
                 op_stack.append(token)
+            else:
+                raise Exception("Error: malformed input string")
             ## read the next token
             token = self.token()
         ## no more tokens to read here, push the rest onto our output stack
@@ -296,57 +239,77 @@ class LogicParser:
             if op.type == 'lparen' or op.type == 'rparen':
                 raise Exception("String has mismatched parens")
             RPN.append(op)
-        print(RPN)
         ## RPN now contains our original string in reverse polish notation
         ## parse the RPN to create an Expression representing our string.
-        # it is easiest to reverse the RPN string so we can use pop()
         eval_stack = []
-        RPN.reverse()
-        while RPN != []:
-            print('---New Iteration---')
-            print('Stack: ')
-            [x.print_detailed() for x in eval_stack]
-            tok = RPN.pop()
-            print('Next Token: %s' % tok.type)
-            if tok.type not in Logic.OPS:
-                ## tok is a variable or predicate; convert it to an expression and place it
-                ## on the stack
-                if tok.type == 'pred':
-                    eval_stack.append(Predicate(tok.type))
+        for tok in RPN:
+            if tok.type == 'var':
                 eval_stack.append(Expression(tok.name))
+            elif tok.type == 'pred' or tok.type == 'func':
+                if len(eval_stack) < tok.arity:
+                    raise Exception("Error: malformed input string")
+                args = eval_stack[len(eval_stack) - tok.arity:]
+                del eval_stack[len(eval_stack) - tok.arity:]
+                if tok.type == 'pred':
+                    eval_stack.append(Predicate(tok.name, *args))
+                else:
+                    eval_stack.append(Expression(tok.name, *args))
             elif tok.type in Logic.UNARY:
-                ## token is a unary operator. convert it to an expression
-                ## and apply it to the top of the stack
                 if len(eval_stack) < 1:
                     raise Exception("Error: malformed input string")
-                op = Expression(tok.type)
-                arg = eval_stack.pop()
-                eval_stack.append(op(arg))
+                eval_stack.append(Expression(tok.type, eval_stack.pop()))
             elif tok.type in Logic.QUANTIFIERS:
                 if len(eval_stack) < 1:
                     raise Exception("Error: malformed input string")
-                op = QuantifiedExpression(tok.type, tok.name)
-                arg = eval_stack.pop()
-                eval_stack.append(op(arg))
+                eval_stack.append(QuantifiedExpression(tok.type, tok.name, eval_stack.pop()))
             elif tok.type in Logic.BINARY:
-                ## Same as unary but with two arguments
                 if len(eval_stack) < 2:
                     raise Exception("Error: malformed input string")
-                op = Expression(tok.type)
-                # note: because we are evaluating arguments in the opposite
-                # order of how they were originally present in the string, we
-                # need to reverse the order for binary operators
-                arg1 = eval_stack.pop()
                 arg2 = eval_stack.pop()
-                eval_stack.append(op(arg2, arg1))
+                arg1 = eval_stack.pop()
+                eval_stack.append(Expression(tok.type, arg1, arg2))
             else:
                 raise Exception("Error: malformed input string")
-        ## Hopefully we're done parsing now and the result is left on the stack
-        print('Done! Result: ', end='')
-        [x.print_detailed() for x in eval_stack]
         if len(eval_stack) != 1:
             raise Exception("Error: malformed input string")
-        return eval_stack[0]
+        return self.bind(eval_stack[0], (), False)
+
+    def bind(self, expr, bound, term):
+        '''
+        Second pass over a parsed expression: names bound by an enclosing
+        quantifier become Variables, bare names in formula position become
+        predicates without arguments (propositional atoms), and all other
+        names in argument lists are constants.
+        '''
+        if isinstance(expr, QuantifiedExpression):
+            return QuantifiedExpression(expr.op, expr.var,
+                                        self.bind(expr.args[0], bound + (expr.var,), False))
+        if expr.op in Logic.OPS:
+            if term:
+                raise Exception("Error: formula used as an argument")
+            return Expression(expr.op, *[self.bind(arg, bound, False) for arg in expr.args])
+        args = [self.bind(arg, bound, True) for arg in expr.args]
+        if isinstance(expr, Predicate) or not term:
+            if term:
+                raise Exception("Error: predicate used as an argument")
+            return Predicate(expr.op, *args)
+        if args == [] and expr.op in bound:
+            return Variable(expr.op)
+        return Expression(expr.op, *args)
+
+    def parse(self, string):
+        '''
+        Parses a string of first-order logic, returning an Expression that
+        represents the original string. Quantifiers are written
+        "all x. ..." (or "forall x. ...") and "exists x. ...", and extend
+        as far to the right as possible. Predicates start with a capital
+        letter, functions and constants with a lowercase one.
+        Example:
+        "all x. (Human(x) -> Mortal(x))" returns
+            QuantifiedExpression('forall', 'x', Expression('implies',
+                Predicate('Human', Variable('x')), Predicate('Mortal', Variable('x'))))
+        '''
+        return self.parse_tokens(LogicTokenizer().tokenize(string))
 
 if __name__=="__main__":
     P = LogicParser
@@ -1,10 +1,151 @@
-from logicparser import *
+from LogicParser import *
+import itertools
+
+## fresh names for the variables and Skolem functions made by to_clauses; the
+## $ keeps them apart from anything the parser can produce
+FRESH = itertools.count(1)
 
 
 def FlattenedExpression(op, *args):
     return LogicSimplifier().flatten(Expression(op, *args))
 
 class LogicSimplifier:
+    def to_clauses(self, s):
+        '''
+        Converts a first-order formula to clause form: a list of clauses,
+        each a tuple of literals (predicates or negated predicates) whose
+        variables are implicitly universally quantified. Implications and
+        biconditionals are eliminated and negations pushed inwards (to_nnf),
+        existential variables are replaced by Skolem functions of the
+        universal variables around them and universal quantifiers dropped
+        (skolemize), and the result is multiplied out into clauses. Every
+        clause gets variables of its own ("standardizing apart").
+        Example usage:
+
+        >>> LogicSimplifier().to_clauses(LogicParser().parse('all x. exists y. Loves(x, y)'))
+        [(Loves($v3, $sk2($v3)),)]
+        '''
+        clauses = []
+        for clause in self.nnf_clauses(self.skolemize(self.to_nnf(s), (), {})):
+            clauses.append(self.rename(clause, {}))
+        return clauses
+
+    def to_nnf(self, s, positive=True):
+        '''
+        Negation normal form of a first-order formula (or of its negation,
+        if positive is False): only and, or, quantifiers and negated
+        predicates remain. ~(all x. P) becomes (exists x. ~P) and the other
+        way round.
+        '''
+        assert isinstance(s, Expression)
+        if isinstance(s, QuantifiedExpression):
+            op = s.op
+            if not positive:
+                op = 'exists' if op == 'forall' else 'forall'
+            return QuantifiedExpression(op, s.var, self.to_nnf(s.args[0], positive))
+        if s.op == 'not':
+            return self.to_nnf(s.args[0], not positive)
+        if s.op in ['and', 'or']:
+            op = s.op
+            if not positive:
+                op = 'or' if op == 'and' else 'and'
+            return Expression(op, *[self.to_nnf(arg, positive) for arg in s.args])
+        if s.op == 'implies':
+            A, B = s.args
+            if positive:
+                return Expression('or', self.to_nnf(A, False), self.to_nnf(B, True))
+            return Expression('and', self.to_nnf(A, True), self.to_nnf(B, False))
+        if s.op == 'iff':
+            A, B = s.args
+            if positive:
+                return Expression('and',
+                                  Expression('or', self.to_nnf(A, False), self.to_nnf(B, True)),
+                                  Expression('or', self.to_nnf(B, False), self.to_nnf(A, True)))
+            return Expression('or',
+                              Expression('and', self.to_nnf(A, True), self.to_nnf(B, False)),
+                              Expression('and', self.to_nnf(B, True), self.to_nnf(A, False)))
+        ## a predicate
+        return s if positive else Expression('not', s)
+
+    def skolemize(self, s, universals, names):
+        '''
+        Removes the quantifiers from a formula in negation normal form.
+        Universally quantified variables get fresh names (so no two
+        quantifiers share a variable), and existentially quantified ones are
+        replaced by a new Skolem function of the universal variables in
+        whose scope they are. names maps the variable names of the input
+        to their replacement terms.
+        '''
+        if isinstance(s, QuantifiedExpression):
+            names = dict(names)
+            if s.op == 'forall':
+                var = Variable('$v%d' % next(FRESH))
+                names[s.var] = var
+                return self.skolemize(s.args[0], universals + (var,), names)
+            names[s.var] = Expression('$sk%d' % next(FRESH), *universals)
+            return self.skolemize(s.args[0], universals, names)
+        if s.op in ['and', 'or', 'not']:
+            return Expression(s.op, *[self.skolemize(arg, universals, names) for arg in s.args])
+        return self.substitute(s, names)
+
+    def substitute(self, term, names):
+        ''' Replaces the variables of a term or predicate by names[variable name]. '''
+        if isinstance(term, Variable):
+            return names.get(term.op, term)
+        if term.args == ():
+            return term
+        return term.__class__(term.op, *[self.substitute(arg, names) for arg in term.args])
+
+    def nnf_clauses(self, s):
+        '''
+        Generates the clauses of a quantifier-free formula in negation
+        normal form as tuples of literals, multiplying out disjunctions of
+        conjunctions. Repeated literals are merged and tautologies dropped.
+        '''
+        if s.op == 'and':
+            for arg in s.args:
+                for clause in self.nnf_clauses(arg):
+                    yield clause
+        elif s.op == 'or':
+            for left in self.nnf_clauses(s.args[0]):
+                for right in self.nnf_clauses(s.args[1]):
+                    clause = left + tuple(literal for literal in right if literal not in left)
+                    if not any(Expression('not', literal) in clause for literal in clause):
+                        yield clause
+        else:
+            yield (s,)
+
+    def rename(self, clause, names):
+        '''
+        Gives the variables of a clause fresh names; names collects the
+        mapping from old to new variable names.
+        '''
+        renamed = []
+        for literal in clause:
+            for var in self.variables(literal):
+                if var not in names:
+                    names[var] = Variable('$v%d' % next(FRESH))
+            renamed.append(self.substitute_literal(literal, names))
+        return tuple(renamed)
+
+    def substitute_literal(self, literal, names):
+        if literal.op == 'not':
+            return Expression('not', self.substitute(literal.args[0], names))
+        return self.substitute(literal, names)
+
+    def variables(self, term):
+        ''' Returns the names of the variables in a term or literal. '''
+        names = []
+        stack = [term]
+        while stack:
+            t = stack.pop()
+            if isinstance(t, Variable):
+                if t.op not in names:
+                    names.append(t.op)
+            else:
+                stack.extend(t.args)
+        return names
+
     def to_cnf(self, s):
         assert isinstance(s, Expression)
         new = self.eliminate_biconditionals(s)
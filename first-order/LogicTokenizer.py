@@ -2,19 +2,22 @@ import re
 
 class LogicTokenizer:
     def __init__(self):
-        self.token_res =  [ r"(?P<forall>[aA][lL][lL])",
-                        r"(?P<exists>[eE][xX][iI][sS][tT][sS])",
-                        r"(?P<and>[aA][nN][dD]|\&\&)",       # and
-                        r"(?P<or>[oO][rR]|\|\|)",               # or
-                        r"(?P<not>\~|\!|not)",                  # not
-                        r"(?P<implies>\-\>|\=\>|[iI][mM][pP][lL][iI][eE][sS])", # implies
-                        r"(?P<iff>\<\-\>|\<\=\>|iff)",          # iff
+        ## keywords end at a word boundary, so names such as "allen" or
+        ## "andy" are not split into a keyword and the rest
+        self.token_res =  [ r"(?P<forall>([fF][oO][rR])?[aA][lL][lL]\b)",
+                        r"(?P<exists>[eE][xX][iI][sS][tT][sS]\b)",
+                        r"(?P<and>([aA][nN][dD]\b)|\&\&)",       # and
+                        r"(?P<or>([oO][rR]\b)|\|\|)",               # or
+                        r"(?P<not>\~|\!|not\b)",                  # not
+                        r"(?P<implies>\-\>|\=\>|[iI][mM][pP][lL][iI][eE][sS]\b)", # implies
+                        r"(?P<iff>\<\-\>|\<\=\>|iff\b)",          # iff
                         r"(?P<whitespace>\s+)",                 # whitespace
                         r"(?P<lparen>\()",                      # (
                         r"(?P<rparen>\))",                      # )
                         r"(?P<comma>,)",
-                        r"(?P<pred>[A-Z][a-zA-Z0-9]*(?=\())",   # predicates
-                        r"(?P<bindingvar>[a-zA-Z0-9]+\.)",      # binding variables
+                        r"(?P<pred>[A-Z][a-zA-Z0-9_]*(?=\())",   # predicates
+                        r"(?P<func>[a-z0-9_][a-zA-Z0-9_]*(?=\())",   # functions
+                        r"(?P<bindingvar>[a-zA-Z0-9_]+\.)",      # binding variables
                         r"(?P<var>[a-zA-Z0-9\_]+)"]             # free or bound variables
         self.pattern = '|'.join(self.token_res)
         self.regex = re.compile(self.pattern)
@@ -27,10 +30,10 @@ class LogicTokenizer:
             #print('searching for token in ' + string[pos:])
             match = self.regex.match(string, pos)
             if match == None:
-                raise SystemExit('bad string in tokenized')
+                raise Exception('Error: malformed input string.')
 
             groups = match.groups()
-            if match.lastgroup == 'var' or match.lastgroup == 'pred':
+            if match.lastgroup in ['var', 'pred', 'func']:
                 self.tokenized.append(Token(match.lastgroup, match.group(0)))
             elif match.lastgroup == 'bindingvar':
                 self.tokenized.append(Token(match.lastgroup, match.group(0)[:-1]))
@@ -0,0 +1,131 @@
+from LogicParser import *
+
+class DiscriminationTree:
+    '''
+    An index from terms to values that retrieves candidate partners for
+    unification or matching without looking at every stored term.
+
+    Each term is stored under its preorder sequence of symbols, where a
+    variable becomes '*' and any other symbol the pair (name, arity), in a
+    trie. A query walks the trie along its own sequence: a variable in the
+    query skips a whole subterm of the stored terms, and a stored '*' skips
+    a whole subterm of the query. Variables are not told apart, so the
+    results are candidates to be checked with unify() or match(): a
+    superset of the real partners, but usually a small one.
+    Example usage:
+
+    >>> index = DiscriminationTree()
+    >>> index.insert(Expression('f', Expression('a')), 1)
+    >>> index.insert(Expression('f', Variable('x')), 2)
+    >>> index.insert(Expression('g', Variable('x')), 3)
+    >>> sorted(index.unifiable(Expression('f', Variable('y'))))
+    [1, 2]
+    >>> list(index.generalizations(Expression('f', Expression('b'))))
+    [2]
+    '''
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def flatten(self, term):
+        '''
+        Preorder symbols of a term, each with the position just after the
+        subterm it starts.
+        '''
+        keys = []
+        ends = []
+        stack = [term]
+        starts = []
+        while stack:
+            t = stack.pop()
+            if t is None:
+                ends[starts.pop()] = len(keys)
+                continue
+            if isinstance(t, Variable):
+                keys.append('*')
+                ends.append(len(keys))
+                continue
+            keys.append((t.op, len(t.args)))
+            ends.append(None)
+            starts.append(len(keys) - 1)
+            stack.append(None)
+            stack.extend(reversed(t.args))
+        return list(zip(keys, ends))
+
+    def insert(self, term, value):
+        node = self.root
+        for key, end in self.flatten(term):
+            node = node.setdefault(key, {})
+        node.setdefault(None, []).append(value)
+        self.size += 1
+
+    def remove(self, term, value):
+        ''' Removes one entry of value under term, if there is one. '''
+        path = [self.root]
+        keys = [key for key, end in self.flatten(term)]
+        for key in keys:
+            if key not in path[-1]:
+                return
+            path.append(path[-1][key])
+        values = path[-1].get(None, [])
+        if value not in values:
+            return
+        values.remove(value)
+        self.size -= 1
+        if values == []:
+            del path[-1][None]
+        ## prune the branches that became empty
+        for depth in range(len(keys), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][keys[depth - 1]]
+
+    def skip(self, node, count):
+        ''' The trie nodes reached from node by skipping count whole subterms. '''
+        stack = [(node, count)]
+        while stack:
+            node, count = stack.pop()
+            if count == 0:
+                yield node
+                continue
+            for key, child in node.items():
+                if key is None:
+                    continue
+                arity = 0 if key == '*' else key[1]
+                stack.append((child, count - 1 + arity))
+
+    def unifiable(self, term):
+        ''' Yields the values of stored terms that may unify with term. '''
+        return self.retrieve(term, True)
+
+    def generalizations(self, term):
+        '''
+        Yields the values of stored terms that may match term, i.e. that
+        term may be an instance of.
+        '''
+        return self.retrieve(term, False)
+
+    def retrieve(self, term, unifying):
+        flat = self.flatten(term)
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i == len(flat):
+                for value in node.get(None, []):
+                    yield value
+                continue
+            key, end = flat[i]
+            if key == '*':
+                if unifying:
+                    for child in self.skip(node, 1):
+                        stack.append((child, i + 1))
+                elif '*' in node:
+                    stack.append((node['*'], i + 1))
+                continue
+            if key in node:
+                stack.append((node[key], i + 1))
+            if '*' in node:
+                stack.append((node['*'], end))
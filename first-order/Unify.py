@@ -0,0 +1,99 @@
+from LogicParser import *
+
+## Substitutions are kept in triangular form: a dict from variable name to the
+## term it is bound to, where that term may itself contain bound variables.
+## Binding a variable never copies or rewrites a term, so subterms are shared
+## between the substitution and the clauses they came from, and the cost of a
+## unification grows with the size of the terms rather than the product of
+## their sizes. substitute() resolves a term against a substitution once the
+## final answer is needed.
+
+def deref(term, bindings):
+    ''' Follows variable bindings until an unbound variable or a non-variable term. '''
+    while isinstance(term, Variable) and term.op in bindings:
+        term = bindings[term.op]
+    return term
+
+def occurs(var, term, bindings):
+    ''' True if the variable named var occurs in term under the bindings. '''
+    stack = [term]
+    seen = set()
+    while stack:
+        t = deref(stack.pop(), bindings)
+        if isinstance(t, Variable):
+            if t.op == var:
+                return True
+        elif t.args and id(t) not in seen:
+            ## shared subterms are only searched once
+            seen.add(id(t))
+            stack.extend(t.args)
+    return False
+
+def unify(a, b, bindings=None):
+    '''
+    Returns a most general unifier of two terms (or two predicates) as a
+    triangular substitution extending bindings, or None if they do not
+    unify. bindings itself is left unchanged.
+    Example usage:
+
+    >>> x, y = Variable('x'), Variable('y')
+    >>> sorted(unify(Predicate('P', x, Expression('f', y)), Predicate('P', Expression('a'), Expression('f', x))).items())
+    [('x', a), ('y', x)]
+    '''
+    bindings = dict(bindings) if bindings else {}
+    stack = [(a, b)]
+    while stack:
+        s, t = stack.pop()
+        s = deref(s, bindings)
+        t = deref(t, bindings)
+        if s is t:
+            continue
+        if isinstance(s, Variable):
+            if isinstance(t, Variable) and t.op == s.op:
+                continue
+            if occurs(s.op, t, bindings):
+                return None
+            bindings[s.op] = t
+        elif isinstance(t, Variable):
+            if occurs(t.op, s, bindings):
+                return None
+            bindings[t.op] = s
+        elif type(s) != type(t) or s.op != t.op or len(s.args) != len(t.args):
+            return None
+        else:
+            stack.extend(zip(s.args, t.args))
+    return bindings
+
+def match(pattern, term, bindings=None):
+    '''
+    One-way unification: returns bindings for the variables of pattern that
+    make it equal to term, without binding any variable of term, or None.
+    '''
+    bindings = dict(bindings) if bindings else {}
+    stack = [(pattern, term)]
+    while stack:
+        s, t = stack.pop()
+        if isinstance(s, Variable):
+            if s.op in bindings:
+                if bindings[s.op] != t:
+                    return None
+            else:
+                bindings[s.op] = t
+        elif type(s) != type(t) or s.op != t.op or len(s.args) != len(t.args):
+            return None
+        else:
+            stack.extend(zip(s.args, t.args))
+    return bindings
+
+def substitute(term, bindings):
+    '''
+    Applies a substitution to a term, predicate or literal. Subterms without
+    bound variables are returned as they are rather than copied.
+    '''
+    term = deref(term, bindings)
+    if term.args == () or not bindings:
+        return term
+    args = tuple(substitute(arg, bindings) for arg in term.args)
+    if all(new is old for new, old in zip(args, term.args)):
+        return term
+    return term.__class__(term.op, *args)
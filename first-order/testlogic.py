@@ -0,0 +1,77 @@
+from KnowledgeBase import *
+from Grounder import *
+from Datalog import *
+from time import perf_counter as clock
+
+## tests.txt holds blocks of
+##   KB:       formulas to tell, one per line
+##   DOMAIN:   optionally, constants separated by spaces
+##   ASSERT:   a formula the KB must entail
+##   DENY:     a formula the KB must not entail, which ask() must find out
+##   UNKNOWN:  a formula the KB does not entail, on which ask() must give up
+## Every query must be answered within MAX_SECONDS: resolution does not
+## terminate on every query that does not follow, so ask() has to bound
+## its own search.
+## With a DOMAIN, every query is also asked of a Grounder over those
+## constants, which must answer True for ASSERT and False otherwise (the
+## blocks are chosen so that closing the domain changes no answer).
+## When every formula of a block is a function-free Horn clause, the
+## queries that are conjunctions of atoms are also asked of Datalog,
+## which must answer True for ASSERT and False otherwise.
+
+def datalog_of(formulas):
+    ''' A Datalog holding formulas, or None if one is not Datalog. '''
+    db = Datalog()
+    try:
+        for formula in formulas:
+            db.tell(formula)
+    except Exception:
+        return None
+    return db
+
+MAX_SECONDS = 10
+
+f = open('tests.txt', 'r')
+testid = -1
+times = []
+kb = KnowledgeBase()
+told = []
+grounder = None
+line = f.readline()
+while line != '':
+    line = line.strip()
+    if line == 'KB:':
+        kb.clear()
+        told = []
+        formulas = []
+        grounder = None
+        testid += 1
+        print("Running test %d...  "%testid, end='')
+    elif line == 'DOMAIN:':
+        grounder = Grounder(pred_knowledge_base(), f.readline().split())
+    elif line in ['ASSERT:', 'DENY:', 'UNKNOWN:']:
+        expected = {'ASSERT:': True, 'DENY:': False, 'UNKNOWN:': None}[line]
+        line = f.readline().strip()
+        startTime = clock()
+        assert kb.ask(line) == expected, (testid, line)
+        times.append(clock() - startTime)
+        assert times[-1] < MAX_SECONDS, (testid, line, times[-1])
+        if grounder is not None:
+            for formula in told:
+                grounder.tell(formula)
+            told = []
+            assert grounder.ask(line) == (expected == True), (testid, 'grounded', line)
+        db = datalog_of(formulas)
+        if db is not None:
+            try:
+                answer = db.ask(line)
+            except Exception:
+                ## not a conjunctive query
+                answer = expected == True
+            assert answer == (expected == True), (testid, 'datalog', line)
+        print("Passed.")
+    elif line != '':
+        kb.tell(line)
+        told.append(line)
+        formulas.append(line)
+    line = f.readline()
@@ -0,0 +1,62 @@
+from Unify import *
+from TermIndex import *
+
+## Checks of unification, matching and the discrimination tree. Every
+## unifier found must make its two terms equal once substituted.
+
+x, y, z = Variable('x'), Variable('y'), Variable('z')
+u, v = Variable('u'), Variable('v')
+a, b = Expression('a'), Expression('b')
+def f(*args): return Expression('f', *args)
+def g(*args): return Expression('g', *args)
+def P(*args): return Predicate('P', *args)
+
+print("Running unify...  ", end='')
+unifiable = [(P(x, f(y)), P(a, f(x))),
+             (P(x, y), P(y, x)),
+             (P(f(x), g(y, y)), P(f(g(z, a)), g(z, z))),
+             (P(x, x), P(f(y), f(a))),
+             (f(x, g(x)), f(g(y), g(g(b))))]
+for s, t in unifiable:
+    bindings = unify(s, t)
+    assert bindings is not None, (s, t)
+    assert substitute(s, bindings) == substitute(t, bindings), (s, t, bindings)
+## the bindings passed in are extended, not changed
+before = {'x': a}
+assert substitute(P(y), unify(P(x), P(y), before)) == P(a)
+assert before == {'x': a}
+not_unifiable = [(P(a), P(b)),
+                 (P(x, x), P(a, b)),
+                 (P(x), Predicate('Q', x)),
+                 (f(x), f(x, y)),
+                 ## occurs check
+                 (P(x), P(f(x))),
+                 (P(x, f(x)), P(f(y), y))]
+for s, t in not_unifiable:
+    assert unify(s, t) is None, (s, t)
+print("Passed.")
+
+print("Running match...  ", end='')
+assert match(P(x, f(y)), P(a, f(b))) == {'x': a, 'y': b}
+assert match(P(x, x), P(a, a)) == {'x': a}
+assert match(P(x, x), P(a, b)) is None
+## one-way: a variable of the term is not bound
+assert match(P(a), P(x)) is None
+assert match(P(x, y), P(y, a)) == {'x': y, 'y': a}
+print("Passed.")
+
+print("Running the discrimination tree...  ", end='')
+index = DiscriminationTree()
+terms = [f(a), f(x), g(x, b), g(a, y), f(g(a, b))]
+for number, term in enumerate(terms):
+    index.insert(term, number)
+## the queries share no variables with the stored terms
+for query in [f(u), f(b), g(a, b), g(u, u), f(g(u, v)), g(f(a), b)]:
+    expected = sorted(n for n, term in enumerate(terms) if unify(term, query) is not None)
+    assert sorted(index.unifiable(query)) == expected, (query, expected)
+    expected = sorted(n for n, term in enumerate(terms) if match(term, query) is not None)
+    assert sorted(index.generalizations(query)) == expected, (query, expected)
+index.remove(f(x), 1)
+assert sorted(index.unifiable(f(b))) == []
+assert sorted(index.unifiable(f(u))) == [0, 4]
+print("Passed.")
@@ -0,0 +1,222 @@
+from LogicParser import *
+
+class AIG:
+    '''
+    An and-inverter graph: every formula is built from two-input and nodes
+    and negation. A formula is a literal, an integer 2 * node + sign where
+    sign 1 means negated, so negation is free (literal ^ 1). Node 0 is the
+    constant False, so literal 0 is False and 1 is True; input nodes are
+    atoms. And nodes are kept in a unique table ("structural hashing"), so
+    a subformula that occurs in many formulas is one node, and the same
+    formula built twice is the same literal.
+
+    conj() simplifies as it goes: constants are propagated, x and x, x and
+    ~x are caught, and a few two-level rewriting rules look into the
+    operands as well, e.g. (x and y) and ~x is False and ~(x and y) and x
+    becomes x and ~y.
+
+    cnf() turns a literal into clauses of linear size (Tseitin): each and
+    node below the top gets an auxiliary atom $aN defined by three clauses.
+    The same node always gets the same atom and the same clauses.
+    Example usage:
+
+    >>> aig = AIG()
+    >>> f = aig.build(LogicParser().parse('(a and b) or c'))
+    >>> f == aig.build(LogicParser().parse('c or ~~(b and a)'))
+    True
+    >>> aig.cnf(aig.build(LogicParser().parse('a and (b or c)')))
+    [(a,), (b, c)]
+    '''
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self, prefix='$a'):
+        ## nodes[n] is None for the constant, the atom name for an input
+        ## and the pair of child literals for an and node
+        self.nodes = [None]
+        self.unique = {}
+        self.inputs = {}
+        self.prefix = prefix
+
+    def __len__(self):
+        ''' Number of and nodes. '''
+        return len(self.unique)
+
+    def atom(self, name):
+        ''' The literal of an atom, adding an input node for new names. '''
+        if name not in self.inputs:
+            self.inputs[name] = 2 * len(self.nodes)
+            self.nodes.append(name)
+        return self.inputs[name]
+
+    def negate(self, a):
+        return a ^ 1
+
+    def children(self, a):
+        ''' The two child literals of the node of a if it is an and node, else None. '''
+        node = self.nodes[a >> 1]
+        return node if isinstance(node, tuple) else None
+
+    def conj(self, a, b):
+        ''' The literal of a and b. '''
+        if a > b:
+            a, b = b, a
+        if a == AIG.FALSE or a == b ^ 1:
+            return AIG.FALSE
+        if a == AIG.TRUE or a == b:
+            return b
+        for p, q in [(a, b), (b, a)]:
+            kids = self.children(p)
+            if kids is None:
+                continue
+            x, y = kids
+            other = self.children(q)
+            if p & 1 == 0:
+                ## p = x and y
+                if q ^ 1 in kids:
+                    return AIG.FALSE
+                if q in kids:
+                    return p
+                if other is not None and q & 1 == 0:
+                    if any(z ^ 1 in kids for z in other):
+                        return AIG.FALSE
+                if other is not None and q & 1 == 1:
+                    ## q = ~(z and w): true if z or w contradicts p, and
+                    ## ~w if p already has z
+                    z, w = other
+                    if z ^ 1 in kids or w ^ 1 in kids:
+                        return p
+                    if z in kids:
+                        return self.conj(p, w ^ 1)
+                    if w in kids:
+                        return self.conj(p, z ^ 1)
+            else:
+                ## p = ~(x and y)
+                if q ^ 1 in kids:
+                    return q
+                if q == x:
+                    return self.conj(q, y ^ 1)
+                if q == y:
+                    return self.conj(q, x ^ 1)
+                if other is not None and q & 1 == 1:
+                    ## ~(x and y) and ~(x and ~y) is ~x
+                    z, w = other
+                    for s, t, u, v in [(x, y, z, w), (x, y, w, z), (y, x, z, w), (y, x, w, z)]:
+                        if s == u and t == v ^ 1:
+                            return s ^ 1
+        key = (a, b)
+        if key not in self.unique:
+            self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return 2 * self.unique[key]
+
+    def disj(self, a, b):
+        return self.conj(a ^ 1, b ^ 1) ^ 1
+
+    def iff(self, a, b):
+        return self.disj(self.conj(a, b), self.conj(a ^ 1, b ^ 1))
+
+    def build(self, expr):
+        '''
+        The literal of an Expression. Subexpressions are visited children
+        first with an explicit stack, and each distinct one only once.
+        '''
+        built = {}
+        stack = [(expr, False)]
+        while stack:
+            s, ready = stack.pop()
+            if s in built:
+                continue
+            if not ready and s.op in Logic.OPS:
+                stack.append((s, True))
+                stack.extend((arg, False) for arg in reversed(s.args))
+                continue
+            built[s] = self.combine(s, [built[arg] for arg in s.args])
+        return built[expr]
+
+    def combine(self, s, args):
+        ## the literal of s from the literals of its arguments
+        if s.op == 'True':
+            return AIG.TRUE
+        if s.op == 'False':
+            return AIG.FALSE
+        if s.op not in Logic.OPS:
+            return self.atom(s.op)
+        if s.op in Logic.CARDINALITY:
+            ## least[j]: at least j of the arguments so far are true
+            least = [AIG.TRUE] + [AIG.FALSE] * (max(s.k, 0) + 1)
+            for arg in args:
+                for j in range(len(least) - 1, 0, -1):
+                    least[j] = self.disj(least[j], self.conj(least[j - 1], arg))
+            return cardinality_value(s.op, s.k, least, AIG.TRUE, AIG.FALSE, self.negate, self.conj)
+        if s.op == 'not':
+            return args[0] ^ 1
+        if s.op == 'implies':
+            return self.disj(args[0] ^ 1, args[1])
+        if s.op == 'iff':
+            return self.iff(args[0], args[1])
+        result = args[0]
+        for arg in args[1:]:
+            result = self.conj(result, arg) if s.op == 'and' else self.disj(result, arg)
+        return result
+
+    def conjuncts(self, a):
+        ''' The literals whose conjunction a is, through any depth of and nodes. '''
+        result = []
+        seen = set()
+        stack = [a]
+        while stack:
+            b = stack.pop()
+            if b in seen:
+                continue
+            seen.add(b)
+            kids = self.children(b)
+            if kids is not None and b & 1 == 0:
+                stack.append(kids[1])
+                stack.append(kids[0])
+            else:
+                result.append(b)
+        return result
+
+    def literal(self, a):
+        ''' The literal Expression standing for a: its atom, or the auxiliary atom of its node. '''
+        node = self.nodes[a >> 1]
+        atom = Expression(node if isinstance(node, str) else '%s%d' % (self.prefix, a >> 1))
+        return Expression('not', atom) if a & 1 else atom
+
+    def cnf(self, a):
+        '''
+        Clauses (tuples of literal Expressions) that hold exactly when a
+        does, given the definitions of the auxiliary atoms, which are among
+        the clauses. The conjuncts of a are asserted one by one, and a
+        negated and node as the clause of its negated conjuncts, so a
+        formula that already is in CNF gets no auxiliary atoms.
+        '''
+        clauses = []
+        defined = set()
+        pending = []
+        def use(b):
+            if self.children(b) is not None and b >> 1 not in defined:
+                defined.add(b >> 1)
+                pending.append(b >> 1)
+            return self.literal(b)
+        for b in self.conjuncts(a):
+            if b == AIG.TRUE:
+                continue
+            if b == AIG.FALSE:
+                clauses.append(())
+            elif self.children(b) is None:
+                clauses.append((use(b),))
+            else:
+                literals = [c ^ 1 for c in self.conjuncts(b ^ 1)]
+                if any(c ^ 1 in literals for c in literals):
+                    continue
+                clauses.append(tuple(use(c) for c in literals))
+        while pending:
+            node = pending.pop()
+            v = self.literal(2 * node)
+            x, y = self.nodes[node]
+            lx, ly = use(x), use(y)
+            not_v, not_x, not_y = self.literal(2 * node + 1), self.literal(x ^ 1), self.literal(y ^ 1)
+            clauses.extend([(not_v, lx), (not_v, ly), (v, not_x, not_y)])
+        return clauses
@@ -0,0 +1,347 @@
+from LogicParser import *
+
+def force_order(clauses, atoms=None, iterations=20):
+    '''
+    Computes a variable order for a list of clauses (sets of literal
+    Expressions) with the FORCE heuristic: every atom is moved to the
+    average "center of gravity" of the clauses it appears in, which pulls
+    atoms that share clauses close together. Returns a list of atom names.
+    '''
+    if atoms is None:
+        atoms = []
+    atoms = list(atoms)
+    seen = set(atoms)
+    clause_atoms = []
+    for clause in clauses:
+        names = []
+        for literal in clause:
+            name = literal.args[0].op if literal.op == 'not' else literal.op
+            names.append(name)
+            if name not in seen:
+                seen.add(name)
+                atoms.append(name)
+        clause_atoms.append(names)
+    position = dict((name, i) for i, name in enumerate(atoms))
+    best_span = None
+    for i in range(iterations):
+        total = dict((name, 0.0) for name in atoms)
+        count = dict((name, 0) for name in atoms)
+        span = 0
+        for names in clause_atoms:
+            if names == []:
+                continue
+            places = [position[name] for name in names]
+            span += max(places) - min(places)
+            center = sum(places) / len(places)
+            for name in names:
+                total[name] += center
+                count[name] += 1
+        if best_span is not None and span >= best_span:
+            break
+        best_span = span
+        order = sorted(atoms, key=lambda name: (total[name] / count[name] if count[name]
+                                                else position[name]))
+        position = dict((name, i) for i, name in enumerate(order))
+    return sorted(atoms, key=lambda name: position[name])
+
+class BDD:
+    '''
+    A reduced ordered binary decision diagram (ROBDD) manager. Nodes are
+    integers; 0 and 1 are the constants False and True, and every other
+    node is a (level, low, high) triple stored once in a unique table, so
+    two equivalent functions are always the same node.
+
+    The KB is compiled into a single node, root. Adding clauses conjoins
+    them into root; afterwards entailment of a clause, consistency and
+    model counting take time polynomial in the size of the diagram.
+
+    Nodes are never freed one by one. A query's nodes are dropped when it
+    is answered (see entails), and add_clauses() calls collect() to drop
+    the intermediate ones once the node list has doubled.
+
+    >>> bdd = BDD(['a', 'b'])
+    >>> bdd.add_clauses([{~a, b}])
+    >>> bdd.entails(LogicParser().parse('~b -> ~a'))
+    True
+    >>> bdd.count_models()
+    3
+    '''
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self, order=None):
+        ## nodes[i] = (level, low, high); the terminals sit below every level
+        self.nodes = [(None, None, None), (None, None, None)]
+        self.unique = {}
+        self.cache = {}
+        self.order = []
+        self.level = {}
+        for name in (order or []):
+            self.add_atom(name)
+        self.root = BDD.TRUE
+        ## the number of nodes left by the last collect()
+        self.live = len(self.nodes)
+
+    def __len__(self):
+        ''' Number of nodes reachable from the root. '''
+        seen = set()
+        stack = [self.root]
+        while stack:
+            u = stack.pop()
+            if u in seen:
+                continue
+            seen.add(u)
+            if u > 1:
+                stack.append(self.nodes[u][1])
+                stack.append(self.nodes[u][2])
+        return len(seen)
+
+    def add_atom(self, name):
+        ''' Returns the level of an atom, placing new atoms at the bottom. '''
+        if name not in self.level:
+            self.level[name] = len(self.order)
+            self.order.append(name)
+        return self.level[name]
+
+    def node_level(self, u):
+        if u <= 1:
+            return len(self.order)
+        return self.nodes[u][0]
+
+    def mk(self, level, low, high):
+        if low == high:
+            return low
+        key = (level, low, high)
+        if key not in self.unique:
+            self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.unique[key]
+
+    def var(self, name, positive=True):
+        level = self.add_atom(name)
+        if positive:
+            return self.mk(level, BDD.FALSE, BDD.TRUE)
+        return self.mk(level, BDD.TRUE, BDD.FALSE)
+
+    def negate(self, u):
+        '''
+        The diagram of ~u. Nodes are visited children first with an
+        explicit stack, so diagrams of any depth can be negated (likewise
+        in apply() and build()).
+        '''
+        stack = [u]
+        while stack:
+            w = stack[-1]
+            if self.negated(w) is not None:
+                stack.pop()
+                continue
+            level, low, high = self.nodes[w]
+            nlow, nhigh = self.negated(low), self.negated(high)
+            if nlow is None or nhigh is None:
+                stack.extend(x for x in (low, high) if self.negated(x) is None)
+                continue
+            stack.pop()
+            self.cache[('not', w)] = self.mk(level, nlow, nhigh)
+        return self.negated(u)
+
+    def negated(self, u):
+        ## ~u if it is known without work, else None
+        if u <= 1:
+            return 1 - u
+        return self.cache.get(('not', u))
+
+    def apply(self, op, u, v):
+        '''
+        Combines two diagrams with 'and' or 'or' (Bryant's apply).
+        '''
+        stack = [(u, v)]
+        while stack:
+            w, x = stack[-1]
+            if self.applied(op, w, x) is not None:
+                stack.pop()
+                continue
+            lw, lx = self.node_level(w), self.node_level(x)
+            level = min(lw, lx)
+            w0, w1 = (self.nodes[w][1], self.nodes[w][2]) if lw == level else (w, w)
+            x0, x1 = (self.nodes[x][1], self.nodes[x][2]) if lx == level else (x, x)
+            low, high = self.applied(op, w0, x0), self.applied(op, w1, x1)
+            if low is None or high is None:
+                if low is None:
+                    stack.append((w0, x0))
+                if high is None:
+                    stack.append((w1, x1))
+                continue
+            stack.pop()
+            ## both operators are commutative; halve the cache
+            self.cache[(op, min(w, x), max(w, x))] = self.mk(level, low, high)
+        return self.applied(op, u, v)
+
+    def applied(self, op, u, v):
+        ## u op v if it is a terminal case or cached, else None
+        if op == 'and':
+            if u == BDD.FALSE or v == BDD.FALSE: return BDD.FALSE
+            if u == BDD.TRUE: return v
+            if v == BDD.TRUE or u == v: return u
+        else:
+            if u == BDD.TRUE or v == BDD.TRUE: return BDD.TRUE
+            if u == BDD.FALSE: return v
+            if v == BDD.FALSE or u == v: return u
+        return self.cache.get((op, min(u, v), max(u, v)))
+
+    def clause(self, clause):
+        '''
+        Builds the diagram of a clause (a set of literal Expressions)
+        directly, bottom-up, without going through apply().
+        '''
+        literals = {}
+        for literal in clause:
+            if literal.op == 'not':
+                level, positive = self.add_atom(literal.args[0].op), False
+            else:
+                level, positive = self.add_atom(literal.op), True
+            if literals.get(level, positive) != positive:
+                ## contains both a and ~a
+                return BDD.TRUE
+            literals[level] = positive
+        u = BDD.FALSE
+        for level in sorted(literals, reverse=True):
+            if literals[level]:
+                u = self.mk(level, u, BDD.TRUE)
+            else:
+                u = self.mk(level, BDD.TRUE, u)
+        return u
+
+    def add_clauses(self, clauses):
+        '''
+        Conjoins clauses into the compiled KB. Clauses over the deepest
+        variables go first, which keeps intermediate diagrams small.
+        '''
+        nodes = [self.clause(clause) for clause in clauses]
+        nodes.sort(key=self.node_level, reverse=True)
+        for u in nodes:
+            self.root = self.apply('and', self.root, u)
+        if len(self.nodes) > 2 * self.live + 1000 or len(self.cache) > 1000000:
+            self.collect()
+
+    def collect(self):
+        '''
+        Garbage collection: keeps only the nodes reachable from root,
+        renumbered in their old order (children always come before their
+        parents), and empties the cache.
+        '''
+        reachable = set()
+        stack = [self.root]
+        while stack:
+            u = stack.pop()
+            if u <= 1 or u in reachable:
+                continue
+            reachable.add(u)
+            stack.append(self.nodes[u][1])
+            stack.append(self.nodes[u][2])
+        renumber = {BDD.FALSE: BDD.FALSE, BDD.TRUE: BDD.TRUE}
+        nodes = self.nodes[:2]
+        self.unique = {}
+        for u in sorted(reachable):
+            level, low, high = self.nodes[u]
+            key = (level, renumber[low], renumber[high])
+            renumber[u] = len(nodes)
+            self.unique[key] = len(nodes)
+            nodes.append(key)
+        self.nodes = nodes
+        self.root = renumber[self.root]
+        self.cache = {}
+        self.live = len(self.nodes)
+
+    def build(self, expr):
+        '''
+        Builds the diagram of an arbitrary Expression; no CNF conversion is
+        needed.
+        '''
+        built = {}
+        stack = [(expr, False)]
+        while stack:
+            s, ready = stack.pop()
+            if s in built:
+                continue
+            if not ready and s.op in Logic.OPS:
+                stack.append((s, True))
+                stack.extend((arg, False) for arg in reversed(s.args))
+                continue
+            built[s] = self.combine(s, [built[arg] for arg in s.args])
+        return built[expr]
+
+    def combine(self, expr, args):
+        ## the diagram of expr from the diagrams of its arguments
+        if expr.op == 'True':
+            return BDD.TRUE
+        if expr.op == 'False':
+            return BDD.FALSE
+        if expr.op not in Logic.OPS:
+            return self.var(expr.op)
+        if expr.op in Logic.CARDINALITY:
+            ## least[j]: at least j of the arguments so far are true
+            least = [BDD.TRUE] + [BDD.FALSE] * (max(expr.k, 0) + 1)
+            for arg in args:
+                for j in range(len(least) - 1, 0, -1):
+                    least[j] = self.apply('or', least[j], self.apply('and', least[j - 1], arg))
+            return cardinality_value(expr.op, expr.k, least, BDD.TRUE, BDD.FALSE,
+                                     self.negate, lambda u, v: self.apply('and', u, v))
+        if expr.op == 'not':
+            return self.negate(args[0])
+        if expr.op == 'implies':
+            return self.apply('or', self.negate(args[0]), args[1])
+        if expr.op == 'iff':
+            both = self.apply('and', args[0], args[1])
+            neither = self.apply('and', self.negate(args[0]), self.negate(args[1]))
+            return self.apply('or', both, neither)
+        result = args[0]
+        for arg in args[1:]:
+            result = self.apply(expr.op, result, arg)
+        return result
+
+    def entails(self, expr):
+        '''
+        Returns True if every model of the compiled KB satisfies expr.
+        The root does not change, so the nodes, atoms and cache entries the
+        query added are dropped again afterwards: a stream of queries does
+        not make the diagram grow.
+        '''
+        mark, atoms = len(self.nodes), len(self.order)
+        counter = self.apply('and', self.root, self.negate(self.build(expr)))
+        for key in self.nodes[mark:]:
+            del self.unique[key]
+        del self.nodes[mark:]
+        for name in self.order[atoms:]:
+            del self.level[name]
+        del self.order[atoms:]
+        self.cache = {}
+        return counter == BDD.FALSE
+
+    def consistent(self):
+        return self.root != BDD.FALSE
+
+    def count_models(self, u=None):
+        '''
+        Counts the assignments to all atoms known to the diagram that
+        satisfy node u (the compiled KB by default).
+        '''
+        if u is None:
+            u = self.root
+        counts = {BDD.FALSE: 0, BDD.TRUE: 1}
+        ## visit nodes children first, without recursion
+        stack = [u]
+        while stack:
+            w = stack[-1]
+            if w in counts:
+                stack.pop()
+                continue
+            level, low, high = self.nodes[w]
+            if low in counts and high in counts:
+                stack.pop()
+                counts[w] = (counts[low] * 2 ** (self.node_level(low) - level - 1) +
+                             counts[high] * 2 ** (self.node_level(high) - level - 1))
+            else:
+                stack.append(low)
+                stack.append(high)
+        ## atoms above the top node are free
+        return counts[u] * 2 ** self.node_level(u)
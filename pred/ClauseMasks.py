@@ -0,0 +1,105 @@
+from LogicParser import *
+import heapq
+
+## A clause in mask form is a pair of Python integers (pos, neg): bit i of
+## pos is set if atom number i (from an AtomIndex) occurs in the clause, bit i
+## of neg if its negation does. Masks are hashable, so duplicate clauses are
+## found with a set, and resolution only needs a few bit operations.
+
+def clause_to_mask(clause, atoms):
+    '''
+    Converts a clause in set form to a (pos, neg) mask pair.
+    Example usage:
+
+    >>> clause_to_mask({a, ~b}, atoms)      # a is atom 1, b is atom 2
+    (2, 4)
+    '''
+    pos = 0
+    neg = 0
+    for literal in clause:
+        if literal.op == 'not':
+            neg |= 1 << atoms.index(literal.args[0].op)
+        else:
+            pos |= 1 << atoms.index(literal.op)
+    return (pos, neg)
+
+def mask_to_clause(mask, atoms):
+    ''' Converts a (pos, neg) mask pair back to a clause in set form. '''
+    clause = set()
+    for sign, bits in ((1, mask[0]), (-1, mask[1])):
+        i = 0
+        while bits:
+            if bits & 1:
+                clause.add(atoms.literal(sign * i))
+            bits >>= 1
+            i += 1
+    return clause
+
+def mask_length(mask):
+    ''' Number of literals in a clause mask. '''
+    return bin(mask[0]).count('1') + bin(mask[1]).count('1')
+
+def is_tautology_mask(mask):
+    return mask[0] & mask[1] != 0
+
+def subsumes(mask1, mask2):
+    '''
+    True if clause 1 subsumes clause 2, i.e. its literals are a subset of
+    clause 2's, which makes clause 2 redundant.
+    '''
+    return mask1[0] & ~mask2[0] == 0 and mask1[1] & ~mask2[1] == 0
+
+def resolve_masks(mask1, mask2):
+    '''
+    Returns the resolvent of two clause masks, or None if they do not
+    resolve or every resolvent is a tautology.
+
+    The complementary pairs are (pos1 & neg2) | (neg1 & pos2). With none
+    there is nothing to resolve on, and with two or more, cancelling one
+    pair leaves the other in the resolvent, which is then a tautology. So
+    only clauses clashing in exactly one atom produce a useful resolvent.
+    Example usage:
+
+    >>> resolve_masks((0b10, 0b100), (0b100, 0b1000))     # {a, ~b}, {b, ~c}
+    (2, 8)                                                 # {a, ~c}
+    '''
+    clash = (mask1[0] & mask2[1]) | (mask1[1] & mask2[0])
+    if clash == 0 or clash & (clash - 1):
+        return None
+    pos = (mask1[0] | mask2[0]) & ~clash
+    neg = (mask1[1] | mask2[1]) & ~clash
+    if pos & neg:
+        return None
+    return (pos, neg)
+
+def refute_masks(kb, support):
+    '''
+    Set of support resolution on clause masks: returns True if the clauses
+    in kb together with those in support are contradictory. Works like
+    KnowledgeBase.refute(), but picks the shortest unprocessed support
+    clause each time (so every pair is only resolved once) and drops
+    clauses subsumed by a clause that is already known.
+    '''
+    processed = []
+    seen = set(kb)
+    queue = []
+    for mask in support:
+        if mask == (0, 0):
+            return True
+        if mask not in seen and not is_tautology_mask(mask):
+            seen.add(mask)
+            heapq.heappush(queue, (mask_length(mask), mask))
+    while queue:
+        length, given = heapq.heappop(queue)
+        if any(subsumes(other, given) for other in processed if other != given):
+            continue
+        for other in kb + processed:
+            resolvent = resolve_masks(given, other)
+            if resolvent is None or resolvent in seen:
+                continue
+            if resolvent == (0, 0):
+                return True
+            seen.add(resolvent)
+            heapq.heappush(queue, (mask_length(resolvent), resolvent))
+        processed.append(given)
+    return False
@@ -0,0 +1,102 @@
+from LogicParser import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+## A clause matrix has one row per clause and one column per atom (column i
+## is atom number i + 1 of an AtomIndex). An entry is +1 if the atom occurs in
+## the clause, -1 if its negation does and 0 otherwise.
+
+def clauses_to_matrix(clauses, atoms, width=None):
+    '''
+    Builds the {-1, 0, +1} matrix of a list of clauses in set form,
+    leaving out tautologies.
+    Example usage:
+
+    >>> clauses_to_matrix([{a, ~b}, {b}], atoms)
+    array([[ 1, -1],
+           [ 0,  1]], dtype=int8)
+    '''
+    if np is None:
+        raise Exception("Error: the clause matrix engine requires numpy")
+    ints = []
+    for clause in clauses:
+        clause = set(atoms.to_int(literal) for literal in clause)
+        if not any(-n in clause for n in clause):
+            ## a tautology such as {a, ~a} has no row: it is always true
+            ints.append(clause)
+    if width is None:
+        ## indices read from a file may leave gaps, so the highest one sets
+        ## the width rather than the number of atoms
+        width = atoms.next_index - 1
+    matrix = np.zeros((len(ints), width), dtype=np.int8)
+    for row, clause in enumerate(ints):
+        for n in clause:
+            matrix[row, abs(n) - 1] = 1 if n > 0 else -1
+    return matrix
+
+def resolve_matrices(support, others):
+    '''
+    Computes all resolvents between the rows of support and the rows of
+    others in one go. P and N are the 0/1 matrices of positive and negative
+    entries; P_s N_o^T + N_s P_o^T counts the clashing atoms of every pair.
+    Pairs with exactly one clash resolve to a non-tautological clause, which
+    is simply the sign of the sum of the two rows (the clashing atom cancels
+    out, every other atom keeps its sign). Returns the resolvent rows.
+    '''
+    ps = (support > 0).astype(np.float32)
+    ns = (support < 0).astype(np.float32)
+    po = (others > 0).astype(np.float32)
+    no = (others < 0).astype(np.float32)
+    clashes = ps @ no.T + ns @ po.T
+    i, j = np.nonzero(clashes == 1)
+    return np.sign(support[i] + others[j]).astype(np.int8)
+
+def subsumed_rows(candidates, known):
+    '''
+    Returns a boolean vector marking the candidate rows that are subsumed by
+    (contain all literals of) some known row. The number of literals a known
+    row shares with a candidate is again a matrix product, and a candidate is
+    subsumed when that equals the length of the known row.
+    '''
+    pc = (candidates > 0).astype(np.float32)
+    nc = (candidates < 0).astype(np.float32)
+    pk = (known > 0).astype(np.float32)
+    nk = (known < 0).astype(np.float32)
+    shared = pk @ pc.T + nk @ nc.T
+    lengths = (known != 0).sum(axis=1).astype(np.float32)
+    return (shared == lengths[:, None]).any(axis=0)
+
+def refute_matrix(kb, support, block_rows=256):
+    '''
+    Set of support saturation on clause matrices: returns True if the
+    clauses of kb and support together are contradictory. Each round resolves
+    the clauses found in the previous round against everything known so
+    far, block_rows support rows at a time, and keeps the distinct new rows
+    that are not subsumed by a known clause.
+    '''
+    known = np.vstack([kb, support])
+    seen = set(row.tobytes() for row in known)
+    fresh = np.unique(support, axis=0)
+    while len(fresh) > 0:
+        if not fresh.any(axis=1).all():
+            ## some clause is empty
+            return True
+        found = []
+        for start in range(0, len(fresh), block_rows):
+            found.append(resolve_matrices(fresh[start:start + block_rows], known))
+        candidates = np.unique(np.vstack(found), axis=0)
+        candidates = np.array([row for row in candidates if row.tobytes() not in seen],
+                              dtype=np.int8).reshape(-1, known.shape[1])
+        if len(candidates) == 0:
+            return False
+        if not candidates.any(axis=1).all():
+            return True
+        ## drop new clauses that say no more than one we already have
+        fresh = candidates[~subsumed_rows(candidates, known)]
+        for row in candidates:
+            seen.add(row.tobytes())
+        known = np.vstack([known, fresh])
+    return False
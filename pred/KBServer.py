@@ -0,0 +1,366 @@
+from KnowledgeBase import *
+import json
+import os
+import queue
+import selectors
+import signal
+import socket
+import struct
+import sys
+
+## The protocol: a client sends frames, each a 4-byte big-endian length
+## followed by that many bytes of JSON, and gets one frame back for every
+## frame it sent, in the same order. A request frame is a batch, a list of
+## operations [op, kb name, arguments...]:
+##   ["tell", "rules", "a -> b"]              -> handle
+##   ["ask", "rules", "a -> c", "auto"]        -> true, false or null
+##   ["unlearn", "rules", "a -> b" or handle]  -> null
+##   ["count_models", "rules", extra or null]  -> number
+##   ["clear", "rules"], ["drop", "rules"]     -> null
+##   ["names"]                                 -> list of KB names
+##   ["shutdown"]                              -> null, then the server stops
+## The response is the list of results, [true, value] for every operation
+## that worked and [false, message] for one that raised an exception. A KB
+## is created the first time a batch names it. Frames can be pipelined:
+## a client may send any number before reading the responses.
+
+MAX_FRAME = 64 * 1024 * 1024
+
+def encode_frame(message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return struct.pack('>I', len(data)) + data
+
+def read_frame(sock):
+    ''' Reads one frame from a blocking socket and returns its message. '''
+    header = read_exactly(sock, 4)
+    return json.loads(read_exactly(sock, struct.unpack('>I', header)[0]).decode('utf-8'))
+
+def read_exactly(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise Exception("Error: the KB server closed the connection")
+        data += chunk
+    return bytes(data)
+
+class KBServer:
+    '''
+    A long-lived process that owns named KnowledgeBases and answers
+    batches of operations on them over a Unix socket (see the protocol
+    above), so that short jobs do not have to import the modules and tell
+    every rule again each time they run.
+
+    The server is a single thread with a selector over all connections:
+    batches are run one at a time in the order they arrive, so the
+    KnowledgeBases need no locking, while any number of clients stay
+    connected. Responses are queued per connection and written as the
+    socket accepts them, so a client that pipelines many frames before
+    reading never blocks the server. A frame longer than MAX_FRAME closes
+    its connection.
+    Example usage:
+
+    >>> server = KBServer('/tmp/kb.sock')
+    >>> server.kb('rules').tell('a -> b')
+    1
+    >>> server.serve_forever()
+    '''
+    def __init__(self, path, encoding='tree'):
+        self.path = path
+        self.encoding = encoding
+        self.kbs = {}
+        self.running = False
+        self.batches = 0
+        if os.path.exists(path):
+            ## a socket file left behind by a server that is gone
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+            else:
+                raise Exception("Error: a server is already listening on " + path)
+            finally:
+                probe.close()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        os.chmod(path, 0o600)
+        self.listener.listen(64)
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        ## connection -> [bytes received, bytes to send]
+        self.buffers = {}
+
+    def kb(self, name):
+        ''' The KnowledgeBase called name, created if needed. '''
+        if name not in self.kbs:
+            self.kbs[name] = KnowledgeBase(encoding=self.encoding)
+        return self.kbs[name]
+
+    def load(self, name, path):
+        '''
+        Tells a KB every formula of a file, one per line (blank lines and
+        lines starting with # are skipped), or reads a DIMACS file (.cnf).
+        Returns the number of entries read: formulas told, or clauses for a
+        DIMACS file (see KnowledgeBase.read_dimacs).
+        '''
+        kb = self.kb(name)
+        if path.endswith('.cnf'):
+            return kb.read_dimacs(path)
+        count = 0
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    kb.tell(line)
+                    count += 1
+        return count
+
+    def serve_forever(self, poll_interval=0.5):
+        ''' Answers requests until shutdown() or a "shutdown" operation. '''
+        self.running = True
+        try:
+            while self.running:
+                for key, events in self.selector.select(poll_interval):
+                    if key.fileobj is self.listener:
+                        self.accept()
+                        continue
+                    if events & selectors.EVENT_READ:
+                        self.receive(key.fileobj)
+                    if events & selectors.EVENT_WRITE and key.fileobj in self.buffers:
+                        self.send(key.fileobj)
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self.running = False
+
+    def accept(self):
+        try:
+            conn, address = self.listener.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.buffers[conn] = [bytearray(), bytearray()]
+        self.selector.register(conn, selectors.EVENT_READ, None)
+
+    def drop(self, conn):
+        self.selector.unregister(conn)
+        del self.buffers[conn]
+        conn.close()
+
+    def receive(self, conn):
+        try:
+            data = conn.recv(1 << 16)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(conn)
+            return
+        incoming, outgoing = self.buffers[conn]
+        incoming += data
+        while len(incoming) >= 4:
+            size = struct.unpack('>I', bytes(incoming[:4]))[0]
+            if size > MAX_FRAME:
+                self.drop(conn)
+                return
+            if len(incoming) < 4 + size:
+                break
+            frame = bytes(incoming[4:4 + size])
+            del incoming[:4 + size]
+            outgoing += encode_frame(self.handle(frame))
+        self.send(conn)
+
+    def send(self, conn):
+        outgoing = self.buffers[conn][1]
+        try:
+            sent = conn.send(outgoing) if outgoing else 0
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.drop(conn)
+            return
+        del outgoing[:sent]
+        ## only wait for the socket to become writable while there is
+        ## something left to write
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if outgoing else 0)
+        self.selector.modify(conn, events, None)
+
+    def handle(self, frame):
+        ''' Runs a batch (a frame's bytes) and returns its list of results. '''
+        try:
+            batch = json.loads(frame.decode('utf-8'))
+        except ValueError:
+            return [[False, "Error: a request must be JSON"]]
+        if not isinstance(batch, list):
+            return [[False, "Error: a request must be a list of operations"]]
+        self.batches += 1
+        results = []
+        for operation in batch:
+            try:
+                results.append([True, self.run(operation)])
+            except Exception as e:
+                results.append([False, str(e)])
+        return results
+
+    def run(self, operation):
+        if not isinstance(operation, list) or operation == []:
+            raise Exception("Error: an operation must be a list [op, kb, arguments...]")
+        op, args = operation[0], operation[1:]
+        if op == 'names':
+            return sorted(self.kbs)
+        if op == 'shutdown':
+            self.running = False
+            return None
+        if len(args) == 0 or not isinstance(args[0], str):
+            raise Exception("Error: %s needs the name of a KB" % op)
+        name, args = args[0], args[1:]
+        if op == 'drop':
+            self.kbs.pop(name, None)
+            return None
+        kb = self.kb(name)
+        if op == 'tell':
+            return kb.tell(*args)
+        if op == 'ask':
+            return kb.ask(*args)
+        if op == 'unlearn':
+            kb.unlearn(*args)
+            return None
+        if op == 'count_models':
+            return kb.count_models(*args)
+        if op == 'clear':
+            kb.clear()
+            return None
+        raise Exception("Error: unknown operation " + str(op))
+
+    def close(self):
+        ''' Closes every connection and removes the socket file. '''
+        for conn in list(self.buffers):
+            self.drop(conn)
+        if self.listener is not None:
+            self.selector.unregister(self.listener)
+            self.listener.close()
+            self.listener = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        self.selector.close()
+
+class KBClient:
+    '''
+    The client side of KBServer. Connections are kept in a pool and
+    reused, so a call costs one round trip on an open connection; several
+    threads can share a client, each using its own connection. batch()
+    sends many operations in one frame, and pipeline() sends many frames
+    before reading any response.
+    Example usage:
+
+    >>> client = KBClient('/tmp/kb.sock')
+    >>> client.tell('b -> c', kb='rules')
+    2
+    >>> client.batch([['ask', 'rules', 'a -> c'], ['ask', 'rules', 'c -> a']])
+    [True, False]
+    >>> client.close()
+    '''
+    def __init__(self, path, pool_size=4, timeout=None):
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pool = queue.LifoQueue()
+
+    def connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
+        conn.connect(self.path)
+        return conn
+
+    def pipeline(self, batches):
+        '''
+        Sends every batch (a list of operations, see the protocol) as its
+        own frame, then reads the responses. Returns the results of each
+        batch; an operation that failed on the server raises an Exception
+        with its message here, after all batches have been run.
+        '''
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            conn.sendall(b''.join(encode_frame(batch) for batch in batches))
+            responses = [read_frame(conn) for batch in batches]
+        except BaseException:
+            ## the connection may be half way through a frame
+            conn.close()
+            raise
+        if self.pool.qsize() < self.pool_size:
+            self.pool.put(conn)
+        else:
+            conn.close()
+        results = []
+        for response in responses:
+            for ok, value in response:
+                if not ok:
+                    raise Exception(value)
+            results.append([value for ok, value in response])
+        return results
+
+    def batch(self, operations):
+        ''' Runs a list of operations in one round trip and returns their results. '''
+        return self.pipeline([operations])[0]
+
+    def call(self, *operation):
+        return self.batch([[arg if isinstance(arg, (str, int)) or arg is None else str(arg)
+                            for arg in operation]])[0]
+
+    def tell(self, expr, kb='default'):
+        return self.call('tell', kb, expr)
+
+    def ask(self, expr, kb='default', engine='auto'):
+        return self.call('ask', kb, expr, engine)
+
+    def unlearn(self, expr, kb='default'):
+        return self.call('unlearn', kb, expr)
+
+    def count_models(self, extra=None, kb='default'):
+        return self.call('count_models', kb, extra)
+
+    def clear(self, kb='default'):
+        return self.call('clear', kb)
+
+    def drop(self, kb='default'):
+        return self.call('drop', kb)
+
+    def names(self):
+        return self.call('names')
+
+    def shutdown(self):
+        return self.call('shutdown')
+
+    def close(self):
+        ''' Closes the pooled connections. '''
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+if __name__ == '__main__':
+    ## python KBServer.py socket [--load name=rules.txt]... [--encoding aig]
+    args = sys.argv[1:]
+    if not args:
+        print('usage: python KBServer.py socket [--load name=rules.txt]... [--encoding aig]')
+        sys.exit(1)
+    encoding = args[args.index('--encoding') + 1] if '--encoding' in args else 'tree'
+    server = KBServer(args[0], encoding=encoding)
+    for i, arg in enumerate(args):
+        if arg == '--load':
+            name, path = args[i + 1].split('=', 1)
+            unit = 'clauses' if path.endswith('.cnf') else 'formulas'
+            print('%s: %d %s from %s' % (name, server.load(name, path), unit, path))
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
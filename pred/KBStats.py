@@ -0,0 +1,116 @@
+class KBStats:
+    '''
+    Statistics about the shape of a clause store, kept up to date one clause
+    at a time as clauses are added and removed, so they cost nothing to read
+    when planning a query: the number of atoms, a histogram of clause
+    lengths, how many clauses are Horn (at most one positive literal) or
+    2-CNF (at most two literals), and the connected components of atoms
+    that share clauses.
+
+    Components are tracked with union-find, which cannot split a component
+    again, so after removals they may be larger than necessary (never
+    smaller).
+
+    >>> stats = KBStats([{a, ~b}, {c}])
+    >>> stats.atoms(), stats.horn_fraction(), stats.component_sizes()
+    (3, 1.0, [(2, 1), (1, 1)])
+    '''
+    def __init__(self, clauses=()):
+        self.clauses = 0
+        self.lengths = {}
+        self.horn = 0
+        self.binary = 0
+        self.occurrences = {}
+        self.parent = {}
+        ## component root -> [atoms, clauses]
+        self.components = {}
+        for clause in clauses:
+            self.add(clause)
+
+    def find(self, atom):
+        root = atom
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[atom] != root:
+            self.parent[atom], atom = root, self.parent[atom]
+        return root
+
+    def add(self, clause):
+        names = self.names(clause)
+        self.clauses += 1
+        self.lengths[len(clause)] = self.lengths.get(len(clause), 0) + 1
+        if sum(1 for literal in clause if literal.op != 'not') <= 1:
+            self.horn += 1
+        if len(clause) <= 2:
+            self.binary += 1
+        root = None
+        for name in names:
+            self.occurrences[name] = self.occurrences.get(name, 0) + 1
+            if name not in self.parent:
+                self.parent[name] = name
+                self.components[name] = [1, 0]
+            other = self.find(name)
+            if root is None:
+                root = other
+            elif other != root:
+                ## join the smaller component into the larger one
+                if self.components[other][0] > self.components[root][0]:
+                    root, other = other, root
+                self.parent[other] = root
+                size = self.components.pop(other)
+                self.components[root][0] += size[0]
+                self.components[root][1] += size[1]
+        if root is not None:
+            self.components[root][1] += 1
+
+    def remove(self, clause):
+        names = self.names(clause)
+        self.clauses -= 1
+        self.lengths[len(clause)] -= 1
+        if self.lengths[len(clause)] == 0:
+            del self.lengths[len(clause)]
+        if sum(1 for literal in clause if literal.op != 'not') <= 1:
+            self.horn -= 1
+        if len(clause) <= 2:
+            self.binary -= 1
+        for name in names:
+            self.occurrences[name] -= 1
+            if self.occurrences[name] == 0:
+                del self.occurrences[name]
+        if names:
+            self.components[self.find(names[0])][1] -= 1
+
+    def names(self, clause):
+        names = []
+        for literal in clause:
+            name = literal.args[0].op if literal.op == 'not' else literal.op
+            if name not in names:
+                names.append(name)
+        return names
+
+    def atoms(self):
+        ''' Number of distinct atoms in the clauses. '''
+        return len(self.occurrences)
+
+    def horn_fraction(self):
+        return self.horn / self.clauses if self.clauses else 1.0
+
+    def binary_fraction(self):
+        return self.binary / self.clauses if self.clauses else 1.0
+
+    def component_sizes(self):
+        '''
+        Returns (atoms, clauses) for every component that still has clauses,
+        largest first.
+        '''
+        return sorted((tuple(size) for size in self.components.values() if size[1] > 0),
+                      reverse=True)
+
+    def summary(self):
+        ''' A short description of the statistics, for explain(). '''
+        sizes = self.component_sizes()
+        return ('%d clauses over %d atoms; lengths %s; Horn %.0f%%, 2-CNF %.0f%%; '
+                '%d components, largest %s atoms' %
+                (self.clauses, self.atoms(), dict(sorted(self.lengths.items())),
+                 100 * self.horn_fraction(), 100 * self.binary_fraction(),
+                 len(sizes), sizes[0][0] if sizes else 0))
@@ -0,0 +1,89 @@
+class LemmaStore:
+    '''
+    A bounded store of clauses that follow from the knowledge base alone
+    ("lemmas"), kept across calls to ask() so that later queries can use
+    them directly instead of deriving them again.
+
+    Every lemma carries an activity score that is bumped each time the lemma
+    takes part in a resolution. Scores decay geometrically from one query to
+    the next (by growing the bump increment instead of touching every score),
+    and when the store is full the least active, longest lemma is evicted.
+    Only clauses of at most max_length literals are accepted.
+
+    >>> store = LemmaStore(capacity=2)
+    >>> store.add({a})
+    True
+    >>> store.clauses()
+    [{a}]
+    '''
+    def __init__(self, capacity=1000, max_length=3, decay=0.95):
+        self.capacity = capacity
+        self.max_length = max_length
+        self.decay_factor = decay
+        self.increment = 1.0
+        self.activity = {}
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.activity)
+
+    def __contains__(self, clause):
+        return frozenset(clause) in self.activity
+
+    def clear(self):
+        ''' Forgets all lemmas, e.g. after the KB lost a clause. '''
+        self.activity = {}
+        self.increment = 1.0
+
+    def forget(self, test):
+        '''
+        Drops the lemmas (frozensets of literals) for which test returns
+        True, e.g. those that may depend on a clause the KB lost.
+        '''
+        for key in [key for key in self.activity if test(key)]:
+            del self.activity[key]
+
+    def clauses(self):
+        '''
+        Returns all lemmas as clause sets, shortest first.
+        '''
+        return [set(key) for key in sorted(self.activity, key=len)]
+
+    def add(self, clause):
+        '''
+        Stores a new lemma, evicting the least useful one if the store is
+        full. Returns True if the clause was stored.
+        '''
+        key = frozenset(clause)
+        if len(key) > self.max_length or self.capacity <= 0:
+            return False
+        if key in self.activity:
+            return False
+        if len(self.activity) >= self.capacity:
+            victim = min(self.activity, key=lambda k: (self.activity[k], -len(k)))
+            del self.activity[victim]
+            self.evictions += 1
+        self.activity[key] = self.increment
+        return True
+
+    def bump(self, clause):
+        '''
+        Marks a lemma as useful. Clauses that are not lemmas are ignored.
+        '''
+        key = frozenset(clause)
+        if key in self.activity:
+            self.activity[key] += self.increment
+            self.hits += 1
+
+    def decay(self):
+        '''
+        Called once per query: makes all past activity worth a little less
+        than whatever happens next.
+        '''
+        self.increment /= self.decay_factor
+        if self.increment > 1e100:
+            ## rescale before the scores overflow
+            for key in self.activity:
+                self.activity[key] /= self.increment
+            self.increment = 1.0
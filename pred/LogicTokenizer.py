@@ -10,6 +10,12 @@ class LogicTokenizer:
                         r"(?P<whitespace>\s+)",                 # whitespace
                         r"(?P<lparen>\()",                      # (
                         r"(?P<rparen>\))",                      # )
+                        r"(?P<comma>,)",                        # ,
+                        ## cardinality constraints, e.g. atmost(2, a, b, c); only
+                        ## keywords when a parenthesis follows
+                        r"(?P<atmost>atmost(?=\s*\())",
+                        r"(?P<atleast>atleast(?=\s*\())",
+                        r"(?P<exactly>exactly(?=\s*\())",
                         r"(?P<var>[a-zA-Z0-9\_]+)"]             # variable names
         self.pattern = '|'.join(self.token_res)
         self.regex = re.compile(self.pattern)
@@ -0,0 +1,62 @@
+import multiprocessing
+import multiprocessing.connection
+import time
+
+def engine_worker(kb, method, expression, conn):
+    '''
+    Runs one engine (a KnowledgeBase method such as 'ask') on the query and
+    sends back (True, answer), or (False, message) if the engine failed.
+    '''
+    try:
+        conn.send((True, getattr(kb, method)(expression)))
+    except Exception as e:
+        conn.send((False, str(e)))
+    conn.close()
+
+def race(kb, expression, engines, timeout=None):
+    '''
+    Starts every engine in engines (a dict from engine name to KnowledgeBase
+    method name) on the query in its own process and returns
+    (winner, answer, seconds) for the first engine that gives an answer.
+    The other processes are terminated. Engines that fail or give up
+    (answer None, e.g. saturation at its clause limit) are ignored; if
+    all of them fail, or none answers within timeout seconds, the result is
+    (None, None, seconds).
+    '''
+    start = time.time()
+    running = {}
+    for name in engines:
+        parent, child = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=engine_worker,
+                                         args=(kb, engines[name], expression, child),
+                                         daemon=True)
+        worker.start()
+        child.close()
+        running[parent] = (name, worker)
+    winner, answer = None, None
+    try:
+        while running and winner is None:
+            left = None
+            if timeout is not None:
+                left = timeout - (time.time() - start)
+                if left <= 0:
+                    break
+            ready = multiprocessing.connection.wait(list(running), left)
+            for conn in ready:
+                name, worker = running.pop(conn)
+                try:
+                    ok, result = conn.recv()
+                except EOFError:
+                    ## the process died without answering, e.g. out of memory
+                    ok = False
+                conn.close()
+                worker.join()
+                if ok and result is not None and winner is None:
+                    winner, answer = name, result
+    finally:
+        for conn in running:
+            name, worker = running[conn]
+            worker.terminate()
+            worker.join()
+            conn.close()
+    return winner, answer, time.time() - start
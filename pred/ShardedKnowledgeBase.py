@@ -0,0 +1,358 @@
+from KnowledgeBase import *
+import multiprocessing
+import os
+
+def clause_atoms(clause):
+    '''
+    Returns the set of atom names mentioned by a clause in set form.
+    Example usage:
+
+    >>> clause_atoms({a, ~b})
+    {'a', 'b'}
+    '''
+    atoms = set()
+    for literal in clause:
+        if literal.op == 'not':
+            atoms.add(literal.args[0].op)
+        else:
+            atoms.add(literal.op)
+    return atoms
+
+def references(kb):
+    '''
+    The clauses of a KB, each repeated once for every formula that needs
+    it, so that inserting them elsewhere carries the reference counts over.
+    '''
+    return [kb.stored[key] for key, count in kb.refcount.items() for i in range(count)]
+
+def shard_worker(conn):
+    '''
+    Main loop of a shard process. A shard owns any number of independent
+    components, each kept in its own KnowledgeBase, and answers messages of
+    the form (command, args...) sent by the ShardedKnowledgeBase.
+    '''
+    components = {}
+    ## component -> whether it is satisfiable, for the components checked
+    ## since they last changed
+    satisfiable = {}
+    while True:
+        message = conn.recv()
+        command = message[0]
+        if command in ['add', 'merge', 'take', 'retract']:
+            satisfiable.pop(message[1], None)
+        if command == 'add':
+            ## ('add', component, clauses)
+            comp, clauses = message[1], message[2]
+            if comp not in components:
+                components[comp] = KnowledgeBase()
+            components[comp].insert_clauses(clauses)
+        elif command == 'merge':
+            ## ('merge', target, [components...]); all live on this shard
+            target, others = message[1], message[2]
+            if target not in components:
+                components[target] = KnowledgeBase()
+            for comp in others:
+                satisfiable.pop(comp, None)
+                if comp in components:
+                    components[target].insert_clauses(references(components.pop(comp)))
+        elif command == 'take':
+            ## ('take', component): hand a component over to another shard
+            kb = components.pop(message[1], None)
+            conn.send(references(kb) if kb else [])
+        elif command == 'retract':
+            ## ('retract', component, clauses): drop one reference from each
+            ## clause (see KnowledgeBase.retract); replies with the number of
+            ## references dropped
+            kb = components.get(message[1])
+            keys = set(frozenset(clause) for clause in message[2])
+            dropped = 0
+            if kb:
+                dropped = len([key for key in keys if key in kb.refcount])
+                kb.retract(keys)
+            conn.send(dropped)
+        elif command == 'dump':
+            ## ('dump', component): copy of a component's clauses
+            kb = components.get(message[1])
+            conn.send(kb.KB if kb else [])
+        elif command == 'refute':
+            ## ('refute', task id, [components...], extra KB clauses,
+            ##  set of support clauses)
+            task, comps, extra, clauses = message[1], message[2], message[3], message[4]
+            if len(comps) == 1 and not extra and comps[0] in components:
+                kb = components[comps[0]]
+            else:
+                kb = KnowledgeBase()
+                for comp in comps:
+                    if comp in components:
+                        kb.insert_clauses(components[comp].KB)
+                kb.insert_clauses(extra)
+            conn.send((task, kb.refute(clauses)))
+        elif command == 'consistent':
+            ## ('consistent',): False if some component has no model, in
+            ## which case the whole KB entails everything
+            for comp, kb in components.items():
+                if comp not in satisfiable:
+                    satisfiable[comp] = not kb.ask(FALSE, engine='sat')
+            conn.send(all(satisfiable.values()))
+        elif command == 'size':
+            conn.send(sum(len(kb.KB) for kb in components.values()))
+        elif command == 'clear':
+            components = {}
+            satisfiable = {}
+        elif command == 'stop':
+            conn.close()
+            return
+
+class ShardedKnowledgeBase:
+    '''
+    A KnowledgeBase whose clauses are partitioned into independent groups
+    ("components") of clauses that share no atoms, directly or through other
+    clauses. Components are spread over a fixed number of long-lived worker
+    processes ("shards"), each with its own solver state.
+
+    Resolution can never combine clauses from two different components, so
+    a query only has to be refuted against the components its atoms touch,
+    and queries that touch components on different shards are checked in
+    parallel, unless some component has no model: then, as for the whole
+    KB, every query is entailed. Answers are the same as KnowledgeBase.ask()
+    on the whole KB.
+
+    >>> kb = ShardedKnowledgeBase(shards=4)
+    >>> kb.tell("a => b")
+    >>> kb.tell("c => d")
+    >>> kb.ask("a => b")
+    True
+    >>> kb.close()
+    '''
+    def __init__(self, shards=None):
+        if shards is None:
+            shards = os.cpu_count() or 1
+        self.parser = LogicParser()
+        ## auxiliary atoms and cached conversions of this KB, as in KnowledgeBase
+        self.auxiliary = {}
+        self.subformulas = SubformulaCache()
+        self.workers = []
+        self.connections = []
+        for i in range(shards):
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=shard_worker, args=(child,), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(parent)
+        self.reset_partition()
+
+    def reset_partition(self):
+        ## union-find over atom names: an atom's root identifies its component
+        self.parent = {}
+        ## component root -> shard index, and component root -> number of
+        ## clause references (a clause told by two formulas counts twice)
+        self.shard_of = {}
+        self.comp_size = {}
+        self.shard_load = [0] * len(self.workers)
+        ## number of empty clauses told: the empty clause has no atoms and
+        ## no component, and while there is one the KB entails everything
+        self.empty = 0
+
+    def find(self, atom):
+        root = atom
+        while self.parent[root] != root:
+            root = self.parent[root]
+        ## path compression
+        while self.parent[atom] != root:
+            self.parent[atom], atom = root, self.parent[atom]
+        return root
+
+    def component_of(self, clause):
+        '''
+        Returns the component of an already stored clause, or None if
+        none of its atoms are known.
+        '''
+        for atom in clause_atoms(clause):
+            if atom in self.parent:
+                return self.find(atom)
+        return None
+
+    def to_clauses(self, expr):
+        ''' The distinct clauses of expr in CNF form, as KnowledgeBase.tell() stores them. '''
+        if not isinstance(expr, Expression):
+            expr = self.parser.parse(expr)
+        clauses = []
+        keys = set()
+        for clause in LogicSimplifier(self.subformulas, self.auxiliary).iter_clauses(expr):
+            key = frozenset(clause)
+            if key not in keys:
+                keys.add(key)
+                clauses.append(set(clause))
+        return clauses
+
+    def close(self):
+        ''' Stops all shard processes. '''
+        for conn in self.connections:
+            conn.send(('stop',))
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.connections = []
+
+    def clear(self):
+        ''' Empties the KB. '''
+        for conn in self.connections:
+            conn.send(('clear',))
+        self.reset_partition()
+
+    def __len__(self):
+        for conn in self.connections:
+            conn.send(('size',))
+        return sum(conn.recv() for conn in self.connections)
+
+    def tell(self, expr):
+        '''
+        Add a new expression to the knowledge base. Components joined by the
+        new clauses are merged into the largest of them, moving clauses
+        between shards if needed.
+        '''
+        for clause in self.to_clauses(expr):
+            atoms = clause_atoms(clause)
+            if not atoms:
+                self.empty += 1
+                continue
+            roots = set()
+            for atom in atoms:
+                if atom in self.parent:
+                    roots.add(self.find(atom))
+                else:
+                    self.parent[atom] = atom
+            if roots:
+                target = max(roots, key=lambda r: self.comp_size[r])
+                roots.discard(target)
+                self.merge(target, roots)
+            else:
+                ## a brand new component goes to the least loaded shard
+                target = min(atoms)
+                self.shard_of[target] = self.shard_load.index(min(self.shard_load))
+                self.comp_size[target] = 0
+            for atom in atoms:
+                self.parent[self.find(atom)] = target
+            shard = self.shard_of[target]
+            self.connections[shard].send(('add', target, [clause]))
+            self.comp_size[target] += 1
+            self.shard_load[shard] += 1
+
+    def merge(self, target, others):
+        '''
+        Merges the components in others into the component target.
+        '''
+        shard = self.shard_of[target]
+        local = []
+        for comp in others:
+            source = self.shard_of.pop(comp)
+            size = self.comp_size.pop(comp)
+            if source == shard:
+                local.append(comp)
+            else:
+                self.connections[source].send(('take', comp))
+                self.connections[shard].send(('add', target, self.connections[source].recv()))
+                self.shard_load[source] -= size
+                self.shard_load[shard] += size
+            self.comp_size[target] += size
+            self.parent[comp] = target
+        if local:
+            self.connections[shard].send(('merge', target, local))
+
+    def unlearn(self, expr):
+        '''
+        Takes back a formula told earlier: each clause of expr in CNF form
+        loses one reference and is only removed once no other formula needs
+        it, as in KnowledgeBase.unlearn. Components are not split again
+        afterwards; this only makes them coarser than necessary, never
+        changes answers.
+        '''
+        groups = {}
+        for clause in self.to_clauses(expr):
+            if not clause:
+                self.empty = max(self.empty - 1, 0)
+                continue
+            comp = self.component_of(clause)
+            if comp is not None:
+                groups.setdefault(comp, []).append(clause)
+        for comp, clauses in groups.items():
+            shard = self.shard_of[comp]
+            self.connections[shard].send(('retract', comp, clauses))
+            dropped = self.connections[shard].recv()
+            self.comp_size[comp] -= dropped
+            self.shard_load[shard] -= dropped
+
+    def ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression.
+        The clauses of the negated query are grouped by the components they
+        touch; each group is refuted on its own by the shard that holds its
+        components, and all groups run in parallel. Returns None if no
+        group is refuted but some shard gave up (see KnowledgeBase.refute).
+        A KB that was told the empty clause (False), or has a component
+        without a model, entails everything.
+        '''
+        if self.empty:
+            return True
+        for conn in self.connections:
+            conn.send(('consistent',))
+        if not all([conn.recv() for conn in self.connections]):
+            return True
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        query = self.to_clauses(Logic.negate(expression))
+        ## group query clauses that touch a common component (or a common
+        ## atom unknown to the KB) with a small union-find over those keys
+        owner = {}
+        def root(key):
+            while owner[key] != key:
+                key = owner[key]
+            return key
+        clause_keys = []
+        for clause in query:
+            keys = []
+            for atom in clause_atoms(clause):
+                keys.append(('comp', self.find(atom)) if atom in self.parent else ('atom', atom))
+            for key in keys:
+                owner.setdefault(key, key)
+            for key in keys[1:]:
+                owner[root(key)] = root(keys[0])
+            clause_keys.append(keys)
+        groups = {}
+        for clause, keys in zip(query, clause_keys):
+            group = root(keys[0]) if keys else None
+            groups.setdefault(group, ([], set()))[0].append(clause)
+        for key in owner:
+            if key[0] == 'comp':
+                groups[root(key)][1].add(key[1])
+        pending = {}
+        answer = False
+        for task, (clauses, comps) in enumerate(groups.values()):
+            if not comps:
+                ## the group is independent of the KB; check it right here
+                result = KnowledgeBase().refute(clauses)
+                if result:
+                    return True
+                if result is None:
+                    answer = None
+                continue
+            ## the shard holding the largest component refutes the group;
+            ## components of the group held by other shards are copied over
+            comps = sorted(comps, key=lambda c: -self.comp_size[c])
+            shard = self.shard_of[comps[0]]
+            extra = []
+            for comp in comps:
+                if self.shard_of[comp] != shard:
+                    self.connections[self.shard_of[comp]].send(('dump', comp))
+                    extra.extend(self.connections[self.shard_of[comp]].recv())
+            local = [c for c in comps if self.shard_of[c] == shard]
+            self.connections[shard].send(('refute', task, local, extra, clauses))
+            pending[shard] = pending.get(shard, 0) + 1
+        for shard, count in pending.items():
+            for i in range(count):
+                task, result = self.connections[shard].recv()
+                if result:
+                    answer = True
+                elif result is None and answer is False:
+                    answer = None
+        return answer
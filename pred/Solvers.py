@@ -0,0 +1,546 @@
+## Satisfiability checks for clauses given as lists of signed atom indices
+## (DIMACS style, see AtomIndex): 3 is atom 3, -3 its negation. Each returns
+## True if the clauses have a model. Entailment KB |= q is then the question
+## whether the KB clauses together with those of ~q are unsatisfiable.
+
+def is_horn(clause):
+    ''' True if the clause has at most one positive literal. '''
+    return sum(1 for n in clause if n > 0) <= 1
+
+def horn_sat(clauses):
+    '''
+    Decides a set of Horn clauses by forward chaining, in time linear in
+    their total size. A clause {~a, ~b, c} is the rule a and b -> c; every
+    rule counts how many of its body atoms are not yet known to be true,
+    and fires when that reaches zero. The clauses are unsatisfiable exactly
+    when a rule without a head (all literals negative) fires.
+    Example usage:
+
+    >>> horn_sat([[1], [-1, 2], [-2]])         # a, a -> b, ~b
+    False
+    '''
+    missing = []
+    heads = []
+    uses = {}
+    agenda = []
+    for i, clause in enumerate(clauses):
+        body = set(-n for n in clause if n < 0)
+        head = [n for n in clause if n > 0]
+        if len(head) > 1:
+            raise Exception("Error: not a Horn clause")
+        if head and head[0] in body:
+            ## a -> a is always true
+            missing.append(None)
+            heads.append(None)
+            continue
+        missing.append(len(body))
+        heads.append(head[0] if head else None)
+        for atom in body:
+            uses.setdefault(atom, []).append(i)
+        if len(body) == 0:
+            agenda.append(i)
+    true = set()
+    while agenda:
+        i = agenda.pop()
+        head = heads[i]
+        if head is None:
+            return False
+        if head in true:
+            continue
+        true.add(head)
+        for j in uses.get(head, []):
+            missing[j] -= 1
+            if missing[j] == 0:
+                agenda.append(j)
+    return True
+
+def two_sat(clauses):
+    '''
+    Decides a set of clauses with at most two literals each in linear time.
+    Every clause (a or b) gives the implications ~a -> b and ~b -> a; the
+    clauses are unsatisfiable exactly when some atom and its negation lie in
+    the same strongly connected component of this implication graph. The
+    components are found with an iterative version of Tarjan's algorithm.
+    Example usage:
+
+    >>> two_sat([[1, 2], [-1, 2], [1, -2], [-1, -2]])
+    False
+    '''
+    graph = {}
+    for clause in clauses:
+        if len(clause) == 0:
+            return False
+        if len(clause) > 2:
+            raise Exception("Error: clause with more than two literals")
+        a, b = clause[0], clause[-1]
+        graph.setdefault(-a, []).append(b)
+        graph.setdefault(-b, []).append(a)
+    index = {}
+    low = {}
+    component = {}
+    stack = []
+    on_stack = set()
+    counter = 0
+    for root in list(graph):
+        if root in index:
+            continue
+        ## each entry is (node, position of the next successor to visit)
+        work = [(root, 0)]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, i = work[-1]
+            successors = graph.get(node, [])
+            if i < len(successors):
+                work[-1] = (node, i + 1)
+                succ = successors[i]
+                if succ not in index:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, 0))
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component[member] = node
+                    if member == node:
+                        break
+    for n in component:
+        if -n in component and component[n] == component[-n]:
+            return False
+    return True
+
+class SatSolver:
+    '''
+    A DPLL satisfiability solver with unit propagation on two watched
+    literals per clause and chronological backtracking. Decisions go to the
+    atom occurring in the most clauses first, with the sign it occurs with
+    most often.
+
+    >>> SatSolver([[1, 2], [-1], [-2, 3]]).solve()
+    {1: False, 2: True, 3: True}
+    >>> SatSolver([[1], [-1]]).solve() is None
+    True
+    '''
+    def __init__(self, clauses=()):
+        self.clauses = []
+        self.units = []
+        self.empty = False
+        self.watches = {}
+        self.occurrences = {}
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def add_clause(self, clause):
+        '''
+        Adds a clause; tautologies are dropped and repeated literals merged.
+        '''
+        clause = list(set(clause))
+        if any(-n in clause for n in clause):
+            return
+        for n in clause:
+            self.occurrences[n] = self.occurrences.get(n, 0) + 1
+        if len(clause) == 0:
+            self.empty = True
+        elif len(clause) == 1:
+            self.units.append(clause[0])
+        else:
+            self.watches.setdefault(clause[0], []).append(len(self.clauses))
+            self.watches.setdefault(clause[1], []).append(len(self.clauses))
+            self.clauses.append(clause)
+
+    def value(self, n):
+        ''' True, False or None (unassigned) for a literal. '''
+        v = self.assignment.get(abs(n))
+        if v is None:
+            return None
+        return v == (n > 0)
+
+    def set(self, n):
+        self.assignment[abs(n)] = n > 0
+        self.trail.append(n)
+
+    def propagate(self):
+        '''
+        Assigns the literals implied by unit clauses until nothing changes.
+        Returns False on a conflict.
+        '''
+        while self.head < len(self.trail):
+            false = -self.trail[self.head]
+            self.head += 1
+            watching = self.watches.get(false, [])
+            i = 0
+            while i < len(watching):
+                clause = self.clauses[watching[i]]
+                if clause[0] == false:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value(clause[0]) is True:
+                    i += 1
+                    continue
+                ## look for another literal to watch instead
+                moved = False
+                for k in range(2, len(clause)):
+                    if self.value(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches.setdefault(clause[1], []).append(watching[i])
+                        watching[i] = watching[-1]
+                        watching.pop()
+                        moved = True
+                        break
+                if moved:
+                    continue
+                first = self.value(clause[0])
+                if first is False:
+                    return False
+                if first is None:
+                    self.set(clause[0])
+                i += 1
+        return True
+
+    def undo(self, mark):
+        ''' Takes back all assignments made after the trail had length mark. '''
+        for n in self.trail[mark:]:
+            del self.assignment[abs(n)]
+        del self.trail[mark:]
+        self.head = mark
+
+    def solve(self, assumptions=()):
+        '''
+        Returns a model as a dict from atom index to truth value (atoms that
+        do not occur are left out), or None if the clauses together with
+        the assumed literals are unsatisfiable.
+        '''
+        for model in self.models(assumptions=assumptions):
+            return model
+        return None
+
+    def models(self, atoms=None, assumptions=()):
+        '''
+        Yields the models of the clauses (with the assumed literals) one at
+        a time, like solve(). With atoms given, yields their assignments
+        that extend to a model instead, each once, and the other atoms are
+        only searched for such an extension. After every model the search
+        backtracks from its last decision, so no blocking clauses pile up
+        and the memory used stays the same however many models there are.
+        Example usage:
+
+        >>> list(SatSolver([[1, 2], [-1, 3]]).models([1, 2]))
+        [{1: True, 2: True}, {1: True, 2: False}, {1: False, 2: True}]
+        '''
+        self.assignment = {}
+        self.trail = []
+        self.head = 0
+        if self.empty:
+            return
+        for n in list(self.units) + list(assumptions):
+            value = self.value(n)
+            if value is False:
+                return
+            if value is None:
+                self.set(n)
+        if not self.propagate():
+            return
+        order = sorted(set(abs(n) for n in self.occurrences), key=self.activity)
+        if atoms is None:
+            atoms, rest = order, []
+        else:
+            atoms = sorted(set(atoms), key=self.activity)
+            projected = set(atoms)
+            rest = [a for a in order if a not in projected]
+        ## decision stack of (trail length before the decision, literal,
+        ## whether the other sign was already tried)
+        decisions = []
+        while True:
+            if self.decide(atoms, decisions):
+                if not self.propagate() and not self.backtrack(decisions):
+                    return
+                continue
+            model = self.extend(rest)
+            if model is not None:
+                yield dict((a, model[a]) for a in atoms) if rest else model
+            if not self.backtrack(decisions):
+                return
+
+    def activity(self, atom):
+        ## sort key: the atoms occurring in the most clauses first
+        return -(self.occurrences.get(atom, 0) + self.occurrences.get(-atom, 0))
+
+    def decide(self, atoms, decisions):
+        '''
+        Assigns the first unassigned atom of atoms, with the sign it occurs
+        with most often, as a new decision. Returns False if there is none.
+        '''
+        for atom in atoms:
+            if atom not in self.assignment:
+                n = atom if self.occurrences.get(atom, 0) >= self.occurrences.get(-atom, 0) else -atom
+                decisions.append((len(self.trail), n, False))
+                self.set(n)
+                return True
+        return False
+
+    def backtrack(self, decisions):
+        '''
+        Flips the latest decision whose other sign was not tried yet, and
+        again while that leads to a conflict. Returns False once every
+        decision has been tried both ways.
+        '''
+        while True:
+            while decisions and decisions[-1][2]:
+                decisions.pop()
+            if decisions == []:
+                return False
+            mark, n, flipped = decisions.pop()
+            self.undo(mark)
+            decisions.append((mark, -n, True))
+            self.set(-n)
+            if self.propagate():
+                return True
+
+    def extend(self, atoms):
+        '''
+        Searches for an assignment of atoms that completes the current one
+        to a model; returns the model, or None. Either way the current
+        assignment is left as it was.
+        '''
+        mark = len(self.trail)
+        decisions = []
+        model = None
+        while True:
+            if not self.decide(atoms, decisions):
+                model = dict(self.assignment)
+                break
+            if not self.propagate() and not self.backtrack(decisions):
+                break
+        self.undo(mark)
+        return model
+
+def count_models(clauses, atoms):
+    '''
+    Counts the assignments of atoms (atom indices) that extend to a model
+    of the clauses; atoms of the clauses that are not in atoms only have to
+    have some value ("projected away"). Rather than going through the
+    models, the count is computed DPLL style: branch on an atom, propagate
+    unit clauses, and split the remaining clauses into connected components
+    (no atom in common), whose counts multiply. Components recur in
+    different branches, so their counts are cached, keyed by their clause
+    set. Atoms in no remaining clause double the count.
+    Example usage:
+
+    >>> count_models([[1, 2], [-1, 3]], [1, 2, 3])     # (a or b) and (a -> c)
+    4
+    '''
+    atoms = frozenset(atoms)
+    clauses = [frozenset(clause) for clause in clauses]
+    clauses = frozenset(clause for clause in clauses if not any(-n in clause for n in clause))
+    cache = {}
+    reduced = condition(clauses, [next(iter(clause)) for clause in clauses if len(clause) == 1])
+    if frozenset() in clauses or reduced is None:
+        return 0
+    clauses, assigned = reduced
+    left = set(abs(n) for clause in clauses for n in clause)
+    free = len([a for a in atoms if a not in assigned and a not in left])
+    ## the components are counted recursively, with a stack of generators
+    ## in place of Python's call stack: each yields the generators of its
+    ## sub-counts and receives their results
+    stack = [count_split(clauses, atoms, cache)]
+    result = None
+    while stack:
+        try:
+            stack.append(stack[-1].send(result))
+            result = None
+        except StopIteration as done:
+            stack.pop()
+            result = done.value
+    return result * 2 ** free
+
+def condition(clauses, literals):
+    '''
+    Sets the literals true in a frozenset of clauses (frozensets) and
+    propagates unit clauses. Returns the remaining clauses and the atoms
+    assigned, or None on a conflict.
+    '''
+    true = set()
+    pending = list(literals)
+    while pending:
+        n = pending.pop()
+        if n in true:
+            continue
+        if -n in true:
+            return None
+        true.add(n)
+        remaining = []
+        for clause in clauses:
+            if n in clause:
+                continue
+            if -n in clause:
+                clause = clause - {-n}
+                if len(clause) == 0:
+                    return None
+                if len(clause) == 1:
+                    pending.extend(clause)
+            remaining.append(clause)
+        clauses = remaining
+    return frozenset(clauses), set(abs(n) for n in true)
+
+def count_split(clauses, atoms, cache):
+    ''' count_models() for a clause set: the product over its components. '''
+    owner = {}
+    def root(atom):
+        while owner[atom] != atom:
+            owner[atom] = owner[owner[atom]]
+            atom = owner[atom]
+        return atom
+    for clause in clauses:
+        first = None
+        for n in clause:
+            owner.setdefault(abs(n), abs(n))
+            if first is None:
+                first = root(abs(n))
+            else:
+                owner[root(abs(n))] = first
+                first = root(first)
+    components = {}
+    for clause in clauses:
+        components.setdefault(root(abs(next(iter(clause)))), []).append(clause)
+    total = 1
+    for component in components.values():
+        total *= yield count_component(frozenset(component), atoms, cache)
+        if total == 0:
+            break
+    return total
+
+def count_component(clauses, atoms, cache):
+    '''
+    count_models() for one connected component: branches on its atom of
+    atoms that occurs most often. A component without such atoms counts 1
+    if it is satisfiable and 0 if not.
+    '''
+    if clauses in cache:
+        return cache[clauses]
+    occurrences = {}
+    for clause in clauses:
+        for n in clause:
+            occurrences[abs(n)] = occurrences.get(abs(n), 0) + 1
+    branch = [a for a in occurrences if a in atoms]
+    if branch == []:
+        result = 1 if SatSolver(clauses).solve() is not None else 0
+    else:
+        atom = max(branch, key=lambda a: occurrences[a])
+        result = 0
+        for n in [atom, -atom]:
+            reduced = condition(clauses, [n])
+            if reduced is None:
+                continue
+            rest, assigned = reduced
+            left = set(abs(m) for clause in rest for m in clause)
+            free = len([a for a in occurrences if a in atoms and a not in assigned and a not in left])
+            result += (yield count_split(rest, atoms, cache)) * 2 ** free
+    cache[clauses] = result
+    return result
+
+def gauss(rows):
+    '''
+    Gaussian elimination over GF(2). Every row (mask, parity) is the
+    equation "the XOR of the atoms whose bits are set in mask is parity",
+    with atom i as bit 1 << i. Returns the system in reduced row echelon
+    form, as a dict from the pivot bit of each row to the row, or None if
+    the equations contradict each other (they reduce to 0 = 1).
+    Example usage:
+
+    >>> gauss([(0b011, 1), (0b110, 1), (0b101, 1)]) is None     # a^b, b^c, a^c
+    True
+    '''
+    pivots = {}
+    pivot_bits = 0
+    for mask, parity in rows:
+        ## every pivot bit only occurs in its own row, so one pass over the
+        ## pivot bits of the new row reduces it completely
+        common = mask & pivot_bits
+        while common:
+            bit = common & -common
+            common ^= bit
+            other_mask, other_parity = pivots[bit]
+            mask ^= other_mask
+            parity ^= other_parity
+        if mask == 0:
+            if parity:
+                return None
+            continue
+        bit = mask & -mask
+        for other in pivots:
+            other_mask, other_parity = pivots[other]
+            if other_mask & bit:
+                pivots[other] = (other_mask ^ mask, other_parity ^ parity)
+        pivots[bit] = (mask, parity)
+        pivot_bits |= bit
+    return pivots
+
+class ParitySolver(SatSolver):
+    '''
+    A SatSolver that also takes XOR constraints (add_xor) and handles them
+    as rows of a linear system over GF(2) instead of as clauses. After unit
+    propagation on the clauses, the rows are restricted to the unassigned
+    atoms and put through Gaussian elimination (see gauss): a row that
+    reduces to 0 = 1 is a conflict, and a row with a single atom left
+    assigns it. This finds every consequence of the XOR constraints under
+    the current assignment, where their CNF would need exponentially many
+    clauses or search.
+    Example usage:
+
+    >>> solver = ParitySolver([[1, 2]])
+    >>> solver.add_xor([1, 2, 3], 1)
+    >>> solver.add_xor([1, 2], 1)
+    >>> solver.solve([3]) is None
+    True
+    '''
+    def __init__(self, clauses=()):
+        self.rows = []
+        SatSolver.__init__(self, clauses)
+
+    def add_xor(self, atoms, parity):
+        ''' Adds the constraint that an odd (parity 1) or even (0) number of atoms is true. '''
+        mask = 0
+        for atom in atoms:
+            mask ^= 1 << atom
+        self.rows.append((mask, parity & 1))
+        for atom in atoms:
+            ## so that the search assigns atoms that are only in rows too
+            self.occurrences[atom] = self.occurrences.get(atom, 0) + 1
+
+    def propagate(self):
+        while True:
+            if not SatSolver.propagate(self):
+                return False
+            if self.rows == []:
+                return True
+            assigned = 0
+            true = 0
+            for n in self.trail:
+                assigned |= 1 << abs(n)
+                if n > 0:
+                    true |= 1 << n
+            residual = [(mask & ~assigned, parity ^ (bin(mask & true).count('1') & 1))
+                        for mask, parity in self.rows]
+            pivots = gauss(residual)
+            if pivots is None:
+                return False
+            implied = False
+            for mask, parity in pivots.values():
+                if mask & (mask - 1) == 0:
+                    ## a single atom left
+                    atom = mask.bit_length() - 1
+                    self.set(atom if parity else -atom)
+                    implied = True
+            if not implied:
+                return True
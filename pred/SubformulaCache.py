@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+class SubformulaCache:
+    '''
+    A bounded least-recently-used cache for the results of converting
+    (sub)expressions, keyed by the expression itself so that structurally
+    equal subformulas share one entry.
+
+    Every entry has a size, roughly the number of new expression nodes or
+    literals it holds. The cache keeps at most capacity entries and a total
+    size of at most max_size; entries larger than max_entry are not stored
+    at all. Whenever a limit is exceeded the least recently used entries are
+    evicted. hits, misses and evictions count what happened so far.
+
+    >>> cache = SubformulaCache(capacity=1)
+    >>> cache.put('a', 1, 1)
+    >>> cache.put('b', 2, 1)
+    >>> cache.get('a'), cache.get('b')
+    (None, 2)
+    >>> cache.stats()
+    {'entries': 1, 'size': 1, 'hits': 1, 'misses': 1, 'evictions': 1}
+    '''
+    def __init__(self, capacity=10000, max_size=1000000, max_entry=10000):
+        self.capacity = capacity
+        self.max_size = max_size
+        self.max_entry = max_entry
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        ''' Drops all entries; the counters are kept. '''
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        '''
+        Returns the value stored for key, or None, and marks the entry as
+        recently used.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size=1):
+        '''
+        Stores a value, evicting the least recently used entries until the
+        cache is within its limits again.
+        '''
+        if size > self.max_entry or size > self.max_size or self.capacity <= 0:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while len(self.entries) > self.capacity or self.size > self.max_size:
+            victim, (value, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {'entries': len(self.entries), 'size': self.size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,147 @@
+from LogicParser import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+## every 64-bit word holds 64 consecutive assignments; in assignment number
+## k, atom i is true iff bit i of k is set. For the first six atoms this gives
+## a fixed bit pattern inside each word.
+WORD_PATTERNS = [0xAAAAAAAAAAAAAAAA, 0xCCCCCCCCCCCCCCCC, 0xF0F0F0F0F0F0F0F0,
+                 0xFF00FF00FF00FF00, 0xFFFF0000FFFF0000, 0xFFFFFFFF00000000]
+
+class TruthTable:
+    '''
+    Exhaustive model checking over a small vocabulary with bit-parallel
+    NumPy operations. The 2^n assignments to n atoms are packed 64 to a
+    uint64 word, so each atom is one bit-plane and a clause is a handful of
+    vectorized ORs over whole planes. Planes are processed in blocks of
+    block_words words, so memory stays bounded however large 2^n is.
+
+    Running time depends only on the number of atoms and clauses, not on how
+    hard the KB is for resolution.
+
+    >>> table = TruthTable(['a', 'b'])
+    >>> table.entails([{~a, b}, {a}], LogicParser().parse('b'))
+    True
+    >>> table.count_models([{~a, b}])
+    3
+    '''
+    def __init__(self, atoms, block_words=1 << 16):
+        if np is None:
+            raise Exception("Error: the truth table engine requires numpy")
+        self.atoms = list(atoms)
+        self.position = dict((name, i) for i, name in enumerate(self.atoms))
+        n = len(self.atoms)
+        self.words = max(1, 2 ** n // 64)
+        self.block_words = block_words
+        ## with fewer than 6 atoms only the low 2^n bits of the word are used
+        self.last_mask = np.uint64((1 << 2 ** n) - 1) if n < 6 else ~np.uint64(0)
+        ## bitset of KB models, kept while it is small enough
+        self.cached = None
+
+    def blocks(self):
+        ''' Yields (first word, number of words) for every block. '''
+        for start in range(0, self.words, self.block_words):
+            yield start, min(self.block_words, self.words - start)
+
+    def plane(self, name, start, count):
+        '''
+        Returns the bit-plane of an atom for words start..start+count-1.
+        '''
+        i = self.position[name]
+        if i < 6:
+            return np.full(count, WORD_PATTERNS[i], dtype=np.uint64)
+        index = np.arange(start, start + count, dtype=np.uint64)
+        on = (index >> np.uint64(i - 6)) & np.uint64(1)
+        ## 0 -> all zeros, 1 -> all ones
+        return np.uint64(0) - on
+
+    def literal_plane(self, literal, start, count, planes):
+        negated = literal.op == 'not'
+        name = literal.args[0].op if negated else literal.op
+        if name not in planes:
+            planes[name] = self.plane(name, start, count)
+        return ~planes[name] if negated else planes[name]
+
+    def clauses_block(self, clauses, start, count, planes):
+        ''' ANDs together the ORs of all clauses over one block. '''
+        result = np.full(count, ~np.uint64(0), dtype=np.uint64)
+        for clause in clauses:
+            value = np.zeros(count, dtype=np.uint64)
+            for literal in clause:
+                value |= self.literal_plane(literal, start, count, planes)
+            result &= value
+        return result
+
+    def expression_block(self, expr, start, count, planes):
+        ''' Evaluates an arbitrary Expression over one block. '''
+        if expr.op in Logic.CONSTANTS:
+            return np.full(count, ~np.uint64(0) if expr.op == 'True' else 0, dtype=np.uint64)
+        if expr.op not in Logic.OPS:
+            return self.literal_plane(expr, start, count, planes)
+        args = [self.expression_block(arg, start, count, planes) for arg in expr.args]
+        if expr.op in Logic.CARDINALITY:
+            ones = np.full(count, ~np.uint64(0), dtype=np.uint64)
+            zeros = np.zeros(count, dtype=np.uint64)
+            least = [ones] + [zeros] * (max(expr.k, 0) + 1)
+            for arg in args:
+                for j in range(len(least) - 1, 0, -1):
+                    least[j] = least[j] | (least[j - 1] & arg)
+            return cardinality_value(expr.op, expr.k, least, ones, zeros,
+                                     lambda u: ~u, lambda u, v: u & v)
+        if expr.op == 'not':
+            return ~args[0]
+        if expr.op == 'implies':
+            return ~args[0] | args[1]
+        if expr.op == 'iff':
+            return ~(args[0] ^ args[1])
+        result = args[0]
+        for arg in args[1:]:
+            if expr.op == 'and':
+                result = result & arg
+            else:
+                result = result | arg
+        return result
+
+    def mask(self, start, count, value):
+        ''' Clears the unused bits of the last word. '''
+        if start + count == self.words:
+            value[-1] &= self.last_mask
+        return value
+
+    def models(self, clauses, start, count, planes):
+        if self.cached is not None:
+            return self.cached[start:start + count]
+        return self.clauses_block(clauses, start, count, planes)
+
+    def cache(self, clauses, limit=1 << 16):
+        '''
+        Evaluates the clauses once and keeps the resulting bitset, if it has
+        at most limit words, so later queries only evaluate the query.
+        '''
+        if self.words <= limit:
+            planes = {}
+            self.cached = self.mask(0, self.words, self.clauses_block(clauses, 0, self.words, planes))
+
+    def entails(self, clauses, expr):
+        '''
+        True if every assignment satisfying all clauses satisfies expr.
+        '''
+        for start, count in self.blocks():
+            planes = {}
+            kb = self.models(clauses, start, count, planes)
+            query = self.expression_block(expr, start, count, planes)
+            if self.mask(start, count, kb & ~query).any():
+                return False
+        return True
+
+    def count_models(self, clauses):
+        ''' Number of assignments to all atoms that satisfy the clauses. '''
+        total = 0
+        for start, count in self.blocks():
+            planes = {}
+            kb = self.mask(start, count, self.models(clauses, start, count, planes))
+            total += int(np.unpackbits(kb.view(np.uint8)).sum())
+        return total
@@ -0,0 +1,263 @@
+from KnowledgeBase import *
+import json
+import math
+import sys
+import time
+import tracemalloc
+
+## A trace is a JSONL file with one operation per line:
+##   {"t": 0.0123, "op": "tell", "expr": "a -> b", "handle": 1, "encoding": "tree", "safe": false}
+##   {"t": 0.0150, "op": "ask", "expr": "a -> c", "result": true}
+##   {"t": 0.0201, "op": "unlearn", "expr": "a -> b", "handle": 1}
+##   {"t": 0.0250, "op": "clear"}
+## t is the time in seconds since recording started. ask records the answer
+## it got, so a replay can check that it still gets the same one. tell
+## records the handle it returned, and unlearn by handle records both the
+## handle and its formula; a replay takes back the formula of the tell
+## with that handle. tell also records the encoding its clauses were made
+## with (see KnowledgeBase.tell) and its safe flag, and a replay uses the
+## same ones. Only the operations called from outside are recorded, not
+## those the KB runs itself (such as the ask of a safe tell), and only
+## once they succeeded.
+
+OPERATIONS = ['tell', 'ask', 'unlearn', 'clear']
+
+class RecordingKnowledgeBase(KnowledgeBase):
+    '''
+    A KnowledgeBase that appends every tell, ask, unlearn and clear to a
+    trace file (a path or an open file) as it happens, for replay() later.
+    Example usage:
+
+    >>> kb = RecordingKnowledgeBase('trace.jsonl')
+    >>> kb.tell('a -> b')
+    1
+    >>> kb.ask('a -> b')
+    True
+    >>> kb.close()
+    '''
+    def __init__(self, trace, max_lemmas=1000, max_derived=KnowledgeBase.MAX_DERIVED, encoding='tree'):
+        self.trace = None
+        ## how many recorded operations are running; the ones they call
+        ## are part of them and not recorded again
+        self.depth = 0
+        KnowledgeBase.__init__(self, max_lemmas, max_derived, encoding)
+        self.own_file = isinstance(trace, str)
+        self.trace = open(trace, 'w') if self.own_file else trace
+        self.start = time.time()
+
+    def record(self, op, expr=None, when=None, **fields):
+        '''
+        Writes one operation; when defaults to the current time. Nothing is
+        written for an operation called by another one.
+        '''
+        if self.trace is None or self.depth > 0:
+            return
+        if when is None:
+            when = time.time()
+        entry = {'t': round(when - self.start, 6), 'op': op}
+        if expr is not None:
+            entry['expr'] = expr if isinstance(expr, str) else repr(expr)
+        entry.update(fields)
+        self.trace.write(json.dumps(entry) + '\n')
+
+    def close(self):
+        if self.own_file and self.trace is not None:
+            self.trace.close()
+        self.trace = None
+
+    def clear(self):
+        when = time.time()
+        self.depth += 1
+        try:
+            KnowledgeBase.clear(self)
+        finally:
+            self.depth -= 1
+        self.record('clear', when=when)
+
+    def tell(self, expr, safe=False, encoding=None):
+        ## every operation is time stamped when it starts
+        when = time.time()
+        self.depth += 1
+        try:
+            handle = KnowledgeBase.tell(self, expr, safe, encoding)
+        finally:
+            self.depth -= 1
+        self.record('tell', expr, when, handle=handle, encoding=encoding or self.encoding, safe=safe)
+        return handle
+
+    def unlearn(self, expr):
+        when = time.time()
+        if isinstance(expr, int) and expr in self.told:
+            formula, fields = self.told[expr][0], {'handle': expr}
+        else:
+            formula, fields = expr, {}
+        self.depth += 1
+        try:
+            KnowledgeBase.unlearn(self, expr)
+        finally:
+            self.depth -= 1
+        self.record('unlearn', formula, when, **fields)
+
+    def ask(self, expression, engine='auto', timeout=None):
+        when = time.time()
+        self.depth += 1
+        try:
+            result = KnowledgeBase.ask(self, expression, engine, timeout)
+        finally:
+            self.depth -= 1
+        self.record('ask', expression, when, result=result)
+        return result
+
+def read_trace(source):
+    '''
+    Yields the operations of a trace file (a path or an open file) as
+    dicts, checking that each one is known.
+    '''
+    f = open(source) if isinstance(source, str) else source
+    try:
+        for number, line in enumerate(f):
+            if line.strip() == '':
+                continue
+            entry = json.loads(line)
+            if entry.get('op') not in OPERATIONS:
+                raise Exception("Error: unknown operation on line %d of the trace" % (number + 1))
+            yield entry
+    finally:
+        if isinstance(source, str):
+            f.close()
+
+def tests_to_trace(source, dest):
+    '''
+    Converts a file in the KB:/ASSERT:/DENY: format of tests.txt into a
+    trace: every KB: block becomes a clear followed by tells, every ASSERT
+    an ask whose expected result is True and every DENY one whose expected
+    result is False. Time stamps are all zero.
+    '''
+    f = open(source) if isinstance(source, str) else source
+    out = open(dest, 'w') if isinstance(dest, str) else dest
+    try:
+        expected = None
+        for line in f:
+            line = line.strip()
+            if line == 'KB:':
+                out.write(json.dumps({'t': 0.0, 'op': 'clear'}) + '\n')
+            elif line in ['ASSERT:', 'DENY:']:
+                expected = line == 'ASSERT:'
+            elif line != '':
+                if expected is not None:
+                    entry = {'t': 0.0, 'op': 'ask', 'expr': line, 'result': expected}
+                else:
+                    entry = {'t': 0.0, 'op': 'tell', 'expr': line}
+                out.write(json.dumps(entry) + '\n')
+                expected = None
+    finally:
+        if isinstance(source, str):
+            f.close()
+        if isinstance(dest, str):
+            out.close()
+
+def percentile(values, p):
+    ''' The p-th percentile (0-100) of a sorted list, nearest rank. '''
+    if values == []:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+def replay(source, kb=None, engine='auto', realtime=False, memory=True):
+    '''
+    Runs the operations of a trace against a KnowledgeBase (a new one by
+    default) with the given ask() engine, and returns a report:
+    - ops: operations run, seconds: total time spent in them, throughput:
+      operations per second of that time;
+    - latency: for each operation type, count and p50/p90/p99/max in
+      seconds;
+    - mismatches: asks whose answer differs from the recorded one;
+    - peak_memory: the most memory allocated by Python at any point, in
+      bytes (measured with tracemalloc, which slows things down; pass
+      memory=False to skip it).
+    With realtime=True the original spacing between operations is kept, so
+    queries meet the KB in the same state of background work as recorded.
+    '''
+    if kb is None:
+        kb = KnowledgeBase()
+    latencies = dict((op, []) for op in OPERATIONS)
+    mismatches = 0
+    ## recorded handle -> handle of the same tell in this replay
+    handles = {}
+    if memory:
+        tracemalloc.start()
+    start = time.time()
+    busy = 0.0
+    try:
+        for entry in read_trace(source):
+            if realtime:
+                wait = entry.get('t', 0.0) - (time.time() - start)
+                if wait > 0:
+                    time.sleep(wait)
+            op = entry['op']
+            before = time.perf_counter()
+            if op == 'tell':
+                handle = kb.tell(entry['expr'], safe=entry.get('safe', False),
+                                 encoding=entry.get('encoding'))
+                if 'handle' in entry:
+                    handles[entry['handle']] = handle
+            elif op == 'unlearn':
+                if entry.get('handle') in handles:
+                    kb.unlearn(handles.pop(entry['handle']))
+                else:
+                    kb.unlearn(entry['expr'])
+            elif op == 'clear':
+                kb.clear()
+                handles = {}
+            else:
+                result = kb.ask(entry['expr'], engine=engine)
+                if 'result' in entry and result != entry['result']:
+                    mismatches += 1
+            elapsed = time.perf_counter() - before
+            busy += elapsed
+            latencies[op].append(elapsed)
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    report = {'ops': 0, 'seconds': busy, 'latency': {}, 'mismatches': mismatches,
+              'peak_memory': peak}
+    for op in OPERATIONS:
+        values = sorted(latencies[op])
+        report['ops'] += len(values)
+        if values:
+            report['latency'][op] = {'count': len(values),
+                                     'p50': percentile(values, 50),
+                                     'p90': percentile(values, 90),
+                                     'p99': percentile(values, 99),
+                                     'max': values[-1]}
+    report['throughput'] = report['ops'] / busy if busy > 0 else 0.0
+    return report
+
+def print_report(report, out=sys.stdout):
+    out.write('%d operations in %.3f s, %.1f ops/s, %d mismatches\n' %
+              (report['ops'], report['seconds'], report['throughput'], report['mismatches']))
+    if report['peak_memory'] is not None:
+        out.write('peak memory %.1f MB\n' % (report['peak_memory'] / 1e6))
+    for op in OPERATIONS:
+        if op in report['latency']:
+            l = report['latency'][op]
+            out.write('%-8s %6d  p50 %.2f ms  p90 %.2f ms  p99 %.2f ms  max %.2f ms\n' %
+                      (op, l['count'], 1000 * l['p50'], 1000 * l['p90'],
+                       1000 * l['p99'], 1000 * l['max']))
+
+if __name__ == '__main__':
+    ## python Workload.py trace.jsonl [engine] [--realtime] [--no-memory]
+    ## python Workload.py --convert tests.txt trace.jsonl
+    args = sys.argv[1:]
+    if len(args) == 3 and args[0] == '--convert':
+        tests_to_trace(args[1], args[2])
+    elif args:
+        options = [a for a in args if a.startswith('--')]
+        args = [a for a in args if not a.startswith('--')]
+        report = replay(args[0], engine=args[1] if len(args) > 1 else 'auto',
+                        realtime='--realtime' in options, memory='--no-memory' not in options)
+        print_report(report)
+    else:
+        print('usage: python Workload.py trace.jsonl [engine] [--realtime] [--no-memory]')
+        print('       python Workload.py --convert tests.txt trace.jsonl')
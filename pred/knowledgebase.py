@@ -1,20 +1,177 @@
 from LogicSimplifier import *
+from LemmaStore import *
+from BDD import *
+from TruthTable import *
+from ClauseMasks import *
+from ClauseMatrix import *
+from Portfolio import *
+from KBStats import *
+from Solvers import *
+from AIG import *
+import itertools
+import time
+
+def iter_dimacs(f, atoms=None):
+    '''
+    Reads a DIMACS CNF file object as a stream, yielding one clause at a time
+    as a list of signed integers. Clauses may span several lines. If an
+    AtomIndex is given, comment lines of the form "c atom <index> <name>"
+    bind the index to that atom name.
+    Example usage:
+
+    >>> list(iter_dimacs(io.StringIO('p cnf 2 2\\n1 -2 0\\n2 0\\n')))
+    [[1, -2], [2]]
+    '''
+    clause = []
+    for line in f:
+        fields = line.split()
+        if fields == []:
+            continue
+        if fields[0] == 'c':
+            if atoms is not None and len(fields) == 4 and fields[1] == 'atom':
+                index, name = int(fields[2]), fields[3]
+                if atoms.indices.get(name) != index:
+                    atoms.assign(name, index)
+            continue
+        if fields[0] == 'p':
+            if len(fields) < 4 or fields[1] != 'cnf':
+                raise Exception("Error: not a DIMACS CNF file")
+            continue
+        if fields[0] == '%':
+            ## end marker used by some benchmark sets
+            break
+        for field in fields:
+            n = int(field)
+            if n == 0:
+                yield clause
+                clause = []
+            else:
+                clause.append(n)
+    if clause != []:
+        yield clause
 
 class KnowledgeBase:
-    def __init__(self):
+    ## engines for ask(expression, engine=...), by name -> method
+    ENGINES = {'resolution': 'resolution_ask',
+               'saturation': 'slow_ask',
+               'bdd': 'compiled_ask',
+               'table': 'table_ask',
+               'masks': 'mask_ask',
+               'matrix': 'matrix_ask',
+               'horn': 'horn_ask',
+               '2sat': 'two_sat_ask',
+               'sat': 'sat_ask',
+               'xor': 'xor_ask'}
+    ## engines raced by default in portfolio mode
+    PORTFOLIO = ['resolution', 'saturation', 'bdd', 'table', 'masks', 'matrix', 'sat']
+    ## set of support engines: they only resolve from the negated query, so
+    ## they answer False instead of True when the KB itself is inconsistent
+    SET_OF_SUPPORT = ['resolution', 'masks', 'matrix']
+    ## plan() uses truth tables up to this many atoms
+    SMALL_VOCABULARY = 12
+    ## default ceiling on the clauses a saturation engine derives per query
+    MAX_DERIVED = 100000
+
+    def __init__(self, max_lemmas=1000, max_derived=MAX_DERIVED, encoding='tree'):
         self.KB = []
+        ## provenance: the number of sources (told formulas, inserts) of
+        ## every stored clause, the stored clause set itself, and for every
+        ## tell() handle the formula and the clauses it produced
+        self.refcount = {}
+        self.stored = {}
+        self.told = {}
+        self.handles = {}
+        self.next_handle = 1
         self.parser = LogicParser()
+        ## the numbering of the auxiliary atoms of the cardinality and
+        ## parity encodings, and the conversions that contain them, are the
+        ## KB's own (see LogicSimplifier.auxiliary)
+        self.auxiliary = {}
+        self.subformulas = SubformulaCache()
+        ## atom name <-> integer mapping used for DIMACS input and output
+        self.atoms = AtomIndex()
+        ## clauses derived from the KB alone during earlier queries
+        self.lemmas = LemmaStore(capacity=max_lemmas)
+        ## the saturation engines (refute, slow_ask) hold at most
+        ## max_derived derived clauses, see reduce(); peak_derived is the
+        ## most they held during the last query
+        self.max_derived = max_derived
+        self.peak_derived = 0
+        ## the KB compiled to a BDD by compile(), or None
+        self.compiled = None
+        ## truth table with the KB's models cached, built by table_ask()
+        self.table = None
+        ## the KB's clauses in mask form, built by mask_ask(), and as a
+        ## clause matrix, built by matrix_ask()
+        self.masks = None
+        self.matrix = None
+        ## the KB with its auxiliary atoms resolved away, for the
+        ## saturation engines, built by projected_clauses()
+        self.projected = None
+        ## portfolio results: engine name -> number of races won, and the
+        ## (engine, seconds) of the last race
+        self.wins = {}
+        self.last_winner = None
+        ## shape of the clause store, for plan(), and the clauses as lists
+        ## of signed atom indices, built by the Horn, 2-SAT and SAT engines
+        self.stats = KBStats()
+        self.ints = None
+        ## parity constraints told to the KB, (atom names, parity) -> number
+        ## of sources, kept for xor_ask() next to their clauses
+        self.xors = {}
+        ## how tell() turns formulas into clauses by default: 'tree' for
+        ## LogicSimplifier.iter_clauses, 'aig' for the Tseitin clauses of
+        ## the formula's node in self.aig, shared by all formulas told
+        self.encoding = encoding
+        self.aig = AIG()
+
+    @property
+    def KB(self):
+        '''
+        The clause store, a list of clause sets ordered by length. Clauses
+        retracted by unlearn() are only marked dead there; they are dropped
+        from the list the next time it is used.
+        '''
+        if self.dead:
+            self.clauses = [clause for clause in self.clauses if id(clause) not in self.dead]
+            self.dead = set()
+        return self.clauses
+
+    @KB.setter
+    def KB(self, clauses):
+        self.clauses = clauses
+        self.dead = set()
 
     def clear(self):
         ''' Empties the KB. '''
         self.KB = []
+        self.refcount = {}
+        self.stored = {}
+        self.told = {}
+        self.handles = {}
+        self.xors = {}
+        self.aig = AIG()
+        self.auxiliary = {}
+        self.subformulas = SubformulaCache()
+        self.atoms = AtomIndex()
+        self.changed()
+
+    def simplifier(self):
+        ''' A LogicSimplifier using the KB's auxiliary atoms and cache. '''
+        return LogicSimplifier(self.subformulas, self.auxiliary)
 
-    def tell(self, expr, safe=False):
+    def tell(self, expr, safe=False, encoding=None):
         '''
         Add a new expression to the knowledge base.
         Includes an optional 'safe' flag that ensures no contradiction is
         introduced to the knowledge base. This may cause the telling procedure to
         run slowly.
+        With encoding='aig' (or self.encoding), the clauses come from the
+        expression's and-inverter graph (see AIG.cnf): linear in its size,
+        with one auxiliary atom per shared and node, where the ordinary
+        ('tree') CNF can be exponential and repeats shared subformulas.
+        Returns a handle that can be passed to unlearn() to take exactly this
+        formula back.
         '''
         new_expression = None
         if isinstance(expr, Expression):
@@ -22,29 +179,124 @@ class KnowledgeBase:
         else:
             new_expression = self.parser.parse(expr)
         ## The knowledge base is kept as a list of clauses. Convert the input
-        ## expression to CNF and extract its clauses.
-        cnf = LogicSimplifier().to_cnf(new_expression)
-        new_clauses = self.clauses_to_sets(cnf.args)
+        ## expression to CNF one clause at a time; the full CNF expression is
+        ## never built.
+        if encoding is None:
+            encoding = self.encoding
+        if encoding == 'aig':
+            clauses = self.aig.cnf(self.aig.build(new_expression))
+        elif encoding == 'tree':
+            clauses = self.simplifier().iter_clauses(new_expression)
+        else:
+            raise Exception("Error: unknown encoding " + str(encoding))
+        new_clauses = []
+        keys = set()
+        for clause in clauses:
+            key = frozenset(clause)
+            if key not in keys:
+                keys.add(key)
+                new_clauses.append(set(clause))
         if not safe or self.ask(Logic.negate(new_expression)) == False:
             ## If the "safe" flag is set, we want to ensure no contradiction is
             ## added to the KB. This may be very slow.
-            self.insert_clauses(new_clauses)
+            self.bulk_insert(new_clauses)
         else:
             raise Exception("Error: teaching this sentence would create a contradiction in the KB")
+        rows = self.parity_rows(new_expression)
+        for row in rows:
+            self.xors[row] = self.xors.get(row, 0) + 1
+        handle = self.next_handle
+        self.next_handle += 1
+        self.told[handle] = (new_expression, list(keys), rows)
+        self.handles.setdefault(new_expression, []).append(handle)
+        return handle
 
     def unlearn(self, expr):
         '''
-        Removes all clauses that make up expr in CNF form from the database.
+        Takes back a formula told earlier, given the handle tell() returned
+        or the formula itself (the latest telling of an equal formula is
+        taken back). Each of its clauses loses one reference and is only
+        removed once no other formula needs it, so the work is proportional
+        to the size of the formula, not of the KB. Raises an exception for a
+        formula that was never told (or was already taken back), even if its
+        clauses are stored because of other formulas.
         '''
-        new_expression = None
-        if isinstance(expr, Expression):
-            new_expression = expr
+        if isinstance(expr, int):
+            if expr not in self.told:
+                raise Exception("Error: unknown handle %d" % expr)
+            handle = expr
         else:
-            new_expression = self.parser.parse(expr)
-        clauses = self.clauses_to_sets(LogicSimplifier().to_cnf(new_expression).args)
+            if not isinstance(expr, Expression):
+                expr = self.parser.parse(expr)
+            handles = self.handles.get(expr)
+            if not handles:
+                raise Exception("Error: " + str(expr) + " was never told")
+            handle = handles[-1]
+        expression, keys, rows = self.told.pop(handle)
+        self.handles[expression].remove(handle)
+        if self.handles[expression] == []:
+            del self.handles[expression]
+        self.release(rows)
+        self.retract(keys)
+
+    def parity_rows(self, expression):
+        '''
+        The parity constraints among the conjuncts of an expression (see
+        LogicSimplifier.parity), as (atom names, parity) rows. Single
+        literals are left to the clauses.
+        '''
+        rows = []
+        stack = [expression]
+        while stack:
+            s = stack.pop()
+            if s.op == 'and':
+                stack.extend(s.args)
+                continue
+            row = self.simplifier().parity(s)
+            if row is not None and len(row[0]) >= 2:
+                rows.append(row)
+        return rows
+
+    def release(self, rows):
+        ''' Drops one reference from each parity row. '''
+        for row in rows:
+            if row in self.xors:
+                self.xors[row] -= 1
+                if self.xors[row] == 0:
+                    del self.xors[row]
+
+    def retract(self, keys):
+        '''
+        Drops one reference from each stored clause in keys (frozensets),
+        removing the clauses that have none left.
+        '''
+        removed = []
+        for key in keys:
+            if key not in self.refcount:
+                continue
+            self.refcount[key] -= 1
+            if self.refcount[key] == 0:
+                del self.refcount[key]
+                clause = self.stored.pop(key)
+                self.dead.add(id(clause))
+                removed.append(clause)
+        if removed:
+            self.changed(removed=removed)
+
+    def remove_clauses(self, clauses):
+        '''
+        Removes clauses (in set form) from the KB whatever their sources.
+        '''
+        removed = []
         for clause in clauses:
-            if clause in self.KB:
-                self.KB.remove(clause)
+            key = frozenset(clause)
+            if key in self.stored:
+                del self.refcount[key]
+                clause = self.stored.pop(key)
+                self.dead.add(id(clause))
+                removed.append(clause)
+        if removed:
+            self.changed(removed=removed)
 
     def resolve(self, clause1, clause2):
         '''
@@ -53,22 +305,35 @@ class KnowledgeBase:
         Output: list of resolvent clauses
         Example usage:
 
-        >>> kb.resolve({a, ~b, c}, {~a, b, d})
-        [{c, a, ~a, d}, {b, c, ~b, d}]
+        >>> kb.resolve({a, ~b, c}, {~a, d})
+        [{~b, c, d}]
+
+        Tautologies such as {a, ~a, c} are left out: they are always true and
+        resolving them again only produces more of them.
         '''
         assert isinstance(clause1, set)
         assert isinstance(clause2, set)
         resolvents = []
-        variables = clause1.union(clause2)
-        for var in variables:
-            inverted = LogicSimplifier().apply_demorgan(Logic.negate(var))
-            if inverted in variables:
-                ## found one resolvent
-                resolvent = variables.difference(set([var, inverted]))
+        for var in clause1:
+            inverted = self.simplifier().apply_demorgan(Logic.negate(var))
+            if inverted in clause2:
+                ## found one resolvent. Only var is dropped from clause1 and
+                ## only inverted from clause2: taking the union first would
+                ## turn e.g. {b, ~b} and {b} into the empty clause.
+                resolvent = clause1.difference([var]).union(clause2.difference([inverted]))
+                if self.is_tautology(resolvent):
+                    continue
                 if resolvent not in resolvents:
                     resolvents.append(resolvent)
         return resolvents
 
+    def is_tautology(self, clause):
+        ''' True if the clause contains some literal together with its negation. '''
+        for var in clause:
+            if var.op == 'not' and var.args[0] in clause:
+                return True
+        return False
+
     def clauses_to_sets(self, clauses):
         '''
         Converts a list of clause Expressions to a list of sets
@@ -82,7 +347,10 @@ class KnowledgeBase:
         '''
         c_sets = []
         for clause in clauses:
-            if clause.op in Logic.UNARY:
+            if clause == FALSE:
+                # the empty clause, which can never be satisfied
+                c_sets.append(set())
+            elif clause.op in Logic.UNARY:
                 # clause is a negated literal
                 c_sets.append(set([clause]))
             elif clause.op in Logic.BINARY:
@@ -98,73 +366,737 @@ class KnowledgeBase:
         Insert a list of clauses into the knowledge base, maintaining a sorted
         order (by clause length) and ignoring duplicates.
         '''
+        added = []
         for clause in clauses:
-            self.insert(clause, self.KB)
+            key = frozenset(clause)
+            if key in self.stored:
+                self.refcount[key] += 1
+            else:
+                self.insert(clause, self.KB)
+                self.stored[key] = clause
+                self.refcount[key] = 1
+                added.append(clause)
+        self.changed(added)
+
+    def bulk_insert(self, clauses):
+        '''
+        Inserts a large number of clauses at once. Equivalent to
+        insert_clauses(), but the KB is sorted once at the end instead of
+        being scanned for every clause.
+        '''
+        added = []
+        for clause in clauses:
+            key = frozenset(clause)
+            if key in self.stored:
+                self.refcount[key] += 1
+            else:
+                self.KB.append(clause)
+                self.stored[key] = clause
+                self.refcount[key] = 1
+                added.append(clause)
+        ## the sort is stable, so old clauses stay ahead of new ones of the
+        ## same length, just like with insert()
+        if added:
+            self.KB.sort(key=len)
+        self.changed(added)
+
+    def changed(self, added=None, removed=None):
+        '''
+        Brings everything derived from the clause store up to date after it
+        changed. added lists the clauses that were inserted and removed those
+        that were taken out; with neither, the KB was replaced as a whole
+        (e.g. cleared).
+        '''
+        self.projected = None
+        if added is not None:
+            if self.compiled is not None:
+                self.compiled.add_clauses(added)
+            for clause in added:
+                self.stats.add(clause)
+                key = frozenset(clause)
+                if self.masks is not None:
+                    self.masks[key] = clause_to_mask(clause, self.atoms)
+                if self.ints is not None:
+                    self.ints[key] = [self.atoms.to_int(literal) for literal in clause]
+        elif removed is not None:
+            ## a lemma can only have been derived from clauses in its own
+            ## component (see KBStats), so only lemmas sharing a component
+            ## with a removed clause are dropped
+            roots = set()
+            for clause in removed:
+                roots.update(self.stats.find(name) for name in self.stats.names(clause))
+            self.lemmas.forget(lambda lemma: lemma == frozenset() or any(
+                name in self.stats.parent and self.stats.find(name) in roots
+                for name in self.stats.names(lemma)))
+            ## a BDD cannot forget a clause; compiled_ask() rebuilds it
+            self.compiled = None
+            for clause in removed:
+                self.stats.remove(clause)
+                key = frozenset(clause)
+                if self.masks is not None:
+                    del self.masks[key]
+                if self.ints is not None:
+                    del self.ints[key]
+        else:
+            self.lemmas.clear()
+            self.compiled = None
+            self.stats = KBStats(self.KB)
+            self.masks = None
+            self.ints = None
+        ## the truth table and the clause matrix describe the KB as a whole
+        self.table = None
+        self.matrix = None
+
+    def read_dimacs(self, source, prefix='x'):
+        '''
+        Adds the clauses of a DIMACS CNF file (a path or an open file) to the
+        KB, bypassing the parser. Literals are interned through self.atoms, so
+        each atom is built once rather than once per occurrence. Variables
+        not named by a "c atom" comment (see write_dimacs) are named prefix
+        plus their index: x1, x2, ...
+        Returns the number of clauses read.
+        '''
+        f = open(source) if isinstance(source, str) else source
+        try:
+            literal = self.atoms.literal
+            clauses = [set([literal(n, prefix) for n in clause])
+                       for clause in iter_dimacs(f, self.atoms)]
+        finally:
+            if isinstance(source, str):
+                f.close()
+        self.bulk_insert(clauses)
+        return len(clauses)
+
+    def write_dimacs(self, dest):
+        '''
+        Writes the KB in DIMACS CNF format to dest (a path or an open file),
+        one clause per line. Atom names are recorded in "c atom <index> <name>"
+        comments so read_dimacs can restore them; the numbering comes from
+        self.atoms and stays the same between calls.
+        '''
+        ## first pass: make sure every atom has an index
+        for clause in self.KB:
+            for literal in clause:
+                self.atoms.to_int(literal)
+        f = open(dest, 'w') if isinstance(dest, str) else dest
+        try:
+            f.write('p cnf %d %d\n' % (self.atoms.next_index - 1, len(self.KB)))
+            for index in sorted(self.atoms.names):
+                f.write('c atom %d %s\n' % (index, self.atoms.names[index]))
+            for clause in self.KB:
+                ints = sorted((self.atoms.to_int(literal) for literal in clause), key=abs)
+                f.write(' '.join(map(str, ints)) + ' 0\n')
+        finally:
+            if isinstance(dest, str):
+                f.close()
 
     def insert(self, clause, KB):
         '''
         Inserts a new clause into the KB argument, maintaining the state of
-        sortedness while avoiding inserting duplicates.
+        sortedness while avoiding inserting duplicates. Returns True if the
+        clause was inserted.
         '''
         assert isinstance(clause, set)
         i = 0
         while i < len(KB):
             if clause == KB[i]:
                 # duplicate entry, don't add the new clause
-                return
+                return False
             if len(clause) < len(KB[i]):
                 KB.insert(i, clause)
-                return
+                return True
             i += 1
         KB.append(clause)
+        return True
 
-    def ask(self, expression):
+    def ask(self, expression, engine='auto', timeout=None):
+        '''
+        Asks the KB whether its current knowledge entails the expression.
+        By default the engine is chosen by plan() from the shape of the KB
+        and the query. An engine can also be picked by name (see
+        KnowledgeBase.ENGINES), or engine='portfolio' races several of them
+        (see portfolio_ask).
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        if engine == 'auto':
+            engine = self.plan(expression)[0]
+        if engine == 'portfolio':
+            return self.portfolio_ask(expression, timeout=timeout)
+        if engine not in KnowledgeBase.ENGINES:
+            raise Exception("Error: unknown engine " + str(engine))
+        return getattr(self, KnowledgeBase.ENGINES[engine])(expression)
+
+    def plan(self, expression):
+        '''
+        Picks the engine for a query from the KB statistics (see KBStats)
+        and the clauses of the negated query, cheapest first:
+        - every clause has at most two literals: '2sat', linear time;
+        - every clause is Horn: 'horn', forward chaining in linear time;
+        - the KB has parity (iff/XOR) constraints: 'xor', a SAT search
+          with Gaussian elimination on them;
+        - at most SMALL_VOCABULARY atoms: 'table', with the KB's models
+          cached between queries;
+        - otherwise 'sat', a DPLL search.
+        Returns (engine, reason).
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        query = list(self.simplifier().iter_clauses(Logic.negate(expression)))
+        if all(len(clause) <= 2 for clause in query) and self.stats.binary == self.stats.clauses:
+            return '2sat', 'all clauses have at most two literals'
+        if (all(sum(1 for literal in clause if literal.op != 'not') <= 1 for clause in query)
+                and self.stats.horn == self.stats.clauses):
+            return 'horn', 'all clauses are Horn clauses'
+        if self.xors:
+            return 'xor', '%d parity constraints' % len(self.xors)
+        ## the KB's atoms are counted by self.stats, only the query's new
+        ## ones are added
+        extra = set()
+        self.collect_atoms(expression, extra)
+        count = self.stats.atoms() + sum(1 for name in extra if name not in self.stats.occurrences)
+        if np is not None and count <= KnowledgeBase.SMALL_VOCABULARY:
+            return 'table', 'only %d atoms' % count
+        return 'sat', 'no special structure, %d atoms' % count
+
+    def explain(self, expression):
+        '''
+        Describes how ask() would answer a query: the KB statistics, the
+        engine plan() picks and why.
+        Example usage:
+
+        >>> kb.explain('a -> c')
+        'KB: 2 clauses over 3 atoms; lengths {2: 2}; Horn 100%, 2-CNF 100%; 1 components, largest 3 atoms\nengine: 2sat (all clauses have at most two literals)'
+        '''
+        engine, reason = self.plan(expression)
+        return 'KB: %s\nengine: %s (%s)' % (self.stats.summary(), engine, reason)
+
+    def resolution_ask(self, expression):
         '''
         Asks the KB whether its current knowledge entails the expression.
         Uses an optimized resolution algorithm described in the paper.
+        The negated query is converted like a told formula, so an iff chain
+        gives linearly many clauses over the same parity atoms as the KB's
+        (see LogicSimplifier.to_cnf). Long parity constraints remain hard
+        for resolution itself, though: beyond a handful of atoms, use the
+        'xor' or 'sat' engine for them.
         '''
-        new_expr = LogicParser().parse(expression)
-        new_expr = LogicSimplifier().to_cnf(Logic.negate(new_expr))
+        new_expr = None
+        if isinstance(expression, Expression):
+            new_expr = expression
+        else:
+            new_expr = self.parser.parse(expression)
+        new_expr = self.simplifier().to_cnf(Logic.negate(new_expr))
         assert new_expr.op == 'and'
-        new_clauses = self.clauses_to_sets(new_expr.args)
-        newKB = self.KB[:]
-        #for clause in new_clauses:
-        #    self.insert(clause, newKB)
+        return self.refute(self.clauses_to_sets(new_expr.args))
+
+    def refute(self, new_clauses):
+        '''
+        The resolution loop behind ask(): returns True if the KB together with
+        new_clauses (a list of clause sets, normally the negated query) is
+        contradictory. Only resolutions involving new_clauses or clauses
+        derived from them are tried (the "set of support").
+
+        When more than max_derived clauses have been derived, the weaker
+        half is dropped (see reduce) and the search goes on without them,
+        never deriving them again. If it then runs out of resolvents the
+        answer is unknown and None is returned instead of False.
+        '''
+        self.peak_derived = 0
+        if set() in new_clauses or frozenset() in self.stored:
+            return True
+        if set() in self.projected_clauses():
+            return True
+        new_clauses = new_clauses[:]
+        query = set(frozenset(clause) for clause in new_clauses)
+        ## the dropped clauses (frozensets), and how often each clause took
+        ## part in a resolution (by id)
+        pruned = set()
+        activity = {}
+        newKB = self.projected_clauses()[:]
+        for lemma in self.lemmas.clauses():
+            self.insert(lemma, newKB)
+        self.lemmas.decay()
+        ## For every clause derived here, remember which unit clauses of the
+        ## query it depends on (None if it depends on a longer query clause).
+        ## If clause C was derived from query units l1..ln, then the KB alone
+        ## entails C or ~l1 or ... or ~ln, which is kept as a lemma.
+        support = {}
+        for clause in new_clauses:
+            support[frozenset(clause)] = frozenset(clause) if len(clause) == 1 else None
         while True:
             old_len = len(new_clauses)
+            reduced = False
             for c1 in new_clauses:
                 for c2 in (newKB + new_clauses):
                     if c1 == c2: continue
                     resolvents = self.resolve(c1, c2)
-                    if set() in resolvents: return True
+                    if resolvents == []: continue
+                    self.lemmas.bump(c2)
+                    activity[id(c1)] = activity.get(id(c1), 0) + 1
+                    activity[id(c2)] = activity.get(id(c2), 0) + 1
+                    used = self.combine_support(support, c1, c2)
+                    if set() in resolvents:
+                        self.learn(set(), used)
+                        return True
                     for clause in resolvents:
+                        key = frozenset(clause)
+                        if key in pruned:
+                            continue
+                        if key not in support:
+                            support[key] = used
+                            self.learn(clause, used)
                         self.insert(clause, new_clauses)
+                derived = len(new_clauses) - len(query)
+                self.peak_derived = max(self.peak_derived, derived)
+                if derived > self.max_derived:
+                    kept, dropped = self.reduce([c for c in new_clauses if frozenset(c) not in query],
+                                                activity)
+                    for clause in dropped:
+                        key = frozenset(clause)
+                        pruned.add(key)
+                        support.pop(key, None)
+                    new_clauses[:] = sorted([c for c in new_clauses if frozenset(c) in query] + kept, key=len)
+                    activity = dict((id(c), activity.get(id(c), 0)) for c in new_clauses)
+                    ## the list changed under the loop; start the pass over
+                    reduced = True
+                    break
+            if reduced:
+                continue
             ## check if we found any new clauses
             if len(new_clauses) <= old_len:
-                ## no new clauses
-                return False
+                ## no new clauses; without the dropped ones that proves nothing
+                return None if pruned else False
+
+    def projected_clauses(self):
+        '''
+        The KB's clauses for the saturation engines (refute, slow_ask), with
+        the auxiliary atoms of the encodings (Tseitin atoms of the AIG,
+        cardinality and parity chains) resolved away where that does not
+        make the KB bigger: an atom is eliminated when the non-tautological
+        resolvents of its positive and negative occurrences are no more
+        than the occurrences themselves. Queries never mention these atoms,
+        so the result answers every query like the KB does, but saturating
+        it does not derive the many clauses that only relate auxiliary
+        atoms to each other. A list of clause sets ordered by length,
+        cached until the KB changes; the KB itself if it has no auxiliary
+        atoms.
+        '''
+        if self.projected is not None:
+            return self.projected
+        clauses = set(frozenset(clause) for clause in self.kb_ints())
+        auxiliary = set()
+        for clause in clauses:
+            for n in clause:
+                name = self.atoms.name(abs(n))
+                ## parity chain atoms are kept: the negated query of a
+                ## parity constraint over the same atoms is encoded with the
+                ## same ones (see LogicSimplifier.parity_nnf), and refuting
+                ## it needs them
+                if self.simplifier().is_auxiliary(name) and not name.startswith('$x'):
+                    auxiliary.add(abs(n))
+        if not auxiliary:
+            self.projected = self.KB
+            return self.projected
+        occurs = {}
+        for clause in clauses:
+            for n in clause:
+                if abs(n) in auxiliary:
+                    occurs.setdefault(n, set()).add(clause)
+        for v in sorted(auxiliary):
+            positive, negative = occurs.get(v, set()), occurs.get(-v, set())
+            resolvents = set()
+            for p in positive:
+                for q in negative:
+                    resolvent = (p | q) - {v, -v}
+                    if not any(-n in resolvent for n in resolvent):
+                        resolvents.add(resolvent)
+            if len(resolvents) > len(positive) + len(negative):
+                continue
+            for clause in positive | negative:
+                clauses.discard(clause)
+                for n in clause:
+                    if n in occurs and n != v and n != -v:
+                        occurs[n].discard(clause)
+            occurs.pop(v, None)
+            occurs.pop(-v, None)
+            for resolvent in resolvents - clauses:
+                clauses.add(resolvent)
+                for n in resolvent:
+                    if abs(n) in auxiliary:
+                        occurs.setdefault(n, set()).add(resolvent)
+        self.projected = sorted([set(self.atoms.literal(n) for n in clause) for clause in clauses], key=len)
+        return self.projected
+
+    def reduce(self, derived, activity, unsupported=()):
+        '''
+        Clause database reduction for the saturation engines: splits the
+        derived clauses (clause sets) into the half to keep and the rest,
+        which are dropped. Clauses whose frozenset is in unsupported (those
+        that do not descend from the query) go first; of the others the
+        short ones are kept, and of equally long ones those that took part
+        in the most resolutions (activity, by id). Returns (kept, dropped).
+        '''
+        ranked = sorted(derived, key=lambda clause: (frozenset(clause) in unsupported, len(clause),
+                                                     -activity.get(id(clause), 0)))
+        limit = self.max_derived // 2
+        while limit > 0 and frozenset(ranked[limit - 1]) in unsupported:
+            limit -= 1
+        return ranked[:limit], ranked[limit:]
+
+    def combine_support(self, support, c1, c2):
+        '''
+        Returns the query units a resolvent of c1 and c2 depends on, given the
+        support of each parent; clauses missing from support come from the KB.
+        '''
+        s1 = support.get(frozenset(c1), frozenset())
+        s2 = support.get(frozenset(c2), frozenset())
+        if s1 is None or s2 is None:
+            return None
+        return s1 | s2
+
+    def learn(self, clause, used):
+        '''
+        Turns a clause derived from the query units in used into a lemma that
+        holds in the KB alone, and stores it if it is short enough and says
+        more than what is known: a lemma subsumed by (a superset of) a KB
+        clause or another lemma is left out, and the lemmas it subsumes are
+        dropped. Lemmas are short, so the check looks up their subsets.
+        '''
+        if used is None:
+            return
+        lemma = set(clause)
+        for literal in used:
+            lemma.add(self.simplifier().apply_demorgan(Logic.negate(literal)))
+        if len(lemma) > self.lemmas.max_length or lemma == set():
+            return
+        if any(self.simplifier().is_auxiliary(name) for name in self.stats.names(lemma)):
+            ## auxiliary atoms are resolved away before saturating (see
+            ## projected_clauses), so such a lemma would only add clauses
+            return
+        for literal in lemma:
+            if self.simplifier().apply_demorgan(Logic.negate(literal)) in lemma:
+                ## tautology, useless
+                return
+        key = frozenset(lemma)
+        for size in range(1, len(key) + 1):
+            for subset in itertools.combinations(key, size):
+                if frozenset(subset) in self.stored or frozenset(subset) in self.lemmas:
+                    return
+        if self.lemmas.add(lemma):
+            self.lemmas.forget(lambda other: key < other)
     
+    def compile(self):
+        '''
+        Compiles the KB into a reduced ordered BDD, using a variable order
+        computed from the clauses with the FORCE heuristic. The result is
+        kept in self.compiled and updated incrementally by later tells, so
+        it only has to be rebuilt after unlearn() or clear().
+        '''
+        self.compiled = BDD(force_order(self.KB))
+        self.compiled.add_clauses(self.KB)
+        return self.compiled
+
+    def portfolio_ask(self, expression, engines=None, timeout=None):
+        '''
+        Asks the KB whether its current knowledge entails the expression by
+        running several engines at once, each in its own process, and taking
+        the answer of whichever finishes first; the others are stopped. This
+        bounds the cost of a query by its best engine rather than by the one
+        ask() happens to use. Engines that cannot run here (no numpy, too
+        many atoms for a truth table) are left out.
+
+        The winner is counted in self.wins and stored with its time in
+        self.last_winner. Returns None if no engine answers within timeout
+        seconds (or all of them fail). Lemmas learned by the engines are not
+        kept.
+
+        The set of support engines (KnowledgeBase.SET_OF_SUPPORT) never
+        derive the empty clause from an inconsistent KB alone, so if any of
+        them is raced the KB is first checked for consistency with the SAT
+        solver; an inconsistent KB entails every query, and the answer is
+        True without a race.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        if engines is None:
+            engines = KnowledgeBase.PORTFOLIO
+        atoms = self.atom_names()
+        self.collect_atoms(expression, atoms)
+        methods = {}
+        for name in engines:
+            if name in ['table', 'matrix'] and np is None:
+                continue
+            if name == 'table' and len(atoms) > 28:
+                continue
+            methods[name] = KnowledgeBase.ENGINES[name]
+        start = time.time()
+        if (any(name in KnowledgeBase.SET_OF_SUPPORT for name in methods)
+                and SatSolver(self.kb_ints()).solve() is None):
+            winner, answer, seconds = 'sat', True, time.time() - start
+        else:
+            winner, answer, seconds = race(self, expression, methods, timeout)
+        if winner is not None:
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+        self.last_winner = (winner, seconds)
+        return answer
+
+    def kb_ints(self):
+        ''' The KB's clauses as lists of signed atom indices, cached. '''
+        if self.ints is None:
+            self.ints = dict((frozenset(clause), [self.atoms.to_int(literal) for literal in clause])
+                             for clause in self.KB)
+        return list(self.ints.values())
+
+    def query_ints(self, expression):
+        ''' The clauses of the negated query as lists of signed atom indices. '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        return [[self.atoms.to_int(literal) for literal in clause]
+                for clause in self.simplifier().iter_clauses(Logic.negate(expression))]
+
+    def horn_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression by
+        forward chaining (see Solvers.horn_sat). The KB and the negated query
+        must consist of Horn clauses.
+        '''
+        return not horn_sat(self.kb_ints() + self.query_ints(expression))
+
+    def two_sat_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression
+        with the implication graph algorithm for 2-CNF (see Solvers.two_sat).
+        The KB and the negated query must have at most two literals per
+        clause.
+        '''
+        return not two_sat(self.kb_ints() + self.query_ints(expression))
+
+    def sat_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression by
+        searching for a model of the KB and the negated query with a DPLL
+        solver (see Solvers.SatSolver).
+        '''
+        return SatSolver(self.kb_ints() + self.query_ints(expression)).solve() is None
+
+    def xor_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression
+        with a SAT solver that keeps the KB's parity (iff/XOR) constraints
+        as linear equations over GF(2) and propagates them by Gaussian
+        elimination (see Solvers.ParitySolver). A parity query is negated
+        into one more equation instead of clauses.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        row = self.simplifier().parity(expression)
+        if row is not None:
+            ## the negation of a parity constraint flips its parity
+            clauses = []
+            rows = list(self.xors) + [(row[0], 1 - row[1])]
+        else:
+            clauses = self.query_ints(expression)
+            rows = list(self.xors)
+        solver = ParitySolver(self.kb_ints() + clauses)
+        for names, parity in rows:
+            solver.add_xor([self.atoms.index(name) for name in names], parity)
+        return solver.solve() is None
+
+    def compiled_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression,
+        using the compiled BDD (compiling first if needed). Once compiled,
+        every query only costs a BDD operation between the query and the KB.
+        Unlike ask(), this also answers True for any query if the KB is
+        inconsistent.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        if self.compiled is None:
+            self.compile()
+        return self.compiled.entails(expression)
+
+    def mask_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression.
+        Same set of support resolution as ask(), but on clauses stored as
+        pairs of bitmasks (see ClauseMasks), where resolving, detecting
+        tautologies, subsumption and duplicates are all integer operations.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        if self.masks is None:
+            self.masks = dict((frozenset(clause), clause_to_mask(clause, self.atoms))
+                              for clause in self.KB)
+        query = self.simplifier().to_cnf(Logic.negate(expression))
+        support = [clause_to_mask(clause, self.atoms) for clause in self.clauses_to_sets(query.args)]
+        return refute_masks(list(self.masks.values()), support)
+
+    def matrix_ask(self, expression):
+        '''
+        Asks the KB whether its current knowledge entails the expression.
+        Saturates the negated query against the KB like ask(), but with the
+        clauses stored as a {-1, 0, +1} NumPy matrix, so all resolvable pairs
+        of a round are found with matrix products (see ClauseMatrix) instead
+        of pairwise Python loops. Requires numpy.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        query = self.clauses_to_sets(self.simplifier().to_cnf(Logic.negate(expression)).args)
+        if self.matrix is None:
+            self.matrix = clauses_to_matrix(self.KB, self.atoms)
+        support = clauses_to_matrix(query, self.atoms)
+        kb = self.matrix
+        if kb.shape[1] < support.shape[1]:
+            ## the query brought new atoms; they do not occur in the KB
+            kb = np.pad(kb, ((0, 0), (0, support.shape[1] - kb.shape[1])))
+        return refute_matrix(kb, support)
+
+    def table_ask(self, expression, max_atoms=28):
+        '''
+        Asks the KB whether its current knowledge entails the expression by
+        checking that every model of the KB satisfies it, over all 2^n
+        assignments at once (see TruthTable). Meant for KBs with few atoms;
+        raises an exception if KB and query mention more than max_atoms.
+        While the KB does not change, its models are computed only once.
+        '''
+        if not isinstance(expression, Expression):
+            expression = self.parser.parse(expression)
+        atoms = self.atom_names()
+        query_atoms = set()
+        self.collect_atoms(expression, query_atoms)
+        extra = sorted(query_atoms.difference(atoms))
+        if len(atoms) + len(extra) > max_atoms:
+            raise Exception("Error: too many atoms for a truth table")
+        if extra != []:
+            ## a one-off table; the cached one does not know these atoms
+            return TruthTable(sorted(atoms) + extra).entails(self.KB, expression)
+        if self.table is None:
+            self.table = TruthTable(sorted(atoms))
+            self.table.cache(self.KB)
+        return self.table.entails(self.KB, expression)
+
+    def equivalent(self, f, g):
+        '''
+        Returns True if the expressions f and g have the same truth value in
+        every model of the KB. Both are built in the KB's and-inverter
+        graph first; if that makes them the same node the answer is
+        immediate, otherwise a SAT search looks for a model of the KB in
+        which they differ.
+        Example usage:
+
+        >>> kb.equivalent('(a and b) or c', 'c or (b and a)')
+        True
+        >>> kb.tell('a -> b')
+        >>> kb.equivalent('a', 'a and b')
+        True
+        '''
+        if not isinstance(f, Expression):
+            f = self.parser.parse(f)
+        if not isinstance(g, Expression):
+            g = self.parser.parse(g)
+        a, b = self.aig.build(f), self.aig.build(g)
+        if a == b:
+            return True
+        differ = self.aig.iff(a, b) ^ 1
+        clauses = [[self.atoms.to_int(literal) for literal in clause] for clause in self.aig.cnf(differ)]
+        return SatSolver(self.kb_ints() + clauses).solve() is None
+
+    def models(self, extra=None):
+        '''
+        Yields the models of the KB, or of the KB and the expression extra
+        (e.g. the negation of a query, to get counterexamples), one at a
+        time as dicts from atom name to truth value. They range over the
+        atoms of the KB and of extra, leaving out the auxiliary atoms of the
+        CNF encodings, and every assignment of those atoms that satisfies
+        everything comes out once (see SatSolver.models). The KB may change
+        while a generator is running; it keeps enumerating the old one.
+        Example usage:
+
+        >>> kb.tell('a -> b')
+        >>> list(kb.models('~b'))
+        [{'a': False, 'b': False}]
+        '''
+        clauses, atoms = self.model_problem(extra)
+        for model in SatSolver(clauses).models(atoms):
+            yield dict(sorted((self.atoms.names[atom], value) for atom, value in model.items()))
+
+    def count_models(self, extra=None):
+        '''
+        Returns the number of models models() would yield, computed without
+        going through them (see Solvers.count_models).
+        Example usage:
+
+        >>> kb.tell('a -> b')
+        >>> kb.count_models(), kb.count_models('~b')
+        (3, 1)
+        '''
+        clauses, atoms = self.model_problem(extra)
+        return count_models(clauses, atoms)
+
+    def model_problem(self, extra):
+        ## the clauses of the KB and extra as lists of atom indices, and the
+        ## indices of the atoms the models range over
+        names = self.atom_names()
+        clauses = self.kb_ints()
+        if extra is not None:
+            if not isinstance(extra, Expression):
+                extra = self.parser.parse(extra)
+            self.collect_atoms(extra, names)
+            clauses += [[self.atoms.to_int(literal) for literal in clause]
+                        for clause in self.simplifier().iter_clauses(extra)]
+        atoms = [self.atoms.index(name) for name in names if not self.simplifier().is_auxiliary(name)]
+        return clauses, atoms
+
+    def atom_names(self):
+        ''' Returns the set of atom names used in the KB, kept by self.stats. '''
+        return set(self.stats.occurrences)
+
+    def collect_atoms(self, expression, atoms):
+        ''' Adds the atom names used in an expression to the set atoms. '''
+        if expression.op not in Logic.OPS and expression.op not in Logic.CONSTANTS:
+            atoms.add(expression.op)
+        for arg in expression.args:
+            self.collect_atoms(arg, atoms)
+
     def slow_ask(self, expression, verbose=False):
         '''
         Asks the KB whether its current knowledge entails the expression.
         Uses a slow, brute-force resolution algorithm as described in
-        Russell & Norvig.
+        Russell & Norvig. Like refute(), it keeps at most max_derived
+        derived clauses and returns None if it had to drop some and then
+        found nothing more.
         '''
+        self.peak_derived = 0
         new_expr = None
         if isinstance(expression, Expression):
             new_expr = expression
         else:
             new_expr = self.parser.parse(expression)
         ## create newKB = KB && ~expression
-        new_expr = LogicSimplifier().to_cnf(Logic.negate(new_expr))
+        new_expr = self.simplifier().to_cnf(Logic.negate(new_expr))
         assert new_expr.op == 'and'
         new_expr_clauses = self.clauses_to_sets(new_expr.args)
-        newKB = self.KB[:]
+        newKB = self.projected_clauses()[:]
         newKB.extend(new_expr_clauses)
+        if set() in newKB:
+            return True
+        ## resolvents of two clauses that do not descend from the query are
+        ## worth keeping as lemmas for later queries
+        kb_only = set(frozenset(clause) for clause in self.projected_clauses())
+        seen = set(frozenset(clause) for clause in newKB)
+        base = len(newKB)
+        ## the dropped clauses (frozensets), never derived again
+        pruned = set()
+        activity = {}
         ## we now have a new knowledge base containing (KB && ~a), where ~a
         ## is the inquiry, in CNF form. Perform the actual resolution step.
         while True:
-            new_clauses = []
+            ## the new clauses of this iteration, keeping only one copy of
+            ## each; re-adding known clauses makes newKB grow without bound
+            fresh = []
+            reduced = False
             ## iterate over all pairs of clauses
             if verbose: print('--New Iteration--')
             if verbose: print('Clauses:', newKB)
@@ -179,11 +1111,37 @@ class KnowledgeBase:
                     if set() in resolvents:
                         if verbose: print("Empty clause present in resolvents. Done.")
                         return True
-                    new_clauses.extend(resolvents)
-            ## check if any new clauses were added
-            ## the next line checks if new_clauses is a subset of newKB
-            if all([(c in newKB) for c in new_clauses]):
+                    if resolvents:
+                        activity[id(c1)] = activity.get(id(c1), 0) + 1
+                        activity[id(c2)] = activity.get(id(c2), 0) + 1
+                    if resolvents and frozenset(c1) in kb_only and frozenset(c2) in kb_only:
+                        for clause in resolvents:
+                            kb_only.add(frozenset(clause))
+                            self.learn(clause, frozenset())
+                    for c in resolvents:
+                        key = frozenset(c)
+                        if key not in seen and key not in pruned:
+                            seen.add(key)
+                            fresh.append(c)
+                derived = len(newKB) - base + len(fresh)
+                self.peak_derived = max(self.peak_derived, derived)
+                if derived > self.max_derived:
+                    if verbose: print("Too many derived clauses, dropping the weakest.")
+                    kept, dropped = self.reduce(newKB[base:] + fresh, activity, kb_only)
+                    for c in dropped:
+                        key = frozenset(c)
+                        pruned.add(key)
+                        seen.discard(key)
+                        kb_only.discard(key)
+                    newKB[base:] = kept
+                    activity = dict((id(c), activity.get(id(c), 0)) for c in kept)
+                    reduced = True
+                    break
+            if reduced:
+                continue
+            if fresh == []:
                 if verbose: print ("No new clauses added this iteration. Done.")
-                return False
-            newKB.extend(new_clauses)
+                ## without the dropped clauses that proves nothing
+                return None if pruned else False
+            newKB.extend(fresh)
         return newKB
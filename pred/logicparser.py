@@ -1,10 +1,20 @@
 import re
 from LogicTokenizer import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class Logic:
-    OPS = ['not', 'and', 'or', 'implies', 'iff']
     BINARY = ['and', 'or', 'implies', 'iff']
     UNARY = ['not']
+    ## atmost(k, ...), atleast(k, ...), exactly(k, ...): how many of the
+    ## arguments are true; see CardinalityExpression
+    CARDINALITY = ['atmost', 'atleast', 'exactly']
+    OPS = UNARY + BINARY + CARDINALITY
+    ## the constants are written like variables, e.g. "a or True"
+    CONSTANTS = ['True', 'False']
     Precedence = {'not' : 5,
                   'and' : 4,
                   'or' : 3,
@@ -38,7 +48,10 @@ class Expression:
     def __init__(self, op, *args):
         self.op = op
         self.args = args
-        
+        ## expressions are never changed after construction, so the hash is
+        ## computed once, on first use
+        self.hash = None
+
     def __repr__(self):
         if len(self.args) == 0:
             # constant or operator with no arguments (e.g. 'F' or 'and')
@@ -54,15 +67,124 @@ class Expression:
             return '(%s)' % (' '+self.op+' ').join(map(repr, self.args))
 
     def __eq__(self, other):
-        return (other is self) or (isinstance(other, Expression)
-                                   and self.op == other.op
-                                   and self.args == other.args)
+        if other is self:
+            return True
+        if not isinstance(other, Expression) or self.op != other.op:
+            return False
+        if self.hash is not None and other.hash is not None and self.hash != other.hash:
+            return False
+        return self.args == other.args
 
     def __ne__(self, other):
         return not (self == other)
 
     def __hash__(self):
-        return hash(self.op) ^ hash(self.args)
+        if self.hash is None:
+            self.hash = hash(self.op) ^ hash(self.args)
+        return self.hash
+
+    def __getstate__(self):
+        ## string hashes differ between interpreters, so the cached hash is
+        ## not pickled
+        return (self.op, self.args)
+
+    def __setstate__(self, state):
+        self.op, self.args = state
+        self.hash = None
+
+    def compile(self, atoms=None, batch=False):
+        '''
+        Compiles the expression into a Python function for fast repeated
+        evaluation. The function takes a row of truth values indexed by atom
+        number - 1 (column i is atom i + 1 of the AtomIndex atoms; atoms not
+        in it yet are added) and returns True or False.
+
+        The generated code is straight-line: every distinct subexpression is
+        computed once into a local variable, with no recursion or tree
+        walking at call time. With batch=True the function instead takes a
+        NumPy boolean matrix (rows x atoms) and returns a boolean vector with
+        one result per row, using vectorized logical operations. The
+        generated source is kept in the function's source attribute.
+        Example usage:
+
+        >>> atoms = AtomIndex()
+        >>> f = LogicParser().parse('a -> (b and ~c)').compile(atoms)
+        >>> f([True, True, False]), f([True, False, False])
+        (True, False)
+        >>> g = LogicParser().parse('a -> (b and ~c)').compile(atoms, batch=True)
+        >>> g(np.array([[1, 1, 0], [1, 0, 0]], dtype=bool))
+        array([ True, False])
+        '''
+        if batch and np is None:
+            raise Exception("Error: batch evaluation requires numpy")
+        if atoms is None:
+            atoms = AtomIndex()
+        lines = []
+        names = {}
+        ## iterative post-order walk, so deep expressions do not hit the
+        ## recursion limit
+        stack = [(self, False)]
+        visited = set()
+        while stack:
+            expr, expanded = stack.pop()
+            if expr.op in Logic.OPS and not expanded:
+                ## hashing is only cheap once the arguments are hashed, so
+                ## the node is looked up after its arguments
+                if id(expr) not in visited:
+                    visited.add(id(expr))
+                    stack.append((expr, True))
+                    stack.extend((arg, False) for arg in reversed(expr.args))
+                continue
+            if expr in names:
+                continue
+            args = [names[arg] for arg in expr.args]
+            if expr.op in Logic.CONSTANTS:
+                code = expr.op
+                if batch:
+                    code = 'np.full(len(m), %s)' % expr.op
+            elif expr.op not in Logic.OPS:
+                column = atoms.index(expr.op) - 1
+                code = ('m[:, %d]' if batch else 'r[%d]') % column
+            elif expr.op == 'not':
+                code = ('~%s' if batch else 'not %s') % args[0]
+            elif expr.op == 'implies':
+                code = ('~%s | %s' if batch else 'not %s or %s') % tuple(args)
+            elif expr.op == 'iff':
+                code = ('%s == %s' if batch else '(not %s) == (not %s)') % tuple(args)
+            elif expr.op in Logic.CARDINALITY:
+                ## count the true arguments
+                if batch:
+                    count = 'np.sum([%s], axis=0)' % ', '.join(args) if args else 'np.zeros(len(m))'
+                else:
+                    count = 'sum([%s])' % ', '.join('bool(%s)' % arg for arg in args)
+                comparison = {'atmost': '<=', 'atleast': '>=', 'exactly': '=='}[expr.op]
+                code = '%s %s %d' % (count, comparison, expr.k)
+            elif args == []:
+                ## an empty and is True, an empty or False
+                code = 'True' if expr.op == 'and' else 'False'
+                if batch:
+                    code = 'np.full(len(m), %s)' % code
+            else:
+                if batch:
+                    code = (' & ' if expr.op == 'and' else ' | ').join(args)
+                else:
+                    code = (' %s ' % expr.op).join(args)
+            names[expr] = 't%d' % len(names)
+            lines.append('    %s = %s' % (names[expr], code))
+        result = names[self]
+        if batch:
+            lines.insert(0, '    m = np.asarray(m, dtype=bool)')
+            ## never hand out a view of the input matrix
+            lines.append('    return np.array(%s, dtype=bool)' % result)
+            source = 'def evaluate(m):\n' + '\n'.join(lines) + '\n'
+        else:
+            lines.append('    return bool(%s)' % result)
+            source = 'def evaluate(r):\n' + '\n'.join(lines) + '\n'
+        namespace = {'np': np}
+        exec(source, namespace)
+        function = namespace['evaluate']
+        function.source = source
+        return function
 
     def print_detailed(self):
         print(self.detail_string())
@@ -88,6 +210,62 @@ class Expression:
             raise Exception("Cannot apply a unary operator to more than one argument")
         return Expression(self.op, *args)
 
+class CardinalityExpression(Expression):
+    '''
+    A cardinality constraint: atmost(k, ...) is true if at most k of its
+    arguments are true, atleast(k, ...) if at least k are, and
+    exactly(k, ...) if exactly k are. The bound is kept in k, so args are
+    only the formulas being counted.
+    Example usage:
+
+    >>> e = LogicParser().parse('exactly(1, a, b, c)')
+    >>> e.op, e.k, e.args
+    ('exactly', 1, (a, b, c))
+    '''
+    def __init__(self, op, k, *args):
+        if op not in Logic.CARDINALITY:
+            raise Exception("Error: not a cardinality operator: %s" % op)
+        Expression.__init__(self, op, *args)
+        self.k = k
+
+    def __repr__(self):
+        return '%s(%s)' % (self.op, ', '.join([str(self.k)] + [repr(arg) for arg in self.args]))
+
+    def __eq__(self, other):
+        return Expression.__eq__(self, other) and self.k == getattr(other, 'k', None)
+
+    def __hash__(self):
+        if self.hash is None:
+            self.hash = hash(self.op) ^ hash(self.k) ^ hash(self.args)
+        return self.hash
+
+    def __getstate__(self):
+        return (self.op, self.k, self.args)
+
+    def __setstate__(self, state):
+        self.op, self.k, self.args = state
+        self.hash = None
+
+    def detail_string(self):
+        return '%s(%s)' % (self.op, ', '.join([str(self.k)] + [arg.detail_string() for arg in self.args]))
+
+def cardinality_value(op, k, least, true, false, negate, conjoin):
+    '''
+    The value of a cardinality constraint with bound k, for evaluators that
+    count the true arguments in their own representation (BDDs, bit
+    planes): least[j] must say that at least j arguments are true, for j up
+    to k + 1, and true, false, negate and conjoin work on the same values.
+    '''
+    def at_least(j):
+        if j <= 0:
+            return true
+        return least[j] if j < len(least) else false
+    if op == 'atleast':
+        return at_least(k)
+    if op == 'atmost':
+        return negate(at_least(k + 1))
+    return conjoin(at_least(k), negate(at_least(k + 1)))
+
 class LogicParser:
     def token(self, destructive=1):
         ''' Retrieves the next token from the input string (after
@@ -115,6 +293,7 @@ class LogicParser:
         RPN = []
         op_stack = []
 
+        previous = None
         token = self.token()
         while token != None:
             #print('RPN = ', RPN, '; op stack = ', op_stack, sep='')
@@ -125,12 +304,36 @@ class LogicParser:
             elif token.type == 'rparen':
                 ## until we find the open paren, pop items off the stack
                 ## into the output string
-                while op_stack[-1].type != 'lparen':
+                while op_stack != [] and op_stack[-1].type != 'lparen':
                     RPN.append(op_stack.pop())
-                assert op_stack[-1].type == 'lparen'
+                if op_stack == []:
+                    raise Exception("String has mismatched parens")
                 op_stack.pop() # remove the lparen, discarding it
+                if op_stack != [] and op_stack[-1].type in Logic.CARDINALITY:
+                    ## the end of the argument list of a cardinality
+                    ## constraint; the constraint now follows its arguments
+                    if previous.type not in ['var', 'rparen']:
+                        ## an empty argument, as in atmost(1, )
+                        raise Exception("Error: malformed input string")
+                    op_stack[-1].arity += 1
+                    RPN.append(op_stack.pop())
+            elif token.type in Logic.CARDINALITY:
+                ## like a function call: the operator waits below its
+                ## parenthesis and counts the arguments separated by commas
+                if self.token(0) is None or self.token(0).type != 'lparen':
+                    raise Exception("Error: malformed input string")
+                token.arity = 0
+                op_stack.append(token)
+            elif token.type == 'comma':
+                if previous is None or previous.type not in ['var', 'rparen']:
+                    raise Exception("Error: malformed input string")
+                while op_stack != [] and op_stack[-1].type != 'lparen':
+                    RPN.append(op_stack.pop())
+                if len(op_stack) < 2 or op_stack[-2].type not in Logic.CARDINALITY:
+                    raise Exception("Error: malformed input string")
+                op_stack[-2].arity += 1
             elif token.type in Logic.OPS:
-                while (op_stack != [] and op_stack[-1].type in Logic.OPS and
+                while (op_stack != [] and op_stack[-1].type in Logic.Precedence and
                        ((Logic.Precedence[op_stack[-1].type] >= Logic.Precedence[token.type] and
                         op_stack[-1].type != 'not') or
                        (Logic.Precedence[op_stack[-1].type] > Logic.Precedence[token.type] and
@@ -147,6 +350,7 @@ class LogicParser:
                     RPN.append(op_stack.pop())
                 op_stack.append(token)
             ## read the next token
+            previous = token
             token = self.token()
         ## no more tokens to read here, push the rest onto our output stack
         while op_stack != []:
@@ -167,6 +371,16 @@ class LogicParser:
                 ## tok is a variable; convert it to an expression and place it
                 ## on the stack
                 eval_stack.append(Expression(tok.name))
+            elif tok.type in Logic.CARDINALITY:
+                ## the bound and the counted formulas are the last arity
+                ## entries of the stack; there is at least one formula
+                if len(eval_stack) < tok.arity or tok.arity < 2:
+                    raise Exception("Error: malformed input string")
+                args = eval_stack[len(eval_stack) - tok.arity:]
+                del eval_stack[len(eval_stack) - tok.arity:]
+                if args[0].args != () or not args[0].op.isdigit():
+                    raise Exception("Error: the bound of %s must be a number" % tok.type)
+                eval_stack.append(CardinalityExpression(tok.type, int(args[0].op), *args[1:]))
             elif tok.type in Logic.UNARY:
                 ## token is a unary operator. convert it to an expression
                 ## and apply it to the top of the stack
@@ -193,3 +407,77 @@ class LogicParser:
             raise Exception("Error: malformed input string")
         return eval_stack[0]
        
+
+class AtomIndex:
+    '''
+    A stable two-way mapping between atom names and positive integers, as
+    used by DIMACS files and the bit-level engines. Indices are handed out in
+    order of first use and never change afterwards.
+
+    Literal expressions are interned: literal(n) returns the same Expression
+    object for every occurrence of the (signed) index n, so clauses can be
+    built from integers without creating new Expressions.
+
+    >>> atoms = AtomIndex()
+    >>> atoms.index('a'), atoms.index('b'), atoms.index('a')
+    (1, 2, 1)
+    >>> atoms.literal(-2)
+    ~b
+    >>> atoms.to_int(LogicParser().parse('~a'))
+    -1
+    '''
+    def __init__(self):
+        self.indices = {}
+        self.names = {}
+        self.literals = {}
+        self.next_index = 1
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, name):
+        return name in self.indices
+
+    def index(self, name):
+        ''' Returns the index of an atom name, assigning a new one if needed. '''
+        if name not in self.indices:
+            self.assign(name, self.next_index)
+        return self.indices[name]
+
+    def assign(self, name, index):
+        ''' Binds name to a specific index, e.g. one read from a file. '''
+        if name in self.indices or index in self.names:
+            raise Exception("Error: atom %s or index %d is already mapped" % (name, index))
+        self.indices[name] = index
+        self.names[index] = name
+        self.next_index = max(self.next_index, index + 1)
+
+    def name(self, index, prefix='x'):
+        '''
+        Returns the atom name of an index. Unmapped indices get a fresh name
+        made from the prefix and the index, e.g. x12.
+        '''
+        if index not in self.names:
+            name = prefix + str(index)
+            while name in self.indices:
+                name += '_'
+            self.assign(name, index)
+        return self.names[index]
+
+    def literal(self, n, prefix='x'):
+        ''' Returns the interned literal Expression for a signed index. '''
+        if n not in self.literals:
+            if -n in self.literals:
+                ## share the atom with the opposite literal
+                other = self.literals[-n]
+                atom = other.args[0] if n > 0 else other
+            else:
+                atom = Expression(self.name(abs(n), prefix))
+            self.literals[n] = atom if n > 0 else Expression('not', atom)
+        return self.literals[n]
+
+    def to_int(self, literal):
+        ''' Converts a literal Expression (a or ~a) to a signed index. '''
+        if literal.op == 'not':
+            return -self.index(literal.args[0].op)
+        return self.index(literal.op)
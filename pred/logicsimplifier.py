@@ -1,28 +1,512 @@
 from LogicParser import *
+from SubformulaCache import *
 
 
+TRUE = Expression('True')
+FALSE = Expression('False')
+
 def FlattenedExpression(op, *args):
     '''
     A simple method to create an expression consisting of multiple
-    arguments one level deep.
+    arguments one level deep. The result is canonicalized, so it may also
+    come out as a single argument or a constant.
     '''
-    return LogicSimplifier().flatten(Expression(op, *args))
+    return LogicSimplifier().canonicalize(Expression(op, *args))
 
 class LogicSimplifier:
+    ## shared by all instances, since a new LogicSimplifier is created for
+    ## almost every call; see SubformulaCache
+    cache = SubformulaCache()
+    ## encoded cardinality constraint or defined subformula -> number used
+    ## in the names of its auxiliary atoms; the same constraint always gets
+    ## the same atoms (see cardinality_nnf). Auxiliary atoms are named $c1,
+    ## $c1_2, $x1, which the tokenizer never produces, so they cannot clash
+    ## with the user's atoms. A KnowledgeBase passes its own registry, and
+    ## its own cache, since cached conversions contain the names.
+    auxiliary = {}
+
+    def __init__(self, cache=None, auxiliary=None):
+        if cache is not None:
+            self.cache = cache
+        if auxiliary is not None:
+            self.auxiliary = auxiliary
+
     def to_cnf(self, s):
         assert isinstance(s, Expression)
+        if self.has_cardinality(s) or self.has_parity(s):
+            ## the step-by-step rewriting below only knows binary and/or, and
+            ## would expand an iff chain into exponentially many clauses;
+            ## cardinality and parity constraints are encoded on the NNF
+            ## route instead
+            clauses = [FALSE if clause == () else
+                       clause[0] if len(clause) == 1 else Expression('or', *clause)
+                       for clause in self.iter_clauses(s)]
+            return Expression('and', *clauses)
         new = self.eliminate_biconditionals(s)
         new = self.eliminate_implications(new)
         new = self.apply_demorgan(new)
+        new = self.canonicalize(new)
         new = self.distribute_or_over_and(new)
-        new = self.flatten(new)
+        new = self.canonicalize(new)
         ## handle all cases uniformly - everything should return a set of clauses
         ## ANDed together. If the input is a single variable, create
-        ## an expression and[s]
-        if new.op != 'and':
+        ## an expression and[s]. True has no clauses at all, and False is
+        ## the single empty clause.
+        if new == TRUE:
+            new = Expression('and')
+        elif new.op != 'and':
             new = Expression('and', new)
         return new
 
+    def to_nnf(self, s, positive=True):
+        '''
+        Converts an expression (or its negation, if positive is False) to
+        canonical negation normal form: only and, or and not applied to
+        atoms remain (see canonicalize). The result for every compound
+        subexpression is kept in the cache, so subformulas that occur again,
+        here or in a later call, are not converted twice.
+        '''
+        assert isinstance(s, Expression)
+        if s.op not in Logic.OPS:
+            if positive:
+                return s
+            if s.op in Logic.CONSTANTS:
+                return FALSE if s == TRUE else TRUE
+            return Expression('not', s)
+        if s.op == 'not':
+            return self.to_nnf(s.args[0], not positive)
+        key = ('nnf', positive, s)
+        new = self.cache.get(key)
+        if new is None:
+            new = self.nnf_node(s, positive)
+            ## the arguments are shared with other entries; only count the node
+            self.cache.put(key, new, 1 + len(new.args))
+        return new
+
+    def nnf_node(self, s, positive):
+        ''' to_nnf() for an and, or, implies, iff or cardinality node. '''
+        if s.op in Logic.CARDINALITY:
+            return self.cardinality_nnf(s, positive)
+        if s.op == 'iff':
+            row = self.parity(s)
+            if row is not None and len(row[0]) > 2:
+                names, parity = row
+                return self.parity_nnf(sorted(names), parity if positive else 1 - parity)
+        if s.op in ['and', 'or']:
+            op = s.op
+            if not positive:
+                op = 'or' if op == 'and' else 'and'
+            return self.combine(op, [self.to_nnf(arg, positive) for arg in s.args])
+        A, B = s.args
+        if s.op == 'implies':
+            ## A -> B is ~A or B; its negation is A and ~B
+            if positive:
+                return self.combine('or', [self.to_nnf(A, False), self.to_nnf(B, True)])
+            return self.combine('and', [self.to_nnf(A, True), self.to_nnf(B, False)])
+        ## A <-> B is (~A or B) and (~B or A); its negation is
+        ## (A and ~B) or (B and ~A)
+        if positive:
+            outer, inner = 'and', 'or'
+            not_a, b, not_b, a = (self.to_nnf(A, False), self.to_nnf(B, True),
+                                  self.to_nnf(B, False), self.to_nnf(A, True))
+        else:
+            outer, inner = 'or', 'and'
+            not_a, b, not_b, a = (self.to_nnf(A, True), self.to_nnf(B, False),
+                                  self.to_nnf(B, True), self.to_nnf(A, False))
+        return self.combine(outer, [self.combine(inner, [not_a, b]),
+                                    self.combine(inner, [not_b, a])])
+
+    def cardinality_nnf(self, s, positive):
+        '''
+        Encodes a cardinality constraint (or its negation) as a conjunction
+        of clauses of linear size, using auxiliary atoms: a sequential
+        counter for atmost (see atmost_clauses) and its dual for atleast
+        (see atleast_clauses), each O(n * k) clauses for n arguments and
+        bound k, where writing the constraint with and/or/not needs
+        O(n^k). The encoding has a model for every model of the
+        constraint, so entailment between formulas without auxiliary atoms
+        is unchanged.
+        Example usage:
+
+        >>> LogicSimplifier().to_nnf(LogicParser().parse('atmost(1, a, b, c)'))
+        (($c1_1 or ~a) and ($c1_2 or ~$c1_1) and ($c1_2 or ~b) and (~$c1_1 or ~b) and (~$c1_2 or ~c))
+        '''
+        n = len(s.args)
+        if s.op == 'exactly':
+            if positive:
+                return self.combine('and', [self.bound_nnf('atmost', s.k, s.args),
+                                            self.bound_nnf('atleast', s.k, s.args)])
+            ## fewer or more: (p or q), p -> atmost(k-1), q -> atleast(k+1),
+            ## which stays linear where distributing the or would not
+            fewer = self.bound_nnf('atmost', s.k - 1, s.args)
+            more = self.bound_nnf('atleast', s.k + 1, s.args)
+            p = self.auxiliary_atom(('fewer', s))
+            q = self.auxiliary_atom(('more', s))
+            return self.combine('and', [self.combine('or', [p, q]),
+                                        self.guard(Expression('not', p), fewer),
+                                        self.guard(Expression('not', q), more)])
+        if s.op == 'atmost':
+            op, k = ('atmost', s.k) if positive else ('atleast', s.k + 1)
+        else:
+            op, k = ('atleast', s.k) if positive else ('atmost', s.k - 1)
+        return self.bound_nnf(op, k, s.args)
+
+    def guard(self, literal, s):
+        ''' literal or s, for s in canonical CNF, clause by clause. '''
+        clauses = s.args if s.op == 'and' else (s,)
+        return self.combine('and', [self.combine('or', [literal, clause]) for clause in clauses])
+
+    def bound_nnf(self, op, k, args):
+        '''
+        atmost(k, args) or atleast(k, args) as canonical CNF. Arguments that
+        are not literals are replaced by auxiliary atoms first.
+        '''
+        literals = []
+        definitions = []
+        for arg in args:
+            new = self.to_nnf(arg)
+            if new == TRUE:
+                k -= 1
+            elif new == FALSE:
+                continue
+            elif new.op in ['and', 'or']:
+                ## counting for atmost needs arg -> d, for atleast d -> arg
+                d = self.auxiliary_atom(('define', op, new))
+                if op == 'atmost':
+                    definitions.append(self.combine('or', [self.to_nnf(arg, False), d]))
+                else:
+                    definitions.append(self.combine('or', [Expression('not', d), new]))
+                literals.append(d)
+            else:
+                literals.append(new)
+        n = len(literals)
+        if op == 'atleast' and k > n - k:
+            ## at least k true is at most n - k false; whichever bound is
+            ## smaller gives the smaller counter
+            op, k, literals = 'atmost', n - k, [self.to_nnf(l, False) for l in literals]
+        if op == 'atmost':
+            clauses = self.atmost_clauses(k, literals)
+        else:
+            clauses = self.atleast_clauses(k, literals)
+        return self.combine('and', definitions + clauses)
+
+    def auxiliary_number(self, key):
+        ''' The number in the names of the auxiliary atoms for key, given out in order of first use. '''
+        if key not in self.auxiliary:
+            self.auxiliary[key] = len(self.auxiliary) + 1
+        return self.auxiliary[key]
+
+    def auxiliary_atom(self, key):
+        return Expression('$c%d' % self.auxiliary_number(key))
+
+    def is_auxiliary(self, name):
+        ''' True if an atom name is one made up by the encodings ($c1, $c1_2, $x1, AIG's $a1). '''
+        return name.startswith('$')
+
+    def atmost_clauses(self, k, literals):
+        '''
+        Sinz's sequential counter: s_i_j means at least j of the first i
+        literals are true, and is forced up by the literals; a literal
+        that would make the count exceed k contradicts s_(i-1)_k.
+        '''
+        n = len(literals)
+        if k < 0:
+            return [FALSE]
+        if k >= n:
+            return []
+        if k == 0:
+            return [self.to_nnf(l, False) for l in literals]
+        number = self.auxiliary_number(('atmost', k, tuple(literals)))
+        def counter(i, j):
+            ## the literal lists are one-based here
+            return Expression('$c%d_%d' % (number, (i - 1) * k + j))
+        clauses = []
+        for i in range(1, n + 1):
+            not_x = self.to_nnf(literals[i - 1], False)
+            if i < n:
+                clauses.append(self.combine('or', [not_x, counter(i, 1)]))
+            if i == 1:
+                continue
+            if i < n:
+                for j in range(1, k + 1):
+                    clauses.append(self.combine('or', [Expression('not', counter(i - 1, j)), counter(i, j)]))
+                    if j > 1:
+                        clauses.append(self.combine('or', [not_x, Expression('not', counter(i - 1, j - 1)),
+                                                           counter(i, j)]))
+            clauses.append(self.combine('or', [not_x, Expression('not', counter(i - 1, k))]))
+        return clauses
+
+    def atleast_clauses(self, k, literals):
+        '''
+        The dual counter: r_i_j means at least j of the first i literals
+        are true, and only holds if the literals support it: r_i_j needs
+        r_(i-1)_j, or literal i together with r_(i-1)_(j-1). r_n_k is
+        required.
+        '''
+        n = len(literals)
+        if k <= 0:
+            return []
+        if k > n:
+            return [FALSE]
+        if k == 1:
+            return [self.combine('or', literals)]
+        number = self.auxiliary_number(('atleast', k, tuple(literals)))
+        def counter(i, j):
+            if j <= 0:
+                return TRUE
+            if j > i:
+                return FALSE
+            return Expression('$c%d_%d' % (number, (i - 1) * k + j))
+        clauses = [counter(n, k)]
+        for i in range(n, 0, -1):
+            ## only counts that can still reach k by the end are needed
+            for j in range(max(1, k - (n - i)), min(i, k) + 1):
+                r = Expression('not', counter(i, j))
+                clauses.append(self.combine('or', [r, counter(i - 1, j), literals[i - 1]]))
+                clauses.append(self.combine('or', [r, counter(i - 1, j), counter(i - 1, j - 1)]))
+        return clauses
+
+    def parity(self, s):
+        '''
+        If s is built from atoms, True/False, not and iff only, it is a
+        parity (XOR) constraint: returns (atom names, parity) such that s
+        holds exactly when the number of true atoms among the names has that
+        parity (1 odd, 0 even). Otherwise returns None.
+        Example usage:
+
+        >>> LogicSimplifier().parity(LogicParser().parse('a <-> (b <-> ~c)'))
+        (frozenset({'a', 'b', 'c'}), 0)
+        '''
+        if s.op in Logic.CONSTANTS:
+            ## the XOR of no atoms is 0
+            return frozenset(), 0 if s == TRUE else 1
+        if s.op not in Logic.OPS:
+            return frozenset([s.op]), 1
+        if s.op not in ['not', 'iff']:
+            return None
+        key = ('parity', s)
+        row = self.cache.get(key)
+        if row is None:
+            rows = [self.parity(arg) for arg in s.args]
+            if None in rows:
+                row = False
+            elif s.op == 'not':
+                row = (rows[0][0], 1 - rows[0][1])
+            else:
+                ## A <-> B holds when both equations hold or both fail,
+                ## i.e. when their XORs added up have the parities added up
+                row = (rows[0][0] ^ rows[1][0], rows[0][1] ^ rows[1][1])
+            self.cache.put(key, row, 1)
+        return row if row is not False else None
+
+    def parity_nnf(self, names, parity):
+        '''
+        Encodes "the XOR of the atoms names is parity" in CNF of linear size:
+        auxiliary atoms $xN stand for the XOR of the first i atoms (the same
+        prefix always gets the same atom), each defined by four clauses,
+        where the plain CNF of the constraint has 2^(n-1) clauses.
+        '''
+        def xor_clauses(t, a, b):
+            ## t <-> (a xor b), one clause against each of the four wrong
+            ## assignments; t may also be a constant
+            clauses = []
+            for signs in [(0, 1, 1), (0, 0, 0), (1, 0, 1), (1, 1, 0)]:
+                literals = [arg if sign else self.to_nnf(arg, False)
+                            for arg, sign in zip((t, a, b), signs)]
+                clauses.append(self.combine('or', literals))
+            return clauses
+        atoms = [Expression(name) for name in names]
+        clauses = []
+        prefix = atoms[0]
+        for i in range(1, len(atoms) - 1):
+            t = Expression('$x%d' % self.auxiliary_number(('xor', tuple(names[:i + 1]))))
+            clauses.extend(xor_clauses(t, prefix, atoms[i]))
+            prefix = t
+        clauses.extend(xor_clauses(TRUE if parity else FALSE, prefix, atoms[-1]))
+        return self.combine('and', clauses)
+
+    def has_cardinality(self, s):
+        stack = [s]
+        while stack:
+            s = stack.pop()
+            if s.op in Logic.CARDINALITY:
+                return True
+            stack.extend(s.args)
+        return False
+
+    def has_parity(self, s):
+        ''' True if s has an iff chain that to_nnf() encodes with parity_nnf(). '''
+        stack = [s]
+        while stack:
+            s = stack.pop()
+            if s.op == 'iff':
+                row = self.parity(s)
+                if row is not None and len(row[0]) > 2:
+                    return True
+            stack.extend(s.args)
+        return False
+
+    def iter_clauses(self, s):
+        '''
+        Generates the clauses of the CNF of an expression one at a time, as
+        tuples of literals, without building the distributed and(...) tree
+        that to_cnf returns. A disjunction yields the cross product of its
+        children's clauses; the children are walked again for every
+        combination rather than stored, so memory stays proportional to the
+        depth of the expression instead of the size of its CNF. Tautologies
+        are skipped.
+        Example usage:
+
+        >>> list(LogicSimplifier().iter_clauses(LogicParser().parse('a or (b and c)')))
+        [(b, a), (c, a)]
+        '''
+        return self.nnf_clauses(self.to_nnf(s))
+
+    def nnf_clauses(self, s):
+        '''
+        iter_clauses() for an expression already in canonical NNF. The
+        clauses of a compound subexpression are cached once they have all
+        been generated, unless there are more than the cache accepts.
+        '''
+        if s == TRUE:
+            return
+        if s == FALSE:
+            yield ()
+            return
+        if s.op not in ['and', 'or']:
+            yield (s,)
+            return
+        key = ('clauses', s)
+        cached = self.cache.get(key)
+        if cached is not None:
+            for clause in cached:
+                yield clause
+            return
+        clauses = []
+        size = 0
+        if s.op == 'and':
+            generated = (clause for arg in s.args for clause in self.nnf_clauses(arg))
+        else:
+            generated = self.product_clauses(s.args, ())
+        for clause in generated:
+            if clauses is not None:
+                clauses.append(clause)
+                size += 1 + len(clause)
+                if size > self.cache.max_entry:
+                    clauses = None
+            yield clause
+        if clauses is not None:
+            self.cache.put(key, tuple(clauses), size)
+
+    def product_clauses(self, args, prefix):
+        '''
+        Yields prefix extended by one clause of every expression in args, in
+        all combinations, dropping repeated literals and tautologies.
+        '''
+        if len(args) == 0:
+            yield prefix
+            return
+        for clause in self.nnf_clauses(args[0]):
+            extended = prefix
+            for literal in clause:
+                if literal in extended:
+                    continue
+                negated = literal.args[0] if literal.op == 'not' else Expression('not', literal)
+                if negated in extended:
+                    ## every clause built on this prefix is a tautology
+                    extended = None
+                    break
+                extended = extended + (literal,)
+            if extended is not None:
+                for result in self.product_clauses(args[1:], extended):
+                    yield result
+
+    def canonicalize(self, s):
+        '''
+        Simplifies an expression in negation normal form (only and, or and
+        not applied to atoms, as left by apply_demorgan) into a canonical
+        form, bottom-up:
+        - nested and/or are flattened into one n-ary node;
+        - repeated arguments are removed and the rest sorted, so equivalent
+          orderings give equal expressions;
+        - True/False are folded away, as are x or ~x (True) and
+          x and ~x (False);
+        - absorption: a or (a and b) becomes a, a and (a or b) becomes a.
+        Example usage:
+
+        >>> e = LogicParser().parse('(b or a) and (a or b or a) and (c or ~c)')
+        >>> LogicSimplifier().canonicalize(LogicSimplifier().apply_demorgan(e))
+        (a or b)
+        '''
+        assert isinstance(s, Expression)
+        if s.op == 'not':
+            inner = s.args[0]
+            if inner == TRUE:
+                return FALSE
+            if inner == FALSE:
+                return TRUE
+            if inner.op == 'not':
+                return self.canonicalize(inner.args[0])
+            return s
+        if s.op not in ['and', 'or']:
+            return s
+        return self.combine(s.op, [self.canonicalize(arg) for arg in s.args])
+
+    def combine(self, op, args):
+        '''
+        Returns the canonical form of op ('and' or 'or') applied to args,
+        which must already be canonical; only the top level is simplified.
+        '''
+        if op == 'and':
+            neutral, absorbing, dual = TRUE, FALSE, 'or'
+        else:
+            neutral, absorbing, dual = FALSE, TRUE, 'and'
+        new_args = []
+        seen = set()
+        for arg in args:
+            ## children are canonical, so one level of flattening is enough
+            nested = arg.args if arg.op == op else (arg,)
+            for a in nested:
+                if a == absorbing:
+                    return absorbing
+                if a == neutral or a in seen:
+                    continue
+                seen.add(a)
+                new_args.append(a)
+        for a in new_args:
+            if a.op == 'not' and a.args[0] in seen:
+                ## x and ~x, or x or ~x
+                return absorbing
+        ## absorption: drop (a dual b) if a is also an argument here
+        new_args = [a for a in new_args if a.op != dual or not any(b in seen for b in a.args)]
+        if new_args == []:
+            return neutral
+        if len(new_args) == 1:
+            return new_args[0]
+        new_args.sort(key=repr)
+        return Expression(op, *new_args)
+
+    def to_dimacs(self, s, atoms=None):
+        '''
+        Converts an expression to CNF and returns its clauses as tuples of
+        signed atom indices, DIMACS style, together with the AtomIndex used.
+        Passing the same AtomIndex to several calls keeps the numbering
+        stable between them.
+        Example usage:
+
+        >>> LogicSimplifier().to_dimacs(LogicParser().parse('a -> (b and c)'))
+        ([(1, -2), (3, -2)], <AtomIndex>)
+        '''
+        if atoms is None:
+            atoms = AtomIndex()
+        clauses = []
+        for clause in self.to_cnf(s).args:
+            if clause.op == 'or':
+                clauses.append(tuple(atoms.to_int(literal) for literal in clause.args))
+            else:
+                clauses.append((atoms.to_int(clause),))
+        return clauses, atoms
+
     def eliminate_biconditionals(self, s):
         '''Recursively searches the expression for <->, replacing every instance:
         A <-> B becomes (A -> B) and (B -> A)'''
@@ -124,25 +608,18 @@ class LogicSimplifier:
         CAUTION: Most algorithms in this code do NOT work with a flattened
         logic structure; they break if any expression contains more than two
         arguments. Use this only before distribute_or_over_and, which requires it
+
+        Returns a new expression and leaves s untouched.
         '''
         assert isinstance(s, Expression)
-        if s.op == 'and':
-            args = list(s.args)
-            for nested in s.args:
-                if nested.op == 'and':
-                    args.extend(list(nested.args))
-                    args.remove(nested)
-                    s.args = tuple(args)
-        elif s.op == 'or':
-            args = list(s.args)
-            for nested in s.args:
-                if nested.op == 'or':
-                    args.extend(list(nested.args))
-                    args.remove(nested)
-                    s.args = tuple(args)
+        args = []
         for arg in s.args:
-            self.flatten(arg)
-        return s
+            arg = self.flatten(arg)
+            if arg.op == s.op and s.op in ['and', 'or']:
+                args.extend(arg.args)
+            else:
+                args.append(arg)
+        return Expression(s.op, *args)
 
     def distribute_or_over_and(self, s):
         '''
@@ -155,7 +632,7 @@ class LogicSimplifier:
         (a or b) and (a or c)
         '''
         assert isinstance(s, Expression)
-        self.flatten(s)
+        s = self.flatten(s)
         if s.op == 'or':
             if len(s.args) == 1:
                 return self.distribute_or_over_and(s.args[0])
@@ -0,0 +1,309 @@
+from KnowledgeBase import *
+import io
+
+## Checks of KnowledgeBase features that tests.txt cannot express: each
+## section sets up its own KB and checks the answers of the engines
+## involved against a plain ask().
+
+print("Running portfolio on an inconsistent KB...  ", end='')
+kb = KnowledgeBase()
+for formula in ['a', '~a or c', '~c']:
+    kb.tell(formula)
+## an inconsistent KB entails everything, also when the set of support
+## engines are raced
+assert kb.ask('b') == True
+assert kb.ask('b', engine='portfolio') == True
+assert kb.ask('b', engine='portfolio', timeout=30) == True
+assert kb.portfolio_ask('b', engines=['resolution', 'masks']) == True
+kb.unlearn('~c')
+assert kb.ask('b', engine='portfolio', timeout=30) == False
+assert kb.ask('c', engine='portfolio', timeout=30) == True
+print("Passed.")
+
+print("Running the matrix engine on sparse DIMACS numbers...  ", end='')
+kb = KnowledgeBase()
+## only atoms 5 and 7 exist, so columns 4 and 6 are beyond the atom count
+kb.read_dimacs(io.StringIO('p cnf 10 2\n5 -7 0\n-5 0\n'))
+for engine in ['matrix', 'resolution', 'sat']:
+    if engine == 'matrix' and np is None:
+        continue
+    assert kb.ask('~x7', engine=engine) == True, engine
+    assert kb.ask('x7', engine=engine) == False, engine
+    assert kb.ask('~x7 and y', engine=engine) == False, engine
+print("Passed.")
+
+print("Running unlearn...  ", end='')
+kb = KnowledgeBase()
+kb.tell('a and b')
+## a is a clause of the formula above, but was never told on its own
+try:
+    kb.unlearn('a')
+    assert False, "unlearning a formula that was never told must raise"
+except Exception as e:
+    assert 'Error' in str(e), e
+assert kb.ask('a') == True
+## shared clauses stay until every formula that needs them is gone
+first = kb.tell('a -> c')
+second = kb.tell('a -> c')
+kb.tell('(a -> c) and d')
+kb.unlearn(first)
+kb.unlearn('(a -> c) and d')
+assert kb.ask('c') == True
+assert kb.ask('d') == False
+kb.unlearn(second)
+assert kb.ask('c') == False
+assert kb.ask('a and b') == True
+## a handle or a formula can only be taken back once
+for taken in [first, '(a -> c) and d']:
+    try:
+        kb.unlearn(taken)
+        assert False, "a second unlearn must raise"
+    except Exception as e:
+        assert 'Error' in str(e), e
+kb.unlearn('a and b')
+assert kb.ask('a') == False
+assert kb.KB == []
+print("Passed.")
+
+print("Running the AIG encoding...  ", end='')
+formulas = ['e', 'c', '~b', '~e <-> ~c', '(a and b) or (c and ~d)', 'a -> ~(d <-> e)']
+queries = ['(~d -> ~a) and (~d <-> c)', 'c and e', '~a', '~d', 'a or d', 'b']
+tree = KnowledgeBase()
+aig = KnowledgeBase(encoding='aig')
+for formula in formulas:
+    tree.tell(formula)
+    aig.tell(formula)
+assert any(aig.simplifier().is_auxiliary(name) for name in aig.atom_names())
+for query in queries:
+    expected = tree.ask(query)
+    for engine in ['resolution', 'saturation', 'masks', 'matrix', 'bdd', 'sat', 'auto']:
+        if engine == 'matrix' and np is None:
+            continue
+        assert aig.ask(query, engine=engine) == expected, (engine, query)
+## the saturation engines resolve the Tseitin atoms away first, so they
+## neither learn lemmas over them nor derive more than the tree encoding
+assert not any(aig.simplifier().is_auxiliary(name)
+               for lemma in aig.lemmas.clauses() for name in aig.stats.names(lemma))
+aig.ask(queries[0], engine='resolution')
+tree.ask(queries[0], engine='resolution')
+assert aig.peak_derived <= tree.peak_derived, (aig.peak_derived, tree.peak_derived)
+## a formula told in both encodings is stored once per encoding and taken
+## back with its own handle
+handle = aig.tell('d or f', encoding='tree')
+aig.tell('d or f')
+aig.unlearn(handle)
+assert aig.ask('d or f') == True
+aig.unlearn('d or f')
+assert aig.ask('d or f') == False
+print("Passed.")
+
+print("Running equivalent...  ", end='')
+kb = KnowledgeBase()
+assert kb.equivalent('(a and b) or c', 'c or (b and a)') == True
+assert kb.equivalent('a -> b', '~b -> ~a') == True
+assert kb.equivalent('a <-> ~b', '~(a <-> b)') == True
+assert kb.equivalent('a', 'a and b') == False
+kb.tell('a -> b')
+assert kb.equivalent('a', 'a and b') == True
+assert kb.equivalent('b', 'a or b') == True
+assert kb.equivalent('a', 'b') == False
+print("Passed.")
+
+print("Running the BDD's garbage collection...  ", end='')
+kb = KnowledgeBase()
+for i in range(30):
+    kb.tell('x%d -> (x%d or y%d)' % (i, i + 1, i))
+kb.compile()
+models = kb.compiled.count_models()
+size, nodes = len(kb.compiled), len(kb.compiled.nodes)
+## queries, with new atoms among them, leave no nodes behind
+for i in range(30):
+    for query in ['x%d -> (x30 or y%d or y29)' % (i, i), 'x%d -> x30' % i, 'z%d or ~z%d' % (i, i)]:
+        assert kb.ask(query, engine='bdd') == kb.ask(query, engine='sat'), query
+assert len(kb.compiled.nodes) == nodes
+assert kb.compiled.cache == {}
+assert kb.compiled.count_models() == models
+## collecting keeps the function of the root and drops everything else
+kb.compiled.collect()
+assert len(kb.compiled.nodes) == len(kb.compiled) == size
+assert kb.compiled.count_models() == models
+assert kb.ask('x0 -> (x30 or y0 or y1 or y2 or y3 or y4 or y5 or y6 or y7 or y8 or y9 or y10 or y11 or y12 or y13 or y14 or y15 or y16 or y17 or y18 or y19 or y20 or y21 or y22 or y23 or y24 or y25 or y26 or y27 or y28 or y29)', engine='bdd') == True
+## tells go on conjoining into the collected diagram
+kb.tell('x0')
+kb.tell('~x30')
+assert kb.ask('y0 or x1', engine='bdd') == True
+assert kb.ask('y29 or ~x29', engine='bdd') == True
+assert kb.ask('y0', engine='bdd') == False
+print("Passed.")
+
+print("Running the lemma store...  ", end='')
+parser = LogicParser()
+a, b, c, d = [parser.parse(name) for name in 'abcd']
+store = LemmaStore(capacity=3, max_length=2, decay=0.5)
+assert store.add({a}) and store.add({b, c}) and store.add({c, d})
+assert not store.add({a}) and not store.add({a, b, c})
+## with equal activity, the longest lemma goes first
+store.bump({a})
+store.bump({b, c})
+store.add({d})
+assert store.evictions == 1 and {c, d} not in store and len(store) == 3
+## a bump after a decay outweighs one before it: {a} and {b, c} had two
+## bumps' worth, {d} now has three
+store.decay()
+store.bump({d})
+store.add({b})
+assert {b, c} not in store and {a} in store and {d} in store
+store.forget(lambda lemma: lemma != frozenset([d]))
+assert store.clauses() == [{d}]
+## scores are rescaled before they overflow, keeping their order
+for i in range(400):
+    store.decay()
+assert store.increment < 1e100
+store.add({a})
+store.bump({a})
+store.add({b})
+store.add({c})
+assert {a} in store and {d} not in store and store.evictions == 3
+print("Passed.")
+
+print("Running lemmas and subsumption...  ", end='')
+kb = KnowledgeBase()
+for formula in ['a -> b', 'b -> c', 'c -> d', 'a or e']:
+    kb.tell(formula)
+for query in ['a -> d', 'e or d', 'e or c', 'a -> c', '~e -> d']:
+    assert kb.ask(query, engine='resolution') == True, query
+lemmas = [frozenset(lemma) for lemma in kb.lemmas.clauses()]
+stored = list(kb.stored) + lemmas
+for lemma in lemmas:
+    ## no lemma is implied by a KB clause or by another lemma
+    assert not any(other < lemma or (other == lemma and other in kb.stored) for other in stored), lemma
+## lemmas learned directly: {d, f, ~e} says less than the clause {~e, d},
+## {~a, d, f} less than the lemma {~a, d}, and {d} replaces the lemmas
+## with d
+kb.tell('~e or d')
+count = len(kb.lemmas)
+kb.learn({parser.parse('d'), parser.parse('f'), parser.parse('~e')}, frozenset())
+kb.learn({parser.parse('~a'), parser.parse('d'), parser.parse('f')}, frozenset())
+assert len(kb.lemmas) == count
+kb.learn({parser.parse('d')}, frozenset())
+assert {parser.parse('d')} in kb.lemmas
+assert not any(parser.parse('d') in lemma and len(lemma) > 1 for lemma in kb.lemmas.clauses())
+print("Passed.")
+
+print("Running plan...  ", end='')
+kb = KnowledgeBase()
+kb.tell('a or b or c')
+kb.tell('(a and b) or (c and d)')
+assert kb.plan('a or d')[0] == ('table' if np is not None else 'sat')
+## the atom count follows tells and unlearns, queries included
+wide = kb.tell(' or '.join('x%d' % i for i in range(12)))
+assert kb.atom_names() == set('abcd') | set('x%d' % i for i in range(12))
+assert kb.plan('a or d') == ('sat', 'no special structure, 16 atoms')
+kb.unlearn(wide)
+assert kb.atom_names() == set('abcd')
+assert kb.plan('a or d or e')[1].endswith(' 5 atoms')
+print("Passed.")
+
+print("Running parity queries...  ", end='')
+simplifier = LogicSimplifier()
+for n in [3, 12]:
+    chain = ' <-> '.join('x%d' % i for i in range(n))
+    regrouped = 'x0 <-> (' + ' <-> '.join('x%d' % i for i in range(1, n)) + ')'
+    ## the negated chain is encoded with four clauses per atom, not 2^(n-1)
+    assert len(simplifier.to_cnf(Logic.negate(parser.parse(chain))).args) <= 4 * n
+    kb = KnowledgeBase()
+    kb.tell(chain)
+    kb.tell('y')
+    engines = ['masks', 'sat', 'xor', 'bdd']
+    if n <= 3:
+        engines += ['resolution', 'saturation', 'matrix']
+    for engine in engines:
+        if engine == 'matrix' and np is None:
+            continue
+        assert kb.ask(chain, engine=engine) == True, (n, engine)
+        assert kb.ask(regrouped, engine=engine) == True, (n, engine)
+        assert kb.ask('~(' + chain + ')', engine=engine) == False, (n, engine)
+        assert kb.ask('(' + chain + ') and y', engine=engine) == True, (n, engine)
+print("Passed.")
+
+print("Running malformed cardinality constraints...  ", end='')
+for string in ['atmost(1)', 'atmost()', 'atmost(1, )', 'atmost(, a)', 'atmost(1, a,, b)',
+               'a atmost(1, b)', 'atmost(1, a) b', 'atmost(1, a and, b)', '(atmost)(1, a)',
+               'a and (atmost(1, a), b)', 'atmost(1, (a, b))', 'a, b', 'atmost(x, a)']:
+    try:
+        parser.parse(string)
+        assert False, "%s must not parse" % string
+    except Exception as e:
+        assert type(e) is Exception and str(e).startswith('Error'), (string, e)
+assert parser.parse('atmost (1, a, b <-> c) and b') == parser.parse('(atmost(1, a, (b <-> c))) and b')
+assert kb.ask('atleast(1, x0, y)') == True
+print("Passed.")
+
+print("Running the DIMACS round trip...  ", end='')
+def clause_set(kb):
+    return set(frozenset(str(literal) for literal in clause) for clause in kb.KB)
+## named atoms: write, read back into a new KB, same clauses and numbers
+kb = KnowledgeBase()
+for formula in ['a -> (b or c)', '~c or d', 'atmost(1, a, b, d)', 'e']:
+    kb.tell(formula)
+out = io.StringIO()
+kb.write_dimacs(out)
+copy = KnowledgeBase()
+assert copy.read_dimacs(io.StringIO(out.getvalue())) == len(kb.KB)
+assert clause_set(copy) == clause_set(kb)
+assert copy.atoms.names == kb.atoms.names
+for query in ['a -> ~b', 'a -> d or c', 'd', 'e or f']:
+    assert copy.ask(query) == kb.ask(query), query
+## sparse numbers: variables 3, 40 and 41 only, a clause over two lines and
+## an end marker; unnamed variables become x3, x40, x41
+source = 'c a comment\np cnf 50 3\n3 -40\n 41 0\n-3 0\n40 -41 0\n%\n0\n'
+kb = KnowledgeBase()
+assert kb.read_dimacs(io.StringIO(source)) == 3
+assert clause_set(kb) == set([frozenset(['x3', '~x40', 'x41']), frozenset(['~x3']),
+                              frozenset(['x40', '~x41'])])
+out = io.StringIO()
+kb.write_dimacs(out)
+lines = out.getvalue().splitlines()
+assert lines[0] == 'p cnf 41 3'
+assert sorted(lines[1:4]) == ['c atom 3 x3', 'c atom 40 x40', 'c atom 41 x41']
+copy = KnowledgeBase()
+copy.read_dimacs(io.StringIO(out.getvalue()))
+assert clause_set(copy) == clause_set(kb)
+assert copy.atoms.names == kb.atoms.names and copy.atoms.next_index == 42
+assert sorted(map(sorted, copy.kb_ints())) == sorted(map(sorted, kb.kb_ints()))
+assert copy.ask('~x40 or ~x41') == copy.ask('~x40 or ~x41', engine='matrix' if np is not None else 'sat') == False
+assert copy.ask('x40 or ~x41') == True
+## a second round gives the same file
+again = io.StringIO()
+copy.write_dimacs(again)
+assert sorted(again.getvalue().splitlines()) == sorted(lines)
+print("Passed.")
+
+print("Running the derived clause cap...  ", end='')
+kb = KnowledgeBase(max_derived=10)
+for i in range(8):
+    kb.tell('p%d -> (p%d or q%d)' % (i, i + 1, i))
+## past the cap the saturation engines drop clauses, and if they then
+## find nothing the answer is unknown, whether the query follows or not
+wide = 'p0 -> (p8 or ' + ' or '.join('q%d' % i for i in range(8)) + ')'
+for query, entailed in [('p0 -> p8', False), (wide, True)]:
+    for engine in ['resolution', 'saturation']:
+        assert kb.ask(query, engine=engine) is None, (query, engine)
+        assert kb.peak_derived > kb.max_derived
+    assert kb.ask(query, engine='sat') == kb.ask(query) == entailed
+## an answer found after dropping clauses still counts
+assert kb.ask('p0 -> p1 or q0', engine='saturation') == True
+assert kb.peak_derived > kb.max_derived
+## a portfolio takes the first engine that knows, and None if none does
+assert kb.ask(wide, engine='portfolio', timeout=30) == True
+assert kb.portfolio_ask(wide, engines=['resolution', 'saturation'], timeout=30) is None
+assert kb.last_winner[0] is None
+## a safe tell checks with a complete engine, whatever the cap
+kb.tell('p8 -> r', safe=True)
+kb.tell('p0 and q0 and ~r', safe=True)
+try:
+    kb.tell('~q0 and ~q1 and ~q2 and ~q3 and ~q4 and ~q5 and ~q6 and ~q7', safe=True)
+    assert False, "a safe tell must not make the KB inconsistent"
+except Exception as e:
+    assert str(e).startswith('Error: teaching'), e
+print("Passed.")
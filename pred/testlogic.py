@@ -1,10 +1,30 @@
 from KnowledgeBase import *
-from time import clock
+from time import perf_counter as clock
+
+## tests.txt holds blocks of
+##   KB:       formulas to tell, one per line
+##   ASSERT:   a formula the KB must entail
+##   DENY:     a formula the KB must not entail
+## Every ASSERT and DENY is checked with the naive algorithm and with every
+## engine of KnowledgeBase.ENGINES that applies to the KB and the query,
+## so the engines are also checked against each other.
+
+def applicable(kb, engine, line):
+    ''' False for engines that cannot run on this KB and query. '''
+    if engine in ['table', 'matrix'] and np is None:
+        return False
+    clauses = kb.kb_ints() + kb.query_ints(line)
+    if engine == 'horn':
+        return all(is_horn(clause) for clause in clauses)
+    if engine == '2sat':
+        return all(len(clause) <= 2 for clause in clauses)
+    return True
 
 f = open('tests.txt', 'r')
 testid = -1
 naive_times = []
 fast_times = []
+engine_times = dict((engine, []) for engine in KnowledgeBase.ENGINES)
 num_clauses = []
 kb = KnowledgeBase()
 line = f.readline()
@@ -15,20 +35,28 @@ while line != '':
         kb.clear()
         testid += 1
         print("Running test %d...  "%testid, end='')
-    elif line == 'ASSERT:':
+    elif line in ['ASSERT:', 'DENY:']:
+        expected = line == 'ASSERT:'
         num_clauses.append(len(kb.KB))
         line = f.readline().strip()
         #print(line)
         ## Check with the naive algorithm
         startTime = clock()
-        assert kb.slow_ask(line)
+        assert kb.slow_ask(line) == expected, (testid, 'saturation', line)
         naive_times.append(clock() - startTime)
-        ## Check with optimized algorithm
+        ## Check with the resolution algorithm the default used to be
         startTime = clock()
-        assert kb.ask(line)
+        assert kb.ask(line, engine='resolution') == expected, (testid, 'resolution', line)
         fast_times.append(clock() - startTime)
+        ## and with every other engine, including the automatic choice
+        for engine in list(KnowledgeBase.ENGINES) + ['auto']:
+            if engine in ['saturation', 'resolution'] or not applicable(kb, engine, line):
+                continue
+            startTime = clock()
+            assert kb.ask(line, engine=engine) == expected, (testid, engine, line)
+            if engine in engine_times:
+                engine_times[engine].append(clock() - startTime)
         print("Passed.")
     elif line != '':
         kb.tell(line)
     line = f.readline()
-        
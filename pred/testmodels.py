@@ -0,0 +1,78 @@
+from KnowledgeBase import *
+import itertools
+
+## For every KB of tests.txt, the models enumerated by models() and the
+## number given by count_models() are checked against all assignments of
+## the KB's atoms, each evaluated on the told formulas directly. Every
+## ASSERT must have no counterexample (a model of the KB and the negated
+## query) and every DENY at least one.
+
+def evaluate(s, model):
+    ''' The truth value of an Expression under a dict from atom name to value. '''
+    if s.op == 'True':
+        return True
+    if s.op == 'False':
+        return False
+    if s.op not in Logic.OPS:
+        return model.get(s.op, False)
+    args = [evaluate(arg, model) for arg in s.args]
+    if s.op == 'not':
+        return not args[0]
+    if s.op == 'and':
+        return all(args)
+    if s.op == 'or':
+        return any(args)
+    if s.op == 'implies':
+        return not args[0] or args[1]
+    if s.op == 'iff':
+        return args[0] == args[1]
+    count = sum(args)
+    if s.op == 'atmost':
+        return count <= s.k
+    if s.op == 'atleast':
+        return count >= s.k
+    return count == s.k
+
+def check(kb, formulas, queries):
+    names = sorted(name for name in kb.atom_names() if not kb.simplifier().is_auxiliary(name))
+    expected = []
+    for values in itertools.product([False, True], repeat=len(names)):
+        model = dict(zip(names, values))
+        if all(evaluate(formula, model) for formula in formulas):
+            expected.append(model)
+    models = [frozenset(model.items()) for model in kb.models()]
+    assert len(models) == len(set(models)), "a model came out twice"
+    assert set(models) == set(frozenset(model.items()) for model in expected)
+    assert kb.count_models() == len(expected), (kb.count_models(), len(expected))
+    for query, entailed in queries:
+        counterexamples = kb.count_models(Logic.negate(query))
+        assert (counterexamples == 0) == entailed, (query, counterexamples)
+        for model in kb.models(Logic.negate(query)):
+            assert not evaluate(query, model), (query, model)
+
+parser = LogicParser()
+f = open('tests.txt', 'r')
+blocks = []
+expecting = None
+for line in f:
+    line = line.strip()
+    if line == 'KB:':
+        ## told formulas, (query, entailed) pairs
+        blocks.append(([], []))
+    elif line in ['ASSERT:', 'DENY:']:
+        expecting = line == 'ASSERT:'
+    elif line != '':
+        if expecting is None:
+            blocks[-1][0].append(parser.parse(line))
+        else:
+            blocks[-1][1].append((parser.parse(line), expecting))
+            expecting = None
+f.close()
+kb = KnowledgeBase()
+for testid, (formulas, queries) in enumerate(blocks):
+    print("Running test %d...  "%testid, end='')
+    kb.clear()
+    for formula in formulas:
+        kb.tell(formula)
+    check(kb, formulas, queries)
+    print("Passed.")
@@ -0,0 +1,75 @@
+from KBServer import *
+import tempfile
+import threading
+
+## A round trip through KBServer and KBClient: a server runs in a thread
+## on a socket in a temporary directory, and every answer it gives must
+## match the one of a KnowledgeBase told the same formulas directly.
+
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, 'kb.sock')
+server = KBServer(path)
+thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+thread.start()
+client = KBClient(path, timeout=30)
+local = KnowledgeBase()
+
+print("Running tell and ask...  ", end='')
+for formula in ['a -> b', 'b -> c', 'atmost(1, c, d)']:
+    assert client.tell(formula, kb='rules') == local.tell(formula)
+for query in ['a -> c', 'c -> a', 'a -> ~d', 'd -> ~a']:
+    assert client.ask(query, kb='rules') == local.ask(query), query
+assert client.count_models(kb='rules') == local.count_models()
+assert client.count_models('~c', kb='rules') == local.count_models('~c')
+print("Passed.")
+
+print("Running unlearn...  ", end='')
+handle = client.tell('(a -> b) and e', kb='rules')
+local.tell('(a -> b) and e')
+client.unlearn('a -> b', kb='rules')
+local.unlearn('a -> b')
+assert client.ask('a -> c', kb='rules') == local.ask('a -> c') == True
+client.unlearn(handle, kb='rules')
+local.unlearn(handle)
+assert client.ask('a -> c', kb='rules') == local.ask('a -> c') == False
+print("Passed.")
+
+print("Running batch and pipeline...  ", end='')
+assert client.batch([['tell', 'other', 'p'], ['ask', 'other', 'p'], ['ask', 'rules', 'p']]) == [1, True, False]
+results = client.pipeline([[['ask', 'other', 'p or q']], [['ask', 'other', 'q']], [['names']]])
+assert results == [[True], [False], [['other', 'rules']]], results
+## the operations before a failing one still run, and the error is raised
+try:
+    client.batch([['tell', 'other', 'q'], ['ask', 'other', 'p and']])
+    assert False, "a malformed formula must raise"
+except Exception as e:
+    assert 'Error' in str(e), e
+assert client.ask('q', kb='other') == True
+print("Passed.")
+
+print("Running concurrent clients...  ", end='')
+answers = []
+def worker(number):
+    for i in range(20):
+        client.tell('x%d_%d -> x%d_%d' % (number, i, number, i + 1), kb='chain%d' % number)
+    answers.append(client.ask('x%d_0 -> x%d_20' % (number, number), kb='chain%d' % number))
+threads = [threading.Thread(target=worker, args=(number,)) for number in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+assert answers == [True] * 4, answers
+print("Passed.")
+
+print("Running clear, drop and shutdown...  ", end='')
+client.clear(kb='rules')
+assert client.ask('a -> b', kb='rules') == False
+client.drop(kb='other')
+assert 'other' not in client.names()
+client.shutdown()
+client.close()
+thread.join(10)
+assert not thread.is_alive()
+assert not os.path.exists(path)
+os.rmdir(directory)
+print("Passed.")
@@ -0,0 +1,84 @@
+from ShardedKnowledgeBase import *
+
+## The answers of a ShardedKnowledgeBase must be those of a plain
+## KnowledgeBase told the same formulas: first for every block of
+## tests.txt, then for a KB of several components spread over the shards,
+## which are merged, queried together and taken back.
+
+parser = LogicParser()
+f = open('tests.txt', 'r')
+blocks = []
+expecting = None
+for line in f:
+    line = line.strip()
+    if line == 'KB:':
+        ## told formulas, (query, entailed) pairs
+        blocks.append(([], []))
+    elif line in ['ASSERT:', 'DENY:']:
+        expecting = line == 'ASSERT:'
+    elif line != '':
+        if expecting is None:
+            blocks[-1][0].append(line)
+        else:
+            blocks[-1][1].append((line, expecting))
+            expecting = None
+f.close()
+
+sharded = ShardedKnowledgeBase(shards=3)
+kb = KnowledgeBase()
+for testid, (formulas, queries) in enumerate(blocks):
+    print("Running test %d...  "%testid, end='')
+    sharded.clear()
+    kb.clear()
+    for formula in formulas:
+        sharded.tell(formula)
+        kb.tell(formula)
+    assert len(sharded) == len(kb.KB), (testid, len(sharded), len(kb.KB))
+    for query, entailed in queries:
+        assert sharded.ask(query) == kb.ask(query) == entailed, (testid, query)
+    print("Passed.")
+
+print("Running components over several shards...  ", end='')
+sharded.clear()
+kb.clear()
+## four independent chains go to different shards
+chains = [['p%d_%d -> p%d_%d' % (n, i, n, i + 1) for i in range(4)] for n in range(4)]
+for chain in chains:
+    for formula in chain:
+        sharded.tell(formula)
+        kb.tell(formula)
+assert len(set(sharded.shard_of.values())) == 3
+queries = ['p0_0 -> p0_4', 'p1_0 -> p1_4', 'p0_0 -> p1_4', 'p3_4 -> p3_0',
+           '(p0_0 -> p0_4) and (p2_1 -> p2_3)', '(p0_0 -> p0_4) and (p2_3 -> p2_1)',
+           '(p0_0 and p1_0) -> (p0_4 or p3_2)', 'q or ~q', 'q']
+for query in queries:
+    assert sharded.ask(query) == kb.ask(query), query
+## a formula linking two chains merges their components, moving clauses
+## from one shard to the other
+shard = lambda atom: sharded.shard_of[sharded.find(atom)]
+assert shard('p0_0') != shard('p1_0') or shard('p2_0') != shard('p3_0')
+for formula in ['p0_4 -> p1_0', 'p2_4 <-> p3_0']:
+    sharded.tell(formula)
+    kb.tell(formula)
+for query in queries + ['p0_0 -> p1_4', 'p2_0 -> p3_4', 'p3_0 -> p2_4', 'p0_0 -> p2_4']:
+    assert sharded.ask(query) == kb.ask(query), query
+assert len(sharded) == len(kb.KB)
+assert sum(sharded.shard_load) == len(sharded)
+## taking back the link keeps the merged component but changes the answers
+sharded.unlearn('p0_4 -> p1_0')
+kb.unlearn('p0_4 -> p1_0')
+assert sharded.ask('p0_0 -> p1_4') == kb.ask('p0_0 -> p1_4') == False
+assert len(sharded) == len(kb.KB)
+## an inconsistent component makes every query entailed
+sharded.tell('p3_0 and ~p3_4')
+kb.tell('p3_0 and ~p3_4')
+assert sharded.ask('p0_0 -> p1_4') == kb.ask('p0_0 -> p1_4') == True
+sharded.unlearn('p3_0 and ~p3_4')
+kb.unlearn('p3_0 and ~p3_4')
+assert sharded.ask('p0_0 -> p1_4') == kb.ask('p0_0 -> p1_4') == False
+sharded.tell('False')
+assert sharded.ask('q') == True
+sharded.unlearn('False')
+assert sharded.ask('q') == False
+sharded.close()
+print("Passed.")
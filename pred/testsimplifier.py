@@ -0,0 +1,170 @@
+from LogicSimplifier import *
+import itertools
+import random
+
+## Checks of the conversions behind the KB: random formulas over a few
+## atoms are compared, under every assignment of the atoms, with a plain
+## recursive evaluation of the original.
+
+def evaluate(s, model):
+    ''' The truth value of an Expression under a dict from atom name to value. '''
+    if s.op in Logic.CONSTANTS:
+        return s.op == 'True'
+    if s.op not in Logic.OPS:
+        return model[s.op]
+    args = [evaluate(arg, model) for arg in s.args]
+    if s.op == 'not':
+        return not args[0]
+    if s.op == 'and':
+        return all(args)
+    if s.op == 'or':
+        return any(args)
+    if s.op == 'implies':
+        return not args[0] or args[1]
+    if s.op == 'iff':
+        return args[0] == args[1]
+    count = sum(args)
+    if s.op == 'atmost':
+        return count <= s.k
+    if s.op == 'atleast':
+        return count >= s.k
+    return count == s.k
+
+NAMES = ['a', 'b', 'c', 'd']
+MODELS = [dict(zip(NAMES, values)) for values in itertools.product([False, True], repeat=len(NAMES))]
+
+def random_nnf(depth):
+    ''' A random expression of and, or and negated atoms. '''
+    if depth == 0 or random.random() < 0.2:
+        choice = random.choice(NAMES + ['True', 'False'] if random.random() < 0.1 else NAMES)
+        atom = Expression(choice)
+        return Expression('not', atom) if choice in NAMES and random.random() < 0.4 else atom
+    return Expression(random.choice(['and', 'or']),
+                      *[random_nnf(depth - 1) for i in range(random.randint(2, 3))])
+
+def reorder(s):
+    '''
+    An equivalent expression written differently: arguments shuffled,
+    sometimes repeated, and n-ary nodes regrouped into nested ones.
+    '''
+    if s.op not in ['and', 'or']:
+        return s
+    args = [reorder(arg) for arg in s.args]
+    random.shuffle(args)
+    if random.random() < 0.3:
+        args.append(random.choice(args))
+    if len(args) > 2 and random.random() < 0.5:
+        return Expression(s.op, args[0], Expression(s.op, *args[1:]))
+    return Expression(s.op, *args)
+
+random.seed(7)
+simplifier = LogicSimplifier()
+
+print("Running canonicalize...  ", end='')
+for i in range(300):
+    s = random_nnf(3)
+    canonical = simplifier.canonicalize(s)
+    ## the same function, and already canonical
+    for model in MODELS:
+        assert evaluate(canonical, model) == evaluate(s, model), (s, canonical, model)
+    assert simplifier.canonicalize(canonical) == canonical, (s, canonical)
+    ## equivalent orderings and groupings meet in one form
+    for j in range(3):
+        assert simplifier.canonicalize(reorder(s)) == canonical, (s, canonical)
+for string, expected in [('(b or a) and (a or b or a) and (c or ~c)', 'a or b'),
+                         ('a or (a and b)', 'a'),
+                         ('a and (b or a) and c', 'a and c'),
+                         ('(a and ~a) or b', 'b'),
+                         ('~~a or False', 'a')]:
+    e = simplifier.apply_demorgan(LogicParser().parse(string))
+    assert simplifier.canonicalize(e) == simplifier.canonicalize(LogicParser().parse(expected)), string
+print("Passed.")
+
+print("Running the subformula cache...  ", end='')
+cache = SubformulaCache(capacity=3, max_size=10, max_entry=4)
+for key in 'abc':
+    cache.put(key, key.upper(), 1)
+## a lookup makes an entry the most recently used one
+assert cache.get('a') == 'A'
+cache.put('d', 'D', 1)
+assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+assert cache.evictions == 1
+## e and f each push out the least recently used entry, d then a
+cache.put('e', 'E', 4)
+cache.put('f', 'F', 4)
+assert list(cache.entries) == ['c', 'e', 'f'] and cache.size == 9
+## the total size is bounded too: h needs room beyond the one entry
+cache.put('h', 'H', 3)
+assert list(cache.entries) == ['f', 'h'] and cache.size == 7
+## too large to store at all; replacing an entry updates the size
+cache.put('g', 'G', 5)
+assert cache.get('g') is None and len(cache) == 2
+cache.put('f', 'F2', 2)
+assert cache.get('f') == 'F2' and cache.size == 5
+assert cache.stats() == {'entries': 2, 'size': 5, 'hits': 4, 'misses': 2, 'evictions': 5}
+cache.clear()
+assert len(cache) == 0 and cache.size == 0 and cache.hits == 4
+print("Passed.")
+
+print("Running cache hits across KB changes...  ", end='')
+from KnowledgeBase import *
+kb = KnowledgeBase()
+formula = '(a and (b or c)) <-> (d or (e and f))'
+kb.tell(formula)
+assert kb.subformulas.misses > 0 and len(kb.subformulas) > 0
+## new clauses and retractions (see KnowledgeBase.changed) keep the
+## conversions: telling the formula again converts nothing new
+handle = kb.tell('g or h')
+kb.unlearn(formula)
+kb.unlearn(handle)
+hits, misses = kb.subformulas.hits, kb.subformulas.misses
+kb.tell(formula)
+assert kb.subformulas.misses == misses and kb.subformulas.hits > hits
+assert kb.ask('(a and b) -> d or e', engine='resolution') == True
+## the cached conversions contain the KB's auxiliary atoms, so clear()
+## starts a new cache along with a new registry
+kb.tell('atmost(1, a, b, c)')
+old = kb.subformulas
+kb.clear()
+assert kb.subformulas is not old and len(kb.subformulas) == 0 and kb.auxiliary == {}
+kb.tell(formula)
+## a fresh cache: every entry came from a miss
+assert kb.subformulas.misses == len(kb.subformulas) > 0 and old.evictions == 0
+print("Passed.")
+
+print("Running compiled evaluation...  ", end='')
+def random_formula(depth):
+    ''' A random expression with every operator, cardinality included. '''
+    if depth == 0 or random.random() < 0.2:
+        return Expression(random.choice(NAMES + ['True'] if random.random() < 0.05 else NAMES))
+    op = random.choice(Logic.OPS)
+    if op == 'not':
+        return Expression('not', random_formula(depth - 1))
+    if op in Logic.BINARY:
+        arity = 2 if op in ['implies', 'iff'] else random.randint(2, 3)
+        return Expression(op, *[random_formula(depth - 1) for i in range(arity)])
+    args = [random_formula(depth - 1) for i in range(random.randint(1, 4))]
+    return CardinalityExpression(op, random.randint(0, len(args)), *args)
+
+atoms = AtomIndex()
+for name in NAMES:
+    atoms.index(name)
+rows = [[model[atoms.names[i + 1]] for i in range(len(NAMES))] for model in MODELS]
+for i in range(300):
+    s = random_formula(4)
+    ## shared subformulas are computed once
+    if random.random() < 0.3:
+        s = Expression('and', s, Expression('or', s, random_formula(1)))
+    expected = [evaluate(s, model) for model in MODELS]
+    f = s.compile(atoms)
+    assert [f(row) for row in rows] == expected, (s, f.source)
+    if np is not None:
+        g = s.compile(atoms, batch=True)
+        assert list(g(np.array(rows, dtype=bool))) == expected, (s, g.source)
+## atoms the index does not know yet get the next columns
+f = LogicParser().parse('e -> (a and ~f)').compile(atoms)
+assert atoms.index('e') == 5 and atoms.index('f') == 6
+assert f([True, False, False, False, True, False]) == True
+assert f([False, False, False, False, True, False]) == False
+assert f([True, False, False, False, False, True]) == True
+print("Passed.")
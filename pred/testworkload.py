@@ -0,0 +1,71 @@
+from Workload import *
+import io
+
+## Records a session with RecordingKnowledgeBase, replays the trace and
+## checks that the trace holds exactly the operations called and that the
+## replay gets the recorded answers. tests.txt, converted to a trace,
+## must replay without mismatches.
+
+print("Running record...  ", end='')
+trace = io.StringIO()
+kb = RecordingKnowledgeBase(trace)
+first = kb.tell('a -> b')
+kb.tell('b -> c', safe=True)
+kb.tell('(c and d) or e', encoding='aig')
+try:
+    kb.tell('a and ~c', safe=True)
+    assert False, "a contradiction must not be told"
+except Exception as e:
+    assert 'contradiction' in str(e), e
+assert kb.ask('a -> c') == True
+kb.unlearn(first)
+assert kb.ask('a -> c') == False
+try:
+    kb.unlearn('b')
+    assert False, "b was never told"
+except Exception as e:
+    assert 'Error' in str(e), e
+kb.unlearn('b -> c')
+kb.clear()
+kb.tell('f')
+kb.close()
+entries = list(read_trace(io.StringIO(trace.getvalue())))
+## the ask of the safe tells and the failed operations are not recorded
+assert [entry['op'] for entry in entries] == ['tell', 'tell', 'tell', 'ask', 'unlearn', 'ask',
+                                              'unlearn', 'clear', 'tell'], entries
+assert entries[1]['safe'] == True and entries[0]['safe'] == False
+assert entries[2]['encoding'] == 'aig' and entries[0]['encoding'] == 'tree'
+parser = LogicParser()
+assert entries[4]['handle'] == first
+assert parser.parse(entries[4]['expr']) == parser.parse('a -> b')
+assert 'handle' not in entries[6]
+assert all(entries[i]['t'] <= entries[i + 1]['t'] for i in range(len(entries) - 1))
+print("Passed.")
+
+print("Running replay...  ", end='')
+kb = KnowledgeBase()
+report = replay(io.StringIO(trace.getvalue()), kb, memory=False)
+assert report['ops'] == len(entries) and report['mismatches'] == 0, report
+assert report['latency']['tell']['count'] == 4
+assert kb.ask('f') == True and kb.ask('e or c') == False
+report = replay(io.StringIO(trace.getvalue()), engine='resolution')
+assert report['mismatches'] == 0 and report['peak_memory'] > 0, report
+## a wrong recorded answer is counted
+report = replay(io.StringIO('{"op": "tell", "expr": "a"}\n{"op": "ask", "expr": "a", "result": false}\n'),
+                memory=False)
+assert report['mismatches'] == 1
+print("Passed.")
+
+print("Running tests_to_trace...  ", end='')
+converted = io.StringIO()
+tests_to_trace('tests.txt', converted)
+entries = list(read_trace(io.StringIO(converted.getvalue())))
+f = open('tests.txt')
+lines = [line.strip() for line in f if line.strip() != '']
+f.close()
+assert sum(1 for entry in entries if entry['op'] == 'clear') == lines.count('KB:')
+assert sum(1 for entry in entries if entry['op'] == 'ask' and entry['result']) == lines.count('ASSERT:')
+assert sum(1 for entry in entries if entry['op'] == 'ask' and not entry['result']) == lines.count('DENY:')
+report = replay(io.StringIO(converted.getvalue()), engine='sat', memory=False)
+assert report['mismatches'] == 0, report
+print("Passed.")